@@ -1,24 +1,16 @@
 import streamlit as st
 import pandas as pd
-import unicodedata
 from io import BytesIO
 
+from saneamento.depara import DUPLICATE_POLICIES, depara_join
+from saneamento.readers import read_table
+
 st.set_page_config(
     page_title="Create Combined Depara",
     layout="wide",
     initial_sidebar_state="collapsed"
 )
 
-def normalize_text(text):
-    """Normalize text for matching: remove accents, uppercase and strip whitespace."""
-    if pd.isna(text):
-        return ""
-    s = str(text)
-    # Remove accents
-    s = unicodedata.normalize('NFKD', s)
-    s = ''.join(ch for ch in s if not unicodedata.combining(ch))
-    return s.strip().upper()
-
 st.title("📊 Create Combined Depara")
 st.markdown("Baseado no script `create_combined_depara.py`. Faça upload de `base_hcm` e `base_rhc` para gerar `resultado_de_para.xlsx`")
 
@@ -26,17 +18,17 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("📁 Base HCM")
-    uploaded_hcm = st.file_uploader("Escolha arquivo base_hcm", type=["xlsx", "xls", "csv"], key="hcm")
+    uploaded_hcm = st.file_uploader("Escolha arquivo base_hcm", type=["xlsx", "xls", "csv", "parquet", "feather"], key="hcm")
 
 with col2:
     st.subheader("📁 Base RHC")
-    uploaded_rhc = st.file_uploader("Escolha arquivo base_rhc", type=["xlsx", "xls", "csv"], key="rhc")
+    uploaded_rhc = st.file_uploader("Escolha arquivo base_rhc", type=["xlsx", "xls", "csv", "parquet", "feather"], key="rhc")
 
 if uploaded_hcm and uploaded_rhc:
     try:
-        # Load files
-        df_hcm = pd.read_excel(uploaded_hcm) if uploaded_hcm.name.endswith(('.xlsx', '.xls')) else pd.read_csv(uploaded_hcm)
-        df_rhc = pd.read_excel(uploaded_rhc) if uploaded_rhc.name.endswith(('.xlsx', '.xls')) else pd.read_csv(uploaded_rhc)
+        # Load files (format by extension: Excel, CSV, Parquet or Feather)
+        df_hcm = read_table(uploaded_hcm)
+        df_rhc = read_table(uploaded_rhc)
         
         # Validate required columns
         required = {'CÓDIGO', 'PRODUTO'}
@@ -59,31 +51,26 @@ if uploaded_hcm and uploaded_rhc:
                 st.write(f"**Base RHC:** {df_rhc.shape[0]} linhas, {df_rhc.shape[1]} colunas")
                 st.dataframe(df_rhc.head(3), use_container_width=True)
             
+            duplicates = st.radio(
+                "Produtos RHC com o mesmo nome normalizado",
+                options=list(DUPLICATE_POLICIES),
+                format_func=DUPLICATE_POLICIES.get,
+                horizontal=True,
+                help="O resultado tem sempre uma linha por produto HCM; os itens RHC repetidos "
+                     "vão para a aba Conflitos."
+            )
+            
             if st.button("🚀 Processar e Gerar Resultado"):
                 with st.spinner("Normalizando e fazendo merge..."):
-                    # Build normalized key columns
-                    df_hcm_copy = df_hcm.copy()
-                    df_rhc_copy = df_rhc.copy()
-                    df_hcm_copy['_KEY'] = df_hcm_copy['PRODUTO'].fillna('').map(normalize_text)
-                    df_rhc_copy['_KEY'] = df_rhc_copy['PRODUTO'].fillna('').map(normalize_text)
-                    
-                    # Merge (left join): keep all HCM rows, bring RHC code/product where match exists
-                    df_rhc_small = df_rhc_copy[['_KEY', 'CÓDIGO', 'PRODUTO']].rename(columns={
-                        'CÓDIGO': 'CÓDIGO RHC',
-                        'PRODUTO': 'PRODUTO RHC'
-                    })
-                    
-                    df_result = df_hcm_copy.merge(df_rhc_small, on='_KEY', how='left')
+                    # Left join on the normalized PRODUTO (keys folded column-wise, no copies of the inputs):
+                    # keep all HCM rows (one row each), bring RHC code/product where match exists
+                    df_result, conflicts, join_stats = depara_join(df_hcm, df_rhc, duplicates=duplicates)
                     
                     # Compute match stats
-                    total = len(df_hcm_copy)
+                    total = len(df_hcm)
                     matches_found = df_result['CÓDIGO RHC'].notna().sum()
                     match_rate = (matches_found / total * 100) if total > 0 else 0.0
                     
-                    # Drop helper key before saving
-                    if '_KEY' in df_result.columns:
-                        df_result = df_result.drop(columns=['_KEY'])
-                    
                     # Display stats
                     st.success("✅ Processamento concluído!")
                     col1, col2, col3 = st.columns(3)
@@ -93,6 +80,13 @@ if uploaded_hcm and uploaded_rhc:
                         st.metric("Matches", int(matches_found))
                     with col3:
                         st.metric("Taxa de Match", f"{match_rate:.2f}%")
+                    if join_stats['duplicate_keys']:
+                        st.warning(
+                            f"⚠️ {join_stats['duplicate_keys']} nome(s) repetido(s) na base RHC "
+                            f"({join_stats['duplicate_rows']} item(ns) a mais), afetando "
+                            f"{join_stats['ambiguous_rows']} linha(s) HCM. Veja a aba Conflitos."
+                        )
+                        st.dataframe(conflicts.head(20), use_container_width=True)
                     
                     # Preview result
                     st.subheader("👀 Primeiras linhas do resultado:")
@@ -102,6 +96,8 @@ if uploaded_hcm and uploaded_rhc:
                     output = BytesIO()
                     with pd.ExcelWriter(output, engine='openpyxl') as writer:
                         df_result.to_excel(writer, index=False, sheet_name='Resultado')
+                        if len(conflicts):
+                            conflicts.to_excel(writer, index=False, sheet_name='Conflitos')
                     output.seek(0)
                     
                     st.download_button(
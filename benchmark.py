@@ -0,0 +1,377 @@
+"""
+Benchmark of the matching path over the bundled workbooks and synthetic
+scale-ups of the RHC catalogue.
+
+Queries are the PRODUTO of base_hcm.xlsx; the catalogue is base_rhc.xlsx
+(scale 1) or a copy grown to 10x / 100x with perturbed product names
+(swapped words, dropped letters, changed digits, lot suffixes). For each
+scale, in a fresh process (so peak RSS is per scale):
+
+  - read:        streaming the catalogue workbook (ProductSheet)
+  - preprocess:  build_matcher_from_rows, the work behind CatalogueCache.get in tst_app.py
+  - catalogue:   load_rhc_catalogue cold (read + build + save) and warm (cache hit)
+  - similarity:  calculate_similarity_fast on query x candidate pairs
+  - lookup:      BatchMatcher.candidates with the app limits (index lookup)
+  - match:       preprocess + best_match per query with the app options
+
+It reports throughput, p50/p99 latency per call/query, the candidate set
+size distribution (with and without the app limits) and peak RSS.
+
+Usage:
+    python benchmark.py                 # run and compare with the baseline
+    python benchmark.py --update        # run and rewrite the baseline
+    python benchmark.py --scales 1 10   # subset of scales
+
+The baseline is benchmark_baseline.json; the report goes to benchmark.txt
+(not versioned: its timings are those of the machine that ran it).
+Exit code 1 when a timing metric is worse than the baseline by more than
+--tolerance or a result count (matches, candidates) changed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xlsxwriter
+
+from saneamento.batch import DEFAULT_MAX_CANDIDATES, DEFAULT_MAX_DF, build_matcher_from_rows
+from saneamento.blocking import item_block
+from saneamento.catalogue import load_rhc_catalogue
+from saneamento.features import calculate_similarity_fast, preprocess_item
+from saneamento.readers import ProductRow, ProductSheet
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_FILE = 'benchmark_baseline.json'
+REPORT_FILE = 'benchmark.txt'
+BASELINE_FORMAT = 1
+SCALES = [1, 10, 100]
+SEED = 20240601
+
+# Mesmas opções do tst_app
+MATCH_OPTIONS = {'min_score': 0.75, 'max_df': DEFAULT_MAX_DF, 'max_candidates': DEFAULT_MAX_CANDIDATES}
+
+# Etapas de carga repetidas e medidas pelo melhor tempo (menos ruído); só uma vez acima disto
+REPEAT = 3
+REPEAT_MAX_ITEMS = 50_000
+
+# Pares consulta x candidato medidos com calculate_similarity_fast
+SIMILARITY_CANDIDATES_PER_QUERY = 5
+
+# Diferenças absolutas abaixo disto são ruído de medição, não regressão
+NOISE_FLOOR = {'_s': 0.05, '_ms': 0.05, '_us': 5.0, '_mb': 10.0}
+
+_DIGIT = re.compile(r'\d')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB no Linux, bytes no macOS
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def perturb(text, rng):
+    """One or two random edits of a product name, like a near-duplicate registration."""
+    words = str(text).split()
+    for _ in range(rng.randint(1, 2)):
+        op = rng.randrange(4)
+        if op == 0 and len(words) > 1:
+            i = rng.randrange(len(words) - 1)
+            words[i], words[i + 1] = words[i + 1], words[i]
+        elif op == 1 and any(len(w) > 3 for w in words):
+            i = rng.choice([i for i, w in enumerate(words) if len(w) > 3])
+            j = rng.randrange(len(words[i]))
+            words[i] = words[i][:j] + words[i][j + 1:]
+        elif op == 2 and _DIGIT.search(' '.join(words)):
+            i = rng.choice([i for i, w in enumerate(words) if _DIGIT.search(w)])
+            words[i] = _DIGIT.sub(lambda m: str(rng.randrange(10)), words[i], count=1)
+        else:
+            words.append(f"LT{rng.randrange(10000):04d}")
+    return ' '.join(words)
+
+
+def synthetic_rows(rows, scale, seed=SEED):
+    """The catalogue rows plus scale - 1 perturbed copies of each, with new codes."""
+    rng = random.Random(seed)
+    out = list(rows)
+    for k in range(1, scale):
+        for row in rows:
+            code = row.code + k * 10_000_000 if isinstance(row.code, int) else f"{row.code}-{k}"
+            out.append(ProductRow(code, perturb(row.product, rng), row.especie))
+    return out
+
+
+def write_catalogue(rows, path):
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_formulas': False,
+                                          'strings_to_urls': False})
+    sheet = workbook.add_worksheet()
+    sheet.write_row(0, 0, ['CÓDIGO DO PRODUTO', 'PRODUTO'])
+    for i, row in enumerate(rows, start=1):
+        sheet.write_row(i, 0, [row.code, row.product])
+    workbook.close()
+
+
+def best_of(func, repeat):
+    """(result, seconds) of the fastest of repeat calls."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def latency_summary(seconds, unit):
+    """count, throughput and p50/p99 (in unit: 'ms' or 'us') of per-call times."""
+    factor = {'ms': 1e3, 'us': 1e6}[unit]
+    seconds = np.asarray(seconds)
+    total = float(seconds.sum())
+    return {
+        'per_s': len(seconds) / total if total else 0.0,
+        f'p50_{unit}': float(np.percentile(seconds, 50)) * factor,
+        f'p99_{unit}': float(np.percentile(seconds, 99)) * factor,
+    }
+
+
+def size_summary(sizes):
+    sizes = np.asarray(sizes)
+    return {
+        'mean': float(sizes.mean()),
+        'p50': float(np.percentile(sizes, 50)),
+        'p90': float(np.percentile(sizes, 90)),
+        'p99': float(np.percentile(sizes, 99)),
+        'max': int(sizes.max()),
+    }
+
+
+def prefixed(prefix, values):
+    return {f'{prefix}_{key}': value for key, value in values.items()}
+
+
+def run_scale(scale, max_queries=None):
+    """All measurements for one catalogue scale; meant to run in a fresh process."""
+    metrics = {'rss_start_mb': peak_rss_mb()}
+    base_rows = list(ProductSheet('base_rhc.xlsx'))
+    queries = list(ProductSheet('base_hcm.xlsx'))[:max_queries]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f'rhc_x{scale}.xlsx')
+        if scale == 1:
+            path = 'base_rhc.xlsx'
+        else:
+            write_catalogue(synthetic_rows(base_rows, scale), path)
+
+        repeat = REPEAT if len(base_rows) * scale <= REPEAT_MAX_ITEMS else 1
+        rows, metrics['read_s'] = best_of(lambda: list(ProductSheet(path)), repeat)
+        _, metrics['preprocess_s'] = best_of(lambda: build_matcher_from_rows(rows), repeat)
+        metrics['preprocess_items_per_s'] = len(rows) / metrics['preprocess_s']
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Cada repetição fria usa um diretório de cache novo
+        cache_dirs = iter(os.path.join(tmp, f'catalogo{i}') for i in range(repeat))
+        _, metrics['catalogue_cold_s'] = best_of(lambda: load_rhc_catalogue(data, cache_dir=next(cache_dirs)), repeat)
+        matcher, metrics['catalogue_warm_s'] = best_of(
+            lambda: load_rhc_catalogue(data, cache_dir=os.path.join(tmp, 'catalogo0')), repeat)
+
+    metrics['catalogue_items'] = len(matcher)
+    metrics['queries'] = len(queries)
+
+    query_items = []
+    for row in queries:
+        item = preprocess_item(None, row.product, None)
+        item['block'] = item_block(item, row.especie)
+        query_items.append(item)
+
+    # Index lookup: candidatos com os limites do app e sem limite (o que os limites cortam)
+    lookup_times, sizes, unlimited = [], [], []
+    for item in query_items:
+        start = time.perf_counter()
+        candidates = matcher.candidates(item, max_df=DEFAULT_MAX_DF, max_candidates=DEFAULT_MAX_CANDIDATES)
+        lookup_times.append(time.perf_counter() - start)
+        sizes.append(len(candidates))
+        unlimited.append(len(matcher.candidates(item)))
+    metrics.update(prefixed('lookup', latency_summary(lookup_times, 'ms')))
+    metrics.update(prefixed('candidates', size_summary(sizes)))
+    metrics.update(prefixed('candidates_unlimited', size_summary(unlimited)))
+
+    # Similaridade de referência (dicts do preprocess_item) em pares reais consulta x candidato
+    catalogue_items = {}
+    pairs = []
+    for item in query_items:
+        for pos in matcher.candidates(item, max_df=DEFAULT_MAX_DF, max_candidates=DEFAULT_MAX_CANDIDATES)[
+                :SIMILARITY_CANDIDATES_PER_QUERY].tolist():
+            if pos not in catalogue_items:
+                catalogue_items[pos] = preprocess_item(None, matcher.products[pos], None)
+            pairs.append((item, catalogue_items[pos]))
+    similarity_times = []
+    for a, b in pairs:
+        start = time.perf_counter()
+        calculate_similarity_fast(a, b)
+        similarity_times.append(time.perf_counter() - start)
+    metrics['similarity_calls'] = len(pairs)
+    metrics.update(prefixed('similarity', latency_summary(similarity_times, 'us')))
+
+    # Match completo por consulta (preprocess + best_match, como em saneamento.parallel)
+    stats = Counter()
+    match_times = []
+    n_matches = 0
+    for row in queries:
+        start = time.perf_counter()
+        item = preprocess_item(None, row.product, None)
+        item['block'] = item_block(item, row.especie)
+        pos, score = matcher.best_match(item, stats=stats, **MATCH_OPTIONS)
+        match_times.append(time.perf_counter() - start)
+        n_matches += pos is not None and score >= MATCH_OPTIONS['min_score']
+    metrics.update(prefixed('match', latency_summary(match_times, 'ms')))
+    metrics['matches'] = n_matches
+    metrics['scored_pairs'] = stats['scored']
+    metrics['pruned_pairs'] = stats['candidates'] - stats['scored']
+
+    metrics['rss_peak_mb'] = peak_rss_mb()
+    return metrics
+
+
+def run(scales, max_queries=None):
+    results = {}
+    # 'spawn': processo limpo por escala, o pico de RSS não herda o da escala anterior
+    context = multiprocessing.get_context('spawn')
+    for scale in scales:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            start = time.perf_counter()
+            results[str(scale)] = executor.submit(run_scale, scale, max_queries).result()
+        print(f"x{scale}: {results[str(scale)]['catalogue_items']:,} itens em {time.perf_counter() - start:.1f}s")
+    return {
+        'format': BASELINE_FORMAT,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'max_queries': max_queries,
+        'scales': results,
+    }
+
+
+def direction(metric):
+    """+1 when higher is better, -1 when lower is better, 0 for counts (must match)."""
+    if metric.endswith('_per_s'):
+        return 1
+    if metric.endswith(('_s', '_ms', '_us', '_mb')):
+        return -1
+    return 0
+
+
+def compare(current, baseline, tolerance):
+    """(lines, problems): metric-by-metric comparison with the baseline."""
+    lines, problems = [], 0
+    same_setup = baseline.get('max_queries') == current['max_queries']
+    for scale, metrics in current['scales'].items():
+        reference = baseline.get('scales', {}).get(scale)
+        if reference is None:
+            lines.append(f"x{scale}: sem baseline")
+            continue
+        lines.append(f"x{scale}:")
+        for metric, value in metrics.items():
+            old = reference.get(metric)
+            if value is None or old is None:
+                continue
+            sign = direction(metric)
+            status = ''
+            if sign == 0:
+                if same_setup and old != value:
+                    status = 'DIFERENTE'
+            elif old:
+                change = (value - old) / old
+                floor = next((v for unit, v in NOISE_FLOOR.items() if metric.endswith(unit)), 0)
+                if -sign * change > tolerance and abs(value - old) > floor and not metric.startswith('rss_start'):
+                    status = 'REGRESSÃO'
+            problems += bool(status)
+            change_text = f"{(value - old) / old:+7.1%}" if old else ''
+            lines.append(f"  {metric:<32} {old:>12.3f} -> {value:>12.3f} {change_text:>8} {status}")
+    return lines, problems
+
+
+def write_report(current, comparison):
+    with open(REPORT_FILE, 'w', encoding='utf-8') as report:
+        def out(line=''):
+            report.write(line + '\n')
+
+        out(f"{'='*20} Matching benchmark {'='*20}")
+        out(f"Python {current['python']} | {current['platform']} | CPUs: {current['cpus']}")
+        out(f"Opções do match: {MATCH_OPTIONS}")
+        for scale, m in current['scales'].items():
+            out()
+            out("=" * 60)
+            out(f"ESCALA x{scale}: {m['catalogue_items']:,} itens no catálogo, {m['queries']:,} consultas")
+            out("=" * 60)
+            out(f"Leitura (ProductSheet):      {m['read_s']:8.2f}s")
+            out(f"Pré-processamento:           {m['preprocess_s']:8.2f}s ({m['preprocess_items_per_s']:,.0f} itens/s)")
+            out(f"Catálogo frio / em cache:    {m['catalogue_cold_s']:8.2f}s / {m['catalogue_warm_s']:.3f}s")
+            out(f"calculate_similarity_fast:   {m['similarity_per_s']:10,.0f} pares/s | "
+                f"p50 {m['similarity_p50_us']:.1f}us | p99 {m['similarity_p99_us']:.1f}us")
+            out(f"Busca no índice:             {m['lookup_per_s']:10,.0f} consultas/s | "
+                f"p50 {m['lookup_p50_ms']:.2f}ms | p99 {m['lookup_p99_ms']:.2f}ms")
+            out(f"Candidatos (limites do app): média {m['candidates_mean']:.1f} | p50 {m['candidates_p50']:.0f} | "
+                f"p90 {m['candidates_p90']:.0f} | p99 {m['candidates_p99']:.0f} | máx {m['candidates_max']}")
+            out(f"Candidatos (sem limite):     média {m['candidates_unlimited_mean']:.1f} | "
+                f"p50 {m['candidates_unlimited_p50']:.0f} | p90 {m['candidates_unlimited_p90']:.0f} | "
+                f"p99 {m['candidates_unlimited_p99']:.0f} | máx {m['candidates_unlimited_max']}")
+            out(f"Match completo:              {m['match_per_s']:10,.0f} consultas/s | "
+                f"p50 {m['match_p50_ms']:.2f}ms | p99 {m['match_p99_ms']:.2f}ms")
+            out(f"Matches: {m['matches']} | pares pontuados: {m['scored_pairs']:,} | podados: {m['pruned_pairs']:,}")
+            if m['rss_peak_mb'] is not None:
+                out(f"RSS: {m['rss_start_mb']:.0f} MB após imports, pico {m['rss_peak_mb']:.0f} MB")
+        out()
+        out("=" * 60)
+        out("COMPARAÇÃO COM O BASELINE")
+        out("=" * 60)
+        for line in comparison:
+            out(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the matching path")
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES, help="catalogue scale factors")
+    parser.add_argument('--queries', type=int, default=None, help="use only the first N HCM products")
+    parser.add_argument('--update', action='store_true', help=f"rewrite {BASELINE_FILE}")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="relative slowdown reported as a regression (default 0.5)")
+    args = parser.parse_args()
+
+    current = run(args.scales, args.queries)
+    baseline = None
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.update or baseline is None or baseline.get('format') != BASELINE_FORMAT:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        comparison, problems = [f"Baseline gravado em {BASELINE_FILE}"], 0
+    else:
+        comparison, problems = compare(current, baseline, args.tolerance)
+
+    write_report(current, comparison)
+    print(f"Relatório: {REPORT_FILE}" + (f" | {problems} métrica(s) fora do baseline" if problems else ""))
+    return problems == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
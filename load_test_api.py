@@ -0,0 +1,185 @@
+"""
+Load test of the matching HTTP API (matching_api.py).
+
+Starts the server as a separate process on a free local port (or uses
+--url), then:
+1. /match-one: for each concurrency level, that many clients (threads with
+   a keep-alive connection each) send base_hcm.xlsx products one by one
+   for a fixed time; reports requests per second and latency percentiles
+2. /match: base_hcm.xlsx posted as XLSX and as CSV; reports time to the
+   first result, total time and rows per second, and the results differing
+   from Matcher.match in-process (must be 0)
+
+Report goes to load_test_api.txt (not versioned).
+"""
+
+import argparse
+import csv
+import http.client
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+from saneamento.matcher import Matcher
+from saneamento.readers import ProductSheet
+
+REPORT_FILE = 'load_test_api.txt'
+CONCURRENCY = [1, 4, 8]
+DURATION_S = 5.0
+STARTUP_TIMEOUT_S = 60.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    server = subprocess.Popen([sys.executable, 'matching_api.py', '--port', str(port), '--quiet'],
+                              stdout=subprocess.DEVNULL)
+    deadline = time.time() + STARTUP_TIMEOUT_S
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/catalogue')
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("O servidor não respondeu a tempo.")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+def match_one_load(host, port, texts, clients, duration):
+    """(requests, errors, latencies) of clients threads sending /match-one for duration seconds."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client(offset):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        mine, failed = [], 0
+        i = offset
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            connection.request('GET', '/match-one?q=' + quote(texts[i % len(texts)]))
+            response = connection.getresponse()
+            response.read()
+            mine.append(time.perf_counter() - start)
+            failed += response.status != 200
+            i += clients
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies), sum(errors), latencies
+
+
+def post_batch(host, port, path, body, content_type):
+    """(status, seconds to the first result line, total seconds, body text)."""
+    connection = http.client.HTTPConnection(host, port, timeout=600)
+    start = time.perf_counter()
+    connection.request('POST', path, body=body, headers={'Content-Type': content_type})
+    response = connection.getresponse()
+    first_line = response.readline()
+    first = time.perf_counter() - start
+    rest = response.read()
+    total = time.perf_counter() - start
+    connection.close()
+    return response.status, first, total, (first_line + rest).decode('utf-8-sig')
+
+
+def load_test(url=None):
+    rows = list(ProductSheet('base_hcm.xlsx'))
+    texts = [str(row.product) for row in rows if row.product is not None]
+    expected = [(r.rhc_code, r.score if r.matched else None)
+                for r in Matcher().fit('base_rhc.xlsx').match(rows)]
+
+    server = None
+    if url:
+        parsed = urlparse(url)
+        host, port = parsed.hostname, parsed.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = start_server(port)
+
+    try:
+        with open(REPORT_FILE, 'w', encoding='utf-8') as report:
+            def out(line=''):
+                report.write(line + '\n')
+
+            out(f"{'='*20} Load test: matching API {'='*20}")
+            out(f"Servidor: {url or 'matching_api.py local (processo separado)'} | Catálogo: base_rhc.xlsx | "
+                f"CPUs: {os.cpu_count()} (clientes e servidor na mesma máquina)")
+            out()
+            out("=" * 60)
+            out(f"/match-one ({DURATION_S:.0f}s por nível, textos de base_hcm.xlsx)")
+            out("=" * 60)
+            out(f"{'clientes':>8} {'requisições':>12} {'req/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} "
+                f"{'máx':>8} {'erros':>6}")
+            for clients in CONCURRENCY:
+                n, errors, latencies = match_one_load(host, port, texts, clients, DURATION_S)
+                ms = [1000 * latency for latency in latencies]
+                out(f"{clients:>8} {n:>12,} {n / DURATION_S:>8.1f} {percentile(ms, 0.5):>6.1f}ms "
+                    f"{percentile(ms, 0.9):>6.1f}ms {percentile(ms, 0.99):>6.1f}ms {max(ms, default=0):>6.1f}ms "
+                    f"{errors:>6}")
+                print(f"/match-one x{clients}: {n / DURATION_S:.1f} req/s, p50 {percentile(ms, 0.5):.1f}ms, "
+                      f"p99 {percentile(ms, 0.99):.1f}ms")
+
+            out()
+            out("=" * 60)
+            out(f"/match (lote de {len(rows):,} linhas)")
+            out("=" * 60)
+            out(f"{'corpo':<6} {'status':>6} {'1º resultado':>13} {'total':>8} {'linhas/s':>9} {'diferenças':>11}")
+            with open('base_hcm.xlsx', 'rb') as f:
+                xlsx = f.read()
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, delimiter=';')
+            writer.writerow(['CÓDIGO', 'PRODUTO'])
+            writer.writerows([row.code, row.product] for row in rows)
+            for label, body, content_type in [
+                ('xlsx', xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+                ('csv', buffer.getvalue().encode('utf-8'), 'text/csv'),
+            ]:
+                status, first, total, text = post_batch(host, port, '/match', body, content_type)
+                results = [json.loads(line) for line in text.splitlines() if line]
+                got = [(r['codigo_rhc'], r['score'] if r['match'] else None) for r in results]
+                differences = sum(
+                    g[0] != e[0] or (e[1] is not None and abs(g[1] - e[1]) > 1e-6) for g, e in zip(got, expected)
+                ) + abs(len(got) - len(expected))
+                out(f"{label:<6} {status:>6} {first:>12.2f}s {total:>7.2f}s {len(results) / total:>9,.0f} "
+                    f"{differences:>11}")
+                print(f"/match {label}: {total:.2f}s ({len(results) / total:,.0f} linhas/s), diferenças {differences}")
+            out()
+            out("latências de ponta a ponta no cliente (HTTP keep-alive, mesma máquina)")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"Relatório: {REPORT_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the matching HTTP API")
+    parser.add_argument('--url', help="running server (default: start matching_api.py on a free port)")
+    args = parser.parse_args()
+    load_test(args.url)
@@ -5,11 +5,18 @@ Interface gráfica para realizar matching entre base_rhc e outra base (padrão)
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import pandas as pd
-import re
-from difflib import SequenceMatcher
 import threading
 import os
+from collections import Counter
+
+from saneamento.instrumentation import DEFAULT_PROFILE, PROFILE_MODES, RunReport, available_profile_modes
+from saneamento.matcher import DEFAULT_THRESHOLD, Matcher
+from saneamento.parallel import available_workers
+from saneamento.readers import open_products
+from saneamento.report import ResultReport, report_paths
+from saneamento.similarity import DEFAULT_SIMILARITY, SIMILARITY_LABELS
+from saneamento.store import ResultStore
+from saneamento.writers import SHORTLIST_COLUMNS, ResultWriter, formats_label, shortlist_path
 
 class SistemaMatchingFarmaceutico:
     def __init__(self, root):
@@ -20,8 +27,14 @@ class SistemaMatchingFarmaceutico:
         # Variables
         self.arquivo_base_padrao = tk.StringVar()
         self.arquivo_rhc = tk.StringVar(value="base_rhc.xlsx")
-        self.threshold = tk.DoubleVar(value=0.75)
+        self.threshold = tk.DoubleVar(value=DEFAULT_THRESHOLD)
         self.output_file = tk.StringVar(value="equivalencias_resultado.xlsx")
+        self.workers = tk.IntVar(value=1)
+        self.similarity = tk.StringVar(value=DEFAULT_SIMILARITY)
+        self.blocking = tk.BooleanVar(value=False)
+        self.shortlist = tk.IntVar(value=1)
+        self.incremental = tk.BooleanVar(value=False)
+        self.profile = tk.StringVar(value=DEFAULT_PROFILE if DEFAULT_PROFILE in available_profile_modes() else 'off')
         
         self.setup_ui()
         
@@ -63,9 +76,35 @@ class SistemaMatchingFarmaceutico:
         threshold_spinbox.grid(row=0, column=1, sticky=tk.W, padx=5)
         tk.Label(settings_frame, text="(Recomendado: 0.75)").grid(row=0, column=2, sticky=tk.W)
         
-        tk.Label(settings_frame, text="Nome do arquivo de saída:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        tk.Label(settings_frame, text=f"Arquivo de saída ({formats_label()}):").grid(row=1, column=0, sticky=tk.W, pady=5)
         tk.Entry(settings_frame, textvariable=self.output_file, width=40).grid(row=1, column=1, columnspan=2, sticky=tk.W, padx=5)
         
+        tk.Label(settings_frame, text="Processos paralelos:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        tk.Spinbox(settings_frame, from_=1, to=available_workers(), increment=1,
+                   textvariable=self.workers, width=10).grid(row=2, column=1, sticky=tk.W, padx=5)
+        tk.Label(settings_frame, text=f"(Núcleos disponíveis: {available_workers()})").grid(row=2, column=2, sticky=tk.W)
+        
+        tk.Label(settings_frame, text="Similaridade de texto:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        ttk.Combobox(settings_frame, textvariable=self.similarity, values=list(SIMILARITY_LABELS),
+                     state="readonly", width=10).grid(row=3, column=1, sticky=tk.W, padx=5)
+        tk.Label(settings_frame, text=" | ".join(f"{k}: {v}" for k, v in SIMILARITY_LABELS.items())).grid(row=3, column=2, sticky=tk.W)
+        
+        tk.Checkbutton(settings_frame, text="Blocagem por categoria (medicamento × material; usa a coluna ESPÉCIE se existir)",
+                       variable=self.blocking).grid(row=4, column=0, columnspan=3, sticky=tk.W, pady=5)
+        
+        tk.Label(settings_frame, text="Perfil de execução:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        ttk.Combobox(settings_frame, textvariable=self.profile, values=available_profile_modes(),
+                     state="readonly", width=10).grid(row=5, column=1, sticky=tk.W, padx=5)
+        tk.Label(settings_frame, text=" | ".join(f"{k}: {PROFILE_MODES[k]}" for k in available_profile_modes())).grid(row=5, column=2, sticky=tk.W)
+        
+        tk.Label(settings_frame, text="Candidatos por produto (revisão):").grid(row=6, column=0, sticky=tk.W, pady=5)
+        tk.Spinbox(settings_frame, from_=1, to=20, increment=1,
+                   textvariable=self.shortlist, width=10).grid(row=6, column=1, sticky=tk.W, padx=5)
+        tk.Label(settings_frame, text="(Acima de 1 grava também <saída>_candidatos)").grid(row=6, column=2, sticky=tk.W)
+        
+        tk.Checkbutton(settings_frame, text="Reaproveitar resultados anteriores (só pontua linhas novas ou editadas)",
+                       variable=self.incremental).grid(row=7, column=0, columnspan=3, sticky=tk.W, pady=5)
+        
         # Action buttons
         button_frame = tk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=(0, 10))
@@ -96,7 +135,7 @@ class SistemaMatchingFarmaceutico:
     def selecionar_base_padrao(self):
         filename = filedialog.askopenfilename(
             title="Selecionar Base Padrão",
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
+            filetypes=[("Excel files", "*.xlsx"), ("Tables", "*.csv *.parquet *.feather"), ("All files", "*.*")]
         )
         if filename:
             self.arquivo_base_padrao.set(filename)
@@ -104,7 +143,7 @@ class SistemaMatchingFarmaceutico:
     def selecionar_rhc(self):
         filename = filedialog.askopenfilename(
             title="Selecionar Base RHC",
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
+            filetypes=[("Excel files", "*.xlsx"), ("Tables", "*.csv *.parquet *.feather"), ("All files", "*.*")]
         )
         if filename:
             self.arquivo_rhc.set(filename)
@@ -130,7 +169,12 @@ class SistemaMatchingFarmaceutico:
         thread.start()
         
     def _executar_matching_thread(self):
+        writer = shortlist_writer = report = store = matches = None
         try:
+            # Stage timers and counters (always on); the profiler runs in this thread only
+            report = RunReport(profile=self.profile.get(), workers=self.workers.get(), similarity=self.similarity.get(),
+                               blocking=self.blocking.get(), threshold=self.threshold.get(),
+                               shortlist=self.shortlist.get(), incremental=self.incremental.get())
             self.btn_executar.config(state=tk.DISABLED)
             self.progress.start()
             self.log_text.delete(1.0, tk.END)
@@ -141,68 +185,78 @@ class SistemaMatchingFarmaceutico:
             self.log(f"Base Padrão: {os.path.basename(self.arquivo_base_padrao.get())}")
             self.log(f"Base RHC: {os.path.basename(self.arquivo_rhc.get())}")
             self.log(f"Limiar: {self.threshold.get()}")
+            self.log(f"Similaridade: {SIMILARITY_LABELS[self.similarity.get()]}")
             self.log("")
             
             # Load files
             self.log("Carregando arquivos...")
-            df_base = pd.read_excel(self.arquivo_base_padrao.get())
-            df_rhc = pd.read_excel(self.arquivo_rhc.get())
+            # Streamed row by row (CÓDIGO, PRODUTO and optional ESPÉCIE only)
+            with report.stage('base_read'):
+                base_sheet = open_products(self.arquivo_base_padrao.get())
+            self.log(f"✓ Base Padrão: {base_sheet.n_rows or '?'} produtos")
             
-            self.log(f"✓ Base Padrão: {df_base.shape[0]} produtos")
-            self.log(f"✓ Base RHC: {df_rhc.shape[0]} produtos")
-            self.log("")
-            
-            # Build index
-            self.log("Construindo índice invertido...")
-            rhc_index = self.build_inverted_index(df_rhc)
-            self.log(f"✓ Índice criado com {len(rhc_index)} tokens")
+            # Catalogue + index: loaded from disk unless the RHC workbook changed
+            workers = self.workers.get()
+            shortlist = self.shortlist.get()
+            matcher = Matcher(threshold=self.threshold.get(), similarity=self.similarity.get(),
+                              blocking=self.blocking.get(), workers=workers, shortlist=shortlist)
+            with report.stage('rhc_catalogue'):
+                matcher.fit(self.arquivo_rhc.get())
+            report.count('catalogue_disk_hits', matcher.from_cache)
+            self.log(f"✓ Base RHC: {len(matcher)} produtos")
+            if matcher.from_cache:
+                self.log(f"✓ Catálogo carregado do disco ({matcher.catalogue.n_indexed_tokens} tokens no índice)")
+            else:
+                self.log(f"✓ Catálogo criado com {matcher.catalogue.n_indexed_tokens} tokens no índice")
             self.log("")
             
             # Perform matching
-            self.log("Iniciando processo de matching...")
-            results = []
+            self.log(f"Iniciando processo de matching ({workers} processo(s))...")
             matches_found = 0
-            total = len(df_base)
-            
-            for idx, row in df_base.iterrows():
-                # Get column names dynamically
-                codigo_col = df_base.columns[0]  # First column is code
-                produto_col = df_base.columns[1]  # Second column is product
-                
-                codigo = row[codigo_col]
-                produto = row[produto_col]
-                
-                # Find match
-                best_match, similarity = self.find_best_match_optimized(
-                    produto, df_rhc, rhc_index, self.threshold.get()
-                )
-                
-                if best_match is not None:
-                    results.append({
-                        'CÓDIGO BASE': codigo,
-                        'PRODUTO BASE': produto,
-                        'CÓDIGO RHC': best_match['CÓDIGO DO PRODUTO'],
-                        'PRODUTO RHC': best_match['PRODUTO'],
-                        'SIMILARIDADE': f"{similarity:.2%}"
-                    })
-                    matches_found += 1
-                else:
-                    results.append({
-                        'CÓDIGO BASE': codigo,
-                        'PRODUTO BASE': produto,
-                        'CÓDIGO RHC': None,
-                        'PRODUTO RHC': None,
-                        'SIMILARIDADE': None
-                    })
-                
-                # Progress update
-                if (idx + 1) % 500 == 0:
-                    self.log(f"Processado {idx + 1}/{total} produtos ({matches_found} matches)...")
+            total = base_sheet.n_rows
             
-            # Save results
-            df_results = pd.DataFrame(results)
+            # Rows are written as they are matched (.xlsx, .csv, .parquet or .feather by the file extension)
             output_path = self.output_file.get()
-            df_results.to_excel(output_path, index=False)
+            writer = ResultWriter(output_path)
+            # Result report (counts, similarity histogram, samples) from the rows written, not from the file
+            result_report = ResultReport(writer.columns, source=output_path)
+            if shortlist > 1:
+                # Review shortlist in long format (one row per candidate), from the same pass
+                shortlist_writer = ResultWriter(shortlist_path(output_path), columns=SHORTLIST_COLUMNS,
+                                                sheet_name='Candidatos')
+            
+            # Results stream back in the same order as the base rows, while the sheet is read
+            stats = Counter()
+            # Results of earlier runs (same text, catalogue and config) come back from the store
+            store = ResultStore() if self.incremental.get() else None
+            matches = matcher.match(report.timed(base_sheet, 'base_read'), stats=stats, store=store)
+            
+            with report.stage('matching'):
+                for idx, result in enumerate(matches):
+                    # Below the threshold the RHC columns stay empty
+                    matches_found += result.matched
+                    result_row = result.as_row()
+                    with report.stage('write'):
+                        writer.write_row(result_row)
+                        if shortlist_writer is not None:
+                            for row in result.shortlist_rows():
+                                shortlist_writer.write_row(row)
+                    with report.stage('result_report'):
+                        result_report.add(result_row)
+                    
+                    # Progress update
+                    if (idx + 1) % 500 == 0:
+                        self.log(f"Processado {idx + 1}/{total} produtos ({matches_found} matches)...")
+                
+                # Save results
+                writer.close()
+                if shortlist_writer is not None:
+                    shortlist_writer.close()
+            total = writer.rows_written
+            report.count('rows', total)
+            report.count('matches', matches_found)
+            report.add_stats(stats)
+            report.finish()
             
             # Summary
             self.log("")
@@ -211,287 +265,60 @@ class SistemaMatchingFarmaceutico:
             self.log("="*60)
             self.log(f"Total de produtos processados: {total}")
             self.log(f"Matches encontrados: {matches_found}")
-            self.log(f"Taxa de match: {matches_found/total*100:.2f}%")
+            self.log(f"Taxa de match: {matches_found/total*100:.2f}%" if total else "Taxa de match: -")
             self.log(f"Sem correspondência: {total - matches_found}")
+            self.log(f"Pares candidatos: {stats['candidates']} "
+                     f"(podados pelo limite superior: {stats['pruned']}, comparados: {stats['scored']})")
+            if self.blocking.get():
+                self.log(f"Blocagem: {stats['blocked']} pares descartados por categoria, "
+                         f"{stats['block_fallback']} consultas usaram o catálogo inteiro")
+            if store is not None:
+                self.log(f"Reaproveitados: {stats['store_hits'] + stats['store_reused']} resultados "
+                         f"(pontuados: {stats['store_scored']})")
+            self.log("")
+            self.log("Tempos por etapa:")
+            for line in report.summary_lines():
+                self.log(line)
+            if report.profile_text:
+                self.log("")
+                self.log(report.profile_text)
+            # Structured run report next to the result file
+            report_path = os.path.splitext(output_path)[0] + "_execucao.json"
+            report.save(report_path)
+            result_json, result_text = report_paths(output_path)
+            result_report.save(result_json)
+            result_report.save_text(result_text)
             self.log("")
             self.log(f"✓ Arquivo salvo: {output_path}")
+            if shortlist_writer is not None:
+                self.log(f"✓ Lista de revisão ({shortlist} candidatos por produto): {shortlist_path(output_path)}")
+            self.log(f"✓ Relatório de execução: {report_path}")
+            self.log(f"✓ Relatório do resultado: {result_text}")
             self.log("="*60)
             
             messagebox.showinfo("Sucesso!", 
                               f"Matching concluído!\n\n"
-                              f"Matches: {matches_found}/{total} ({matches_found/total*100:.1f}%)\n"
+                              f"Matches: {matches_found}/{total}" + (f" ({matches_found/total*100:.1f}%)" if total else "") + "\n"
                               f"Arquivo: {output_path}")
             
         except Exception as e:
             self.log(f"\n❌ ERRO: {str(e)}")
             messagebox.showerror("Erro", f"Erro durante o matching:\n{str(e)}")
         finally:
+            if writer is not None:
+                writer.close()
+            if shortlist_writer is not None:
+                shortlist_writer.close()
+            if matches is not None:
+                # Ends the generator (saving its pending results) before the store closes
+                matches.close()
+            if store is not None:
+                store.close()
+            if report is not None:
+                report.finish()
             self.progress.stop()
             self.btn_executar.config(state=tk.NORMAL)
     
-    def normalize_pharmaceutical_text(self, text):
-        if pd.isna(text):
-            return ""
-        
-        text = str(text).upper().strip()
-        
-        # Dicionário EXPANDIDO de sinônimos farmacêuticos (conhecimento de farmacêutico)
-        pharmaceutical_synonyms = {
-            # === PRINCÍPIOS ATIVOS - Abreviações e Variações ===
-            'CLAV': 'CLAVULANATO',
-            'CLAVUL': 'CLAVULANATO',
-            'AMOX': 'AMOXICILINA',
-            'AMOXILINA': 'AMOXICILINA',
-            'AMOXI': 'AMOXICILINA',
-            'AC.': 'ACIDO',
-            'AC ': 'ACIDO ',
-            'ACETILSAL': 'ACETILSALICILICO',
-            'ASS': 'ACETILSALICILICO',
-            'AAS': 'ACETILSALICILICO',
-            'DIPIR': 'DIPIRONA',
-            'PARACET': 'PARACETAMOL',
-            'IBUPRO': 'IBUPROFENO',
-            'CEFALEX': 'CEFALEXINA',
-            'AZITRO': 'AZITROMICINA',
-            'CLARITRO': 'CLARITROMICINA',
-            'METFORM': 'METFORMINA',
-            'ATENOL': 'ATENOLOL',
-            'CAPTOP': 'CAPTOPRIL',
-            'ENALAPRIL': 'ENALAPRIL',
-            'LOSART': 'LOSARTANA',
-            'SINVAST': 'SINVASTATINA',
-            'ATORVAST': 'ATORVASTATINA',
-            'OMEPRAZ': 'OMEPRAZOL',
-            'PANTOPRAZ': 'PANTOPRAZOL',
-            'RANITID': 'RANITIDINA',
-            
-            # === SAIS E COMPOSTOS ===
-            'SODICO': 'SODIO',
-            'POTASSICO': 'POTASSIO',
-            'CALCICO': 'CALCIO',
-            'CLORIDRATO': 'HCL',
-            'SULFATO': 'SO4',
-            'FOSFATO': 'PO4',
-            
-            # === FORMAS FARMACÊUTICAS ===
-            'COMP.': 'COMPRIMIDO',
-            'COMP ': 'COMPRIMIDO ',
-            'COMPR': 'COMPRIMIDO',
-            'CPR': 'COMPRIMIDO',
-            'CAPS': 'CAPSULA',
-            'CAP': 'CAPSULA',
-            'AMP.': 'AMPOLA',
-            'AMP ': 'AMPOLA ',
-            'AMPOLA': 'AMPOLA',
-            'FA.': 'FRASCO',
-            'FA ': 'FRASCO ',
-            'FR.': 'FRASCO',
-            'FR ': 'FRASCO ',
-            'FRASCO': 'FRASCO',
-            'ENV.': 'ENVELOPE',
-            'ENV ': 'ENVELOPE ',
-            'SOL.': 'SOLUCAO',
-            'SOL ': 'SOLUCAO ',
-            'SUSP.': 'SUSPENSAO',
-            'SUSP ': 'SUSPENSAO ',
-            'XPE': 'XAROPE',
-            'XAROPE': 'XAROPE',
-            'POM': 'POMADA',
-            'CREME': 'CREME',
-            'GEL': 'GEL',
-            'SPRAY': 'SPRAY',
-            'AEROSOL': 'AEROSOL',
-            'GOTAS': 'GOTAS',
-            'COLIR': 'COLIRIO',
-            
-            # === UNIDADES DE MEDIDA - Normalizar ===
-            'GR ': 'G ',
-            'GR)': 'G)',
-            'GRS': 'G',
-            'GRAMA': 'G',
-            'GRAMAS': 'G',
-            'ML.': 'ML',
-            'MG.': 'MG',
-            'G.': 'G',
-            'MCG': 'MCG',
-            'MICROG': 'MCG',
-            'UI': 'UI',
-            'UNIDADES': 'UI',
-            '%': 'PORCENTO',
-            
-            # === VIAS DE ADMINISTRAÇÃO ===
-            'VO': 'ORAL',
-            'IV': 'INTRAVENOSO',
-            'IM': 'INTRAMUSCULAR',
-            'SC': 'SUBCUTANEO',
-            'TOP': 'TOPICO',
-            
-            # === PREPOSIÇÕES E CONECTORES (remover) ===
-            'C/': 'COM',
-            'S/': 'SEM',
-            ' DE ': ' ',
-            ' DA ': ' ',
-            ' DO ': ' ',
-            ' PARA ': ' ',
-            
-            # === CARACTERES ESPECIAIS ===
-            '(*.*)': '',
-            '*': '',
-            '+': ' ',
-            '-': ' ',
-            '/': ' ',
-            '(': '',
-            ')': '',
-            '[': '',
-            ']': '',
-        }
-        
-        # Aplicar substituições em ordem (importantes primeiro)
-        for old, new in pharmaceutical_synonyms.items():
-            text = text.replace(old, new)
-        
-        # Remover espaços extras
-        text = ' '.join(text.split())
-        
-        return text
-    
-    def extract_concentration(self, text):
-        patterns = [
-            r'\d+\.?\d*\s*MG', r'\d+\.?\d*\s*ML', r'\d+\.?\d*\s*G',
-            r'\d+\.?\d*\s*%', r'\d+\.?\d*\s*MG/\s*\d+\.?\d*\s*ML',
-            r'\d+\.?\d*\s*MCG', r'\d+\.?\d*\s*UI',
-        ]
-        
-        concentrations = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text.upper())
-            concentrations.extend(matches)
-        
-        return set(concentrations)
-    
-    def calculate_similarity(self, text1, text2):
-        """Calcula similaridade com lógica farmacêutica avançada"""
-        norm1 = self.normalize_pharmaceutical_text(text1)
-        norm2 = self.normalize_pharmaceutical_text(text2)
-        
-        # 1. Similaridade básica de sequência
-        basic_score = SequenceMatcher(None, norm1, norm2).ratio()
-        
-        # 2. Verificar concentrações (CRÍTICO para farmacêuticos)
-        conc1 = self.extract_concentration(text1)  # Usar texto original
-        conc2 = self.extract_concentration(text2)
-        
-        concentration_penalty = 0
-        concentration_bonus = 0
-        
-        if conc1 and conc2:
-            # Normalizar concentrações para comparação
-            conc1_normalized = self.normalize_concentrations(conc1)
-            conc2_normalized = self.normalize_concentrations(conc2)
-            
-            if conc1_normalized == conc2_normalized:
-                # BÔNUS se concentrações são iguais (forte indicador de equivalência)
-                concentration_bonus = 0.15  # Aumentado de 0.1 para 0.15
-            else:
-                # PENALIDADE REDUZIDA se concentrações são diferentes
-                concentration_penalty = 0.15  # Reduzido de 0.35 para 0.15
-        
-        # 3. Análise de princípio ativo (primeiras 3-5 palavras)
-        words1 = norm1.split()[:5]
-        words2 = norm2.split()[:5]
-        
-        # Overlap de palavras do princípio ativo
-        ingredient_overlap = len(set(words1) & set(words2)) / max(len(set(words1)), len(set(words2)), 1)
-        
-        # 4. Verificar se há nome comercial comum (entre parênteses)
-        brand1 = self.extract_brand_name(text1)
-        brand2 = self.extract_brand_name(text2)
-        brand_bonus = 0
-        
-        if brand1 and brand2 and brand1 == brand2:
-            # BÔNUS se mesmo nome comercial (ex: CLAVULIN)
-            brand_bonus = 0.2  # Aumentado de 0.15 para 0.2
-        
-        # 5. CÁLCULO FINAL com pesos farmacêuticos AJUSTADOS
-        # - Ingrediente ativo é MAIS importante (65%)
-        # - Sequência exata é menos importante (35%)
-        # - Bônus/penalidades de concentração e marca
-        final_score = (
-            (basic_score * 0.35) + 
-            (ingredient_overlap * 0.65) + 
-            concentration_bonus + 
-            brand_bonus - 
-            concentration_penalty
-        )
-        
-        return max(0, min(1, final_score))
-    
-    def extract_brand_name(self, text):
-        """Extrai nome comercial entre parênteses"""
-        import re
-        match = re.search(r'\(([A-Z]+)\)', text.upper())
-        if match:
-            return match.group(1)
-        return None
-    
-    def normalize_concentrations(self, concentrations):
-        """Normaliza concentrações para comparação (ex: 1GR = 1G)"""
-        normalized = set()
-        for conc in concentrations:
-            # Remover espaços e normalizar variações
-            conc_norm = (
-                conc.replace(' ', '')
-                .replace('GR', 'G')
-                .replace('GRAMA', 'G')
-                .replace('GRAMAS', 'G')
-            )
-            normalized.add(conc_norm)
-        return normalized
-    
-    def build_inverted_index(self, df):
-        index = {}
-        for idx, row in df.iterrows():
-            name = self.normalize_pharmaceutical_text(row['PRODUTO'])
-            tokens = set(name.split())
-            for token in tokens:
-                if len(token) < 3:
-                    continue
-                if token not in index:
-                    index[token] = []
-                index[token].append(idx)
-        return index
-    
-    def find_best_match_optimized(self, product_name, candidate_df, inverted_index, threshold):
-        norm_name = self.normalize_pharmaceutical_text(product_name)
-        tokens = set(norm_name.split())
-        
-        candidate_indices = set()
-        for token in tokens:
-            if len(token) < 3:
-                continue
-            if token in inverted_index:
-                candidate_indices.update(inverted_index[token])
-        
-        if not candidate_indices:
-            return None, 0
-        
-        best_score = 0
-        best_match = None
-        
-        for idx in candidate_indices:
-            candidate_row = candidate_df.iloc[idx]
-            candidate_name = candidate_row['PRODUTO']
-            score = self.calculate_similarity(product_name, candidate_name)
-            
-            if score > best_score:
-                best_score = score
-                best_match = candidate_row
-        
-        if best_score >= threshold:
-            return best_match, best_score
-        else:
-            return None, 0
-    
     def abrir_resultado(self):
         output_path = self.output_file.get()
         if os.path.exists(output_path):
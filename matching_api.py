@@ -0,0 +1,405 @@
+"""
+API HTTP de matching farmacêutico
+Servidor da biblioteca padrão (http.server, uma thread por conexão) que
+mantém o catálogo RHC pré-processado em memória entre as requisições:
+
+  POST /match       lote de produtos (JSON, CSV, XLSX, Parquet ou Feather no corpo); resultados
+                    devolvidos em streaming, um por linha (NDJSON) ou em CSV (com
+                    --shortlist, cada resultado seguido dos candidatos)
+  POST /match-one   um produto ({"produto": ..., "especie": ...}); GET ?q=...
+  GET  /catalogue   catálogo carregado (itens, chave, origem)
+  PUT  /catalogue   substitui o catálogo RHC (XLSX, CSV, Parquet ou Feather no corpo)
+
+Uso: python matching_api.py --rhc base_rhc.xlsx --port 8000
+"""
+
+import argparse
+import json
+import threading
+import time
+import zipfile
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from saneamento.batch import build_matcher_from_rows
+from saneamento.catalogue import load_rhc_catalogue
+from saneamento.matcher import DEFAULT_THRESHOLD, Matcher
+from saneamento.readers import TABLE_MAGIC, ProductRow, csv_rows, normalize_header, open_products
+from saneamento.similarity import DEFAULT_SIMILARITY, SIMILARITY_BACKENDS
+from saneamento.writers import RESULT_COLUMNS, SHORTLIST_COLUMNS, TIERED_RESULT_COLUMNS, ResultWriter
+
+# Maior corpo aceito (planilhas de ~1M de linhas cabem)
+MAX_BODY_BYTES = 200 * 2**20
+
+# Bytes por bloco enviado no streaming do /match
+STREAM_CHUNK_BYTES = 64 * 1024
+
+XLSX_MAGIC = b'PK\x03\x04'
+
+# Erros de leitura de um corpo mal formado (respondidos com 400)
+READ_ERRORS = (ValueError, UnicodeDecodeError, OSError, KeyError, zipfile.BadZipFile)
+
+
+class RequestError(Exception):
+    """Bad request: answered with status and {"erro": message}."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+def body_format(content_type, data):
+    """
+    'json', 'csv', 'xlsx', 'parquet' or 'feather' from the Content-Type, or
+    from the body itself when it is not specific.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    for magic, fmt in TABLE_MAGIC.items():
+        if fmt in ('parquet', 'feather') and data.startswith(magic):
+            return fmt
+    if content_type.endswith('json'):
+        return 'json'
+    if content_type in ('text/csv', 'application/csv', 'text/plain'):
+        return 'csv'
+    if 'spreadsheet' in content_type or 'excel' in content_type or data.startswith(XLSX_MAGIC):
+        return 'xlsx'
+    return 'json' if data.lstrip()[:1] in (b'[', b'{') else 'csv'
+
+
+def json_rows(data):
+    """
+    ProductRow tuples of a JSON body: a list (or {"produtos": [...]}) of
+    product texts or of objects keyed by CÓDIGO/PRODUTO/ESPÉCIE (any
+    header alias, any case).
+    """
+    try:
+        payload = json.loads(data)
+    except ValueError as e:
+        raise RequestError(f"JSON inválido: {e}")
+    if isinstance(payload, dict):
+        payload = next((value for key, value in payload.items() if normalize_header(key) in ('PRODUTOS', 'ROWS')),
+                       None)
+    if not isinstance(payload, list):
+        raise RequestError('O JSON deve ser uma lista de produtos ou {"produtos": [...]}.')
+    rows = []
+    for item in payload:
+        if isinstance(item, dict):
+            fields = {normalize_header(key): value for key, value in item.items()}
+            rows.append(ProductRow(fields.get('CÓDIGO'), fields.get('PRODUTO'), fields.get('ESPÉCIE')))
+        else:
+            rows.append(ProductRow(None, item, None))
+    return rows
+
+
+def json_product(data):
+    """(produto, especie) of a /match-one JSON body: an object with a text PRODUTO (any header alias, any case)."""
+    try:
+        payload = json.loads(data)
+    except ValueError as e:
+        raise RequestError(f"JSON inválido: {e}")
+    if not isinstance(payload, dict):
+        raise RequestError('O JSON deve ser um objeto: {"produto": "...", "especie": "..."}.')
+    fields = {normalize_header(key): value for key, value in payload.items()}
+    text, especie = fields.get('PRODUTO'), fields.get('ESPÉCIE')
+    if not isinstance(text, str):
+        raise RequestError('"produto" deve ser um texto.')
+    if especie is not None and not isinstance(especie, str):
+        raise RequestError('"especie" deve ser um texto.')
+    return text, especie
+
+
+def body_rows(content_type, data):
+    """ProductRow tuples of a /match or /catalogue body (JSON, CSV, XLSX, Parquet or Feather)."""
+    fmt = body_format(content_type, data)
+    try:
+        if fmt == 'json':
+            return json_rows(data)
+        if fmt == 'csv':
+            return csv_rows(data)
+        return open_products(data, fmt)
+    except READ_ERRORS as e:
+        raise RequestError(f"Não foi possível ler o corpo ({fmt}): {e}")
+
+
+def result_json(result):
+    """JSON object of a MatchResult (score as a number, tier, shortlist candidates when kept)."""
+    obj = {
+        'codigo': result.code,
+        'produto': result.product,
+        'codigo_rhc': result.rhc_code,
+        'produto_rhc': result.rhc_product,
+        'score': round(result.score, 6),
+        'match': result.matched,
+        'origem': result.tier,
+    }
+    if result.shortlist:
+        obj['candidatos'] = [
+            {'codigo_rhc': c.rhc_code, 'produto_rhc': c.rhc_product, 'score': round(c.score, 6),
+             'texto': round(c.text, 6), 'principio_ativo': round(c.ingredient, 6),
+             'concentracao': round(c.concentration, 6), 'marca': round(c.brand, 6)}
+            for c in result.shortlist
+        ]
+    return obj
+
+
+def shortlist_csv_columns(columns):
+    """
+    Header of the /match CSV with a shortlist: SHORTLIST_COLUMNS plus the
+    result columns they lack (ORIGEM). Each base row gives its result row,
+    with ORDEM empty, then one row per candidate (ORDEM 1, 2, ...), so rows
+    without candidates are still in the output.
+    """
+    return SHORTLIST_COLUMNS + [column for column in columns if column not in SHORTLIST_COLUMNS]
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+class _ChunkedStream:
+    """
+    Binary file object sending what is written as HTTP/1.1 chunks of about
+    STREAM_CHUNK_BYTES (the target of ResultWriter and of the NDJSON lines).
+    """
+
+    closed = False
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= STREAM_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(self._buffer), bytes(self._buffer)))
+            self._buffer.clear()
+
+    def finish(self):
+        """Sends what is left and the last (empty) chunk."""
+        self.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    # O TextIOWrapper do ResultWriter (CSV) consulta estes métodos
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+
+class MatchingService:
+    """
+    Matcher options plus the resident RHC catalogue. replace_catalogue()
+    builds the new catalogue aside and swaps it in one assignment; requests
+    already running keep the Matcher they started with.
+    """
+
+    def __init__(self, rhc=None, **matcher_options):
+        self.matcher_options = matcher_options
+        self.matcher = None
+        self.catalogue_info = None
+        self._replace_lock = threading.Lock()
+        if rhc is not None:
+            self.replace_catalogue(rhc)
+
+    def replace_catalogue(self, rhc, content_type=None):
+        """Loads an RHC workbook (path or XLSX bytes, cached on disk) or a CSV/JSON body; returns its info."""
+        start = time.perf_counter()
+        with self._replace_lock:
+            try:
+                if isinstance(rhc, (bytes, bytearray)) and body_format(content_type, rhc) != 'xlsx':
+                    catalogue = build_matcher_from_rows(body_rows(content_type, rhc))
+                    key, from_cache = None, False
+                else:
+                    catalogue = load_rhc_catalogue(rhc)
+                    key, from_cache = catalogue.catalogue_key, catalogue.from_cache
+            except READ_ERRORS as e:
+                raise RequestError(f"Não foi possível ler o catálogo: {e}")
+            if not len(catalogue):
+                raise RequestError("O catálogo RHC está vazio.")
+            self.matcher = Matcher(**self.matcher_options).fit(catalogue)
+            self.catalogue_info = {
+                'itens': len(catalogue),
+                'tokens': catalogue.n_indexed_tokens,
+                'chave': key,
+                'do_disco': from_cache,
+                'carregado_em': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'segundos': round(time.perf_counter() - start, 3),
+            }
+        return self.catalogue_info
+
+    def current_matcher(self):
+        if self.matcher is None:
+            raise RequestError("Nenhum catálogo RHC carregado: envie um com PUT /catalogue.",
+                               HTTPStatus.SERVICE_UNAVAILABLE)
+        return self.matcher
+
+
+class MatchingHandler(BaseHTTPRequestHandler):
+    """Routes the API endpoints; server.service is the shared MatchingService."""
+
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalho e corpo saem em writes separados: sem isso o Nagle + ACK atrasado somam ~40 ms por resposta
+    disable_nagle_algorithm = True
+    server_version = 'SaneamentoMatching/1.0'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, obj, status=HTTPStatus.OK):
+        data = _dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(f"Corpo maior que {MAX_BODY_BYTES // 2**20} MB.", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        if not length:
+            raise RequestError("Corpo vazio.")
+        return self.rfile.read(length)
+
+    def _dispatch(self, routes):
+        url = urlparse(self.path)
+        handler = routes.get(url.path.rstrip('/') or '/')
+        try:
+            if handler is None:
+                raise RequestError(f"Rota desconhecida: {self.command} {url.path}", HTTPStatus.NOT_FOUND)
+            handler(parse_qs(url.query))
+        except RequestError as e:
+            self._send_json({'erro': str(e)}, e.status)
+        except Exception as e:
+            self._send_json({'erro': f"Erro interno: {e}"}, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def do_GET(self):
+        self._dispatch({'/catalogue': self.get_catalogue, '/match-one': self.match_one})
+
+    def do_POST(self):
+        self._dispatch({'/match': self.match, '/match-one': self.match_one, '/catalogue': self.put_catalogue})
+
+    def do_PUT(self):
+        self._dispatch({'/catalogue': self.put_catalogue})
+
+    def get_catalogue(self, query):
+        self.service.current_matcher()
+        self._send_json(self.service.catalogue_info)
+
+    def put_catalogue(self, query):
+        data = self._read_body()
+        self._send_json(self.service.replace_catalogue(data, self.headers.get('Content-Type')))
+
+    def match_one(self, query):
+        matcher = self.service.current_matcher()
+        if self.command == 'GET':
+            text, especie = query.get('q', [None])[0], query.get('especie', [None])[0]
+        else:
+            text, especie = json_product(self._read_body())
+        if not text:
+            raise RequestError('Informe o produto: {"produto": "..."} ou ?q=...')
+        self._send_json(result_json(matcher.match_one(text, especie=especie)))
+
+    def match(self, query):
+        """Streams one result per base row, in input order: NDJSON, or CSV with ?formato=csv."""
+        matcher = self.service.current_matcher()
+        fmt = query.get('formato', ['ndjson'])[0]
+        if fmt not in ('ndjson', 'csv'):
+            raise RequestError("formato deve ser ndjson ou csv.")
+        rows = body_rows(self.headers.get('Content-Type'), self._read_body())
+        results = matcher.match(rows)
+        # A primeira linha sai antes do cabeçalho: erros de leitura ainda viram 400
+        try:
+            first = next(results, None)
+        except READ_ERRORS as e:
+            raise RequestError(f"Não foi possível ler o corpo: {e}")
+
+        self.send_response(HTTPStatus.OK)
+        content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8'
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        stream = _ChunkedStream(self.wfile)
+        results = _prepend(first, results) if first is not None else ()
+        try:
+            if fmt == 'csv':
+                columns = TIERED_RESULT_COLUMNS if matcher.exact_first else RESULT_COLUMNS
+                shortlist = matcher.shortlist > 1
+                with ResultWriter(stream, columns=shortlist_csv_columns(columns) if shortlist else columns,
+                                  fmt='csv') as writer:
+                    for result in results:
+                        # Uma linha de resultado por linha da base (ORDEM vazia), seguida dos candidatos
+                        writer.write_row(result.as_row(columns))
+                        if shortlist:
+                            for row in result.shortlist_rows():
+                                writer.write_row(row)
+            else:
+                for result in results:
+                    stream.write(_dumps(result_json(result)).encode('utf-8') + b'\n')
+        except Exception as e:
+            # Cabeçalho já enviado: o erro vai como última linha e a conexão é encerrada
+            if fmt == 'ndjson':
+                stream.write(_dumps({'erro': str(e)}).encode('utf-8') + b'\n')
+            self.close_connection = True
+        stream.finish()
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def make_server(service, host='127.0.0.1', port=8000, quiet=False):
+    """ThreadingHTTPServer serving service (port 0 picks a free port: see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), MatchingHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP matching API with a resident RHC catalogue")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on")
+    parser.add_argument('--port', type=int, default=8000, help="port to listen on")
+    parser.add_argument('--rhc', default='base_rhc.xlsx', help="RHC catalogue loaded at start-up")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="similarity threshold (0.0 to 1.0)")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes per /match batch")
+    parser.add_argument('--similarity', choices=list(SIMILARITY_BACKENDS), default=DEFAULT_SIMILARITY,
+                        help="text similarity backend")
+    parser.add_argument('--blocking', action='store_true', help="only compare products of the same category")
+    parser.add_argument('--shortlist', type=int, default=1, help="candidates returned per product")
+    parser.add_argument('--exact-first', action='store_true',
+                        help="match exact (normalized) names by lookup and only fuzzy-score the rest")
+    parser.add_argument('--quiet', action='store_true', help="no per-request log")
+    args = parser.parse_args()
+
+    service = MatchingService(args.rhc, threshold=args.threshold, workers=args.workers,
+                              similarity=args.similarity, blocking=args.blocking, shortlist=args.shortlist,
+                              exact_first=args.exact_first)
+    server = make_server(service, args.host, args.port, quiet=args.quiet)
+    info = service.catalogue_info
+    print(f"Catálogo RHC: {info['itens']} itens ({'do disco' if info['do_disco'] else 'construído'}, "
+          f"{info['segundos']}s)")
+    print(f"Servindo em http://{args.host}:{server.server_address[1]} (Ctrl+C para parar)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,261 +1,165 @@
 """
 Pharmaceutical Fuzzy Matching Script
-Matches products from base_rhc.xlsx to base_hcm.xlsx using:
+Matches products from base_hcm.xlsx to base_rhc.xlsx using:
 - Fuzzy string matching with pharmaceutical knowledge
 - Similarity thresholds
 - Concentration and dosage form awareness
+The scoring is the shared engine in saneamento/matcher.py (same as the
+Streamlit and Tkinter front-ends).
 """
 
-import pandas as pd
-import re
-from difflib import SequenceMatcher
+import argparse
+from collections import Counter
+from contextlib import ExitStack, closing
 
-def normalize_pharmaceutical_text(text):
-    """
-    Normalize pharmaceutical product names for better matching
-    """
-    if pd.isna(text):
-        return ""
-    
-    text = str(text).upper().strip()
-    
-    # Remove common pharmaceutical abbreviations variations
-    replacements = {
-        'COMP.': 'COMPRIMIDO',
-        'COMP': 'COMPRIMIDO',
-        'CPR': 'COMPRIMIDO',
-        'AMP.': 'AMPOLA',
-        'AMP': 'AMPOLA',
-        'FA.': 'FRASCO',
-        'FA': 'FRASCO',
-        'FR.': 'FRASCO',
-        'FR': 'FRASCO',
-        'ENV.': 'ENVELOPE',
-        'ENV': 'ENVELOPE',
-        'ML.': 'ML',
-        'MG.': 'MG',
-        'G.': 'G',
-        'C/': 'COM',
-        'S/': 'SEM',
-        '(*.*)': '',
-        '  ': ' ',
-    }
-    
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    
-    # Remove extra spaces
-    text = ' '.join(text.split())
-    
-    return text
+from saneamento.matcher import DEFAULT_THRESHOLD, Matcher
+from saneamento.readers import open_products
+from saneamento.report import ResultReport, report_paths
+from saneamento.similarity import DEFAULT_SIMILARITY, SIMILARITY_BACKENDS
+from saneamento.store import ResultStore
+from saneamento.writers import SHORTLIST_COLUMNS, ResultWriter, shortlist_path
 
-def extract_concentration(text):
-    """
-    Extract concentration/dosage from product name
-    Examples: 500MG, 10ML, 2.5%, 100MG/5ML
-    """
-    # Pattern for concentrations like 500MG, 10ML, 2.5%, etc.
-    patterns = [
-        r'\d+\.?\d*\s*MG',
-        r'\d+\.?\d*\s*ML',
-        r'\d+\.?\d*\s*G',
-        r'\d+\.?\d*\s*%',
-        r'\d+\.?\d*\s*MG/\s*\d+\.?\d*\s*ML',
-        r'\d+\.?\d*\s*MCG',
-        r'\d+\.?\d*\s*UI',
-    ]
-    
-    concentrations = []
-    for pattern in patterns:
-        matches = re.findall(pattern, text.upper())
-        concentrations.extend(matches)
-    
-    return set(concentrations)
+OUTPUT_COLUMNS = ['CÓDIGO HCM', 'PRODUTO HCM', 'CÓDIGO RHC', 'PRODUTO RHC', 'SIMILARIDADE']
 
-def calculate_similarity(text1, text2):
-    """
-    Calculate similarity between two pharmaceutical product names
-    Returns a score between 0 and 1
-    """
-    # Normalize both texts
-    norm1 = normalize_pharmaceutical_text(text1)
-    norm2 = normalize_pharmaceutical_text(text2)
-    
-    # Basic sequence matching
-    basic_score = SequenceMatcher(None, norm1, norm2).ratio()
-    
-    # Check if concentrations match
-    conc1 = extract_concentration(norm1)
-    conc2 = extract_concentration(norm2)
-    
-    concentration_penalty = 0
-    if conc1 and conc2:
-        # If both have concentrations, they must match
-        if conc1 != conc2:
-            concentration_penalty = 0.3  # Heavy penalty for different concentrations
-    
-    # Extract main active ingredient (usually first words before numbers)
-    words1 = norm1.split()[:3]  # First 3 words
-    words2 = norm2.split()[:3]
-    
-    # Check if main ingredient words overlap
-    ingredient_overlap = len(set(words1) & set(words2)) / max(len(set(words1)), len(set(words2)), 1)
-    
-    # Final score combines basic similarity, concentration match, and ingredient overlap
-    final_score = (basic_score * 0.5 + ingredient_overlap * 0.5) - concentration_penalty
-    
-    return max(0, min(1, final_score))  # Clamp between 0 and 1
 
-def build_inverted_index(df):
-    """
-    Build an inverted index for faster lookup
-    Token -> List of Row Indices
-    """
-    index = {}
-    for idx, row in df.iterrows():
-        name = normalize_pharmaceutical_text(row['PRODUTO'])
-        tokens = set(name.split())
-        for token in tokens:
-            if len(token) < 3: continue # Skip short tokens
-            if token not in index:
-                index[token] = []
-            index[token].append(idx)
-    return index
-
-def find_best_match_optimized(product_name, candidate_df, inverted_index, threshold=0.75):
-    """
-    Find best match using inverted index to filter candidates
-    """
-    norm_name = normalize_pharmaceutical_text(product_name)
-    tokens = set(norm_name.split())
-    
-    # Get candidates that share at least one significant token
-    candidate_indices = set()
-    for token in tokens:
-        if len(token) < 3: continue
-        if token in inverted_index:
-            candidate_indices.update(inverted_index[token])
-    
-    if not candidate_indices:
-        return None, 0
-        
-    best_score = 0
-    best_match = None
-    
-    # Only compare with candidates
-    for idx in candidate_indices:
-        candidate_row = candidate_df.iloc[idx]
-        candidate_name = candidate_row['PRODUTO']
-        
-        # Quick length check optimization
-        if abs(len(norm_name) - len(normalize_pharmaceutical_text(candidate_name))) > 10:
-             # If length difference is huge, skip detailed calculation (unless it's a substring case)
-             pass
-
-        score = calculate_similarity(product_name, candidate_name)
-        
-        if score > best_score:
-            best_score = score
-            best_match = candidate_row
-    
-    if best_score >= threshold:
-        return best_match, best_score
-    else:
-        return None, 0
-
-def pharmaceutical_fuzzy_matching(threshold=0.75):
+def pharmaceutical_fuzzy_matching(threshold=DEFAULT_THRESHOLD, workers=1,
+                                  output_file='equivalencias_farmaceuticas_hcm_base.xlsx',
+                                  base_file='base_hcm.xlsx', rhc_file='base_rhc.xlsx',
+                                  similarity=DEFAULT_SIMILARITY, blocking=False, shortlist=1,
+                                  incremental=False, exact_first=False, report=False):
     """
     Main function to perform pharmaceutical fuzzy matching
     Base: HCM
     Lookup: RHC
+    workers > 1 spreads the HCM rows over a process pool (same results)
+    Rows are written to output_file as they are matched (.xlsx, .csv, .parquet or .feather)
+    The base and the RHC catalogue may be .xlsx, .csv, .parquet or .feather files
+    shortlist > 1 also writes the best candidates of each product (long format,
+    with the score terms) to <output>_candidatos, from the same pass
+    incremental reuses the results stored by earlier runs (ResultStore) and
+    only scores new or edited rows
+    exact_first resolves products whose normalized name equals an RHC item's
+    by a dict lookup (ORIGEM column) and only scores the remaining rows
+    report also writes the result report (counts, similarity histogram,
+    samples; see saneamento/report.py) to <output>_relatorio.json/.txt,
+    built from the rows as they are written
     """
     print("="*60)
     print("PHARMACEUTICAL FUZZY MATCHING (HCM BASE -> RHC LOOKUP)")
     print("="*60)
     print(f"Similarity threshold: {threshold}")
+    print(f"Worker processes: {workers}")
+    if shortlist > 1:
+        print(f"Review shortlist: {shortlist} candidates per product")
+    if incremental:
+        print("Incremental: reusing stored results")
+    if exact_first:
+        print("Exact-key tier: exact name matches skip fuzzy scoring")
     print()
-    
-    # Load files
+
+    # Load files: the HCM base is streamed, the RHC catalogue comes from disk unless the workbook changed
     print("Loading files...")
-    df_rhc = pd.read_excel('base_rhc.xlsx')
-    df_hcm = pd.read_excel('base_hcm.xlsx')
-    
-    print(f"Loaded base_hcm: {df_hcm.shape[0]} products (BASE)")
-    print(f"Loaded base_rhc: {df_rhc.shape[0]} products (LOOKUP)")
-    
-    # Build index for RHC (since we are looking up IN RHC)
-    print("Building inverted index for RHC...")
-    rhc_index = build_inverted_index(df_rhc)
-    print(f"Index built with {len(rhc_index)} tokens.")
+    base_sheet = open_products(base_file)
+    matcher = Matcher(threshold=threshold, similarity=similarity, blocking=blocking, workers=workers,
+                      shortlist=shortlist, exact_first=exact_first).fit(rhc_file)
+
+    print(f"Loaded {base_file}: {base_sheet.n_rows} products (BASE)")
+    print(f"Loaded {rhc_file}: {len(matcher)} products (LOOKUP)")
+    print(f"Index {'loaded from disk' if matcher.from_cache else 'built'} with "
+          f"{matcher.catalogue.n_indexed_tokens} tokens.")
     print()
-    
-    # Results storage
-    results = []
+
     matches_found = 0
-    
+
     print("Starting matching process...")
     print()
-    
-    # For each HCM product, find best match in RHC
-    total = len(df_hcm)
-    for idx, hcm_row in df_hcm.iterrows():
-        hcm_code = hcm_row['CÓDIGO']
-        hcm_product = hcm_row['PRODUTO']
-        
-        # Find best match in RHC
-        best_match, similarity = find_best_match_optimized(hcm_product, df_rhc, rhc_index, threshold)
-        
-        if best_match is not None:
-            results.append({
-                'CÓDIGO HCM': hcm_code,
-                'PRODUTO HCM': hcm_product,
-                'CÓDIGO RHC': best_match['CÓDIGO DO PRODUTO'],
-                'PRODUTO RHC': best_match['PRODUTO'],
-                'SIMILARIDADE': f"{similarity:.2%}"
-            })
-            matches_found += 1
-            
-            if matches_found <= 10:  # Show first 10 matches
-                print(f"✓ Match {matches_found}:")
-                print(f"  HCM: {hcm_product[:60]}")
-                print(f"  RHC: {best_match['PRODUTO'][:60]}")
-                print(f"  Similarity: {similarity:.2%}")
-                print()
-        else:
-            # No match found
-            results.append({
-                'CÓDIGO HCM': hcm_code,
-                'PRODUTO HCM': hcm_product,
-                'CÓDIGO RHC': None,
-                'PRODUTO RHC': None,
-                'SIMILARIDADE': None
-            })
-        
-        # Progress indicator
-        if (idx + 1) % 500 == 0:
-            print(f"Processed {idx + 1}/{total} products ({matches_found} matches so far)...")
-    
-    # Create results dataframe
-    df_results = pd.DataFrame(results)
-    
-    # Save to Excel
-    output_file = 'equivalencias_farmaceuticas_hcm_base.xlsx'
-    df_results.to_excel(output_file, index=False)
-    
+
+    # For each HCM product, find best match in RHC (results come back in order)
+    total = base_sheet.n_rows
+    stats = Counter()
+    columns = OUTPUT_COLUMNS + ['ORIGEM'] if exact_first else OUTPUT_COLUMNS
+    with ExitStack() as outputs:
+        store = outputs.enter_context(ResultStore()) if incremental else None
+        # Closed before the store: the generator saves its pending results when it ends
+        matches = outputs.enter_context(closing(matcher.match(base_sheet, stats=stats, store=store)))
+        writer = outputs.enter_context(ResultWriter(output_file, columns=columns))
+        result_report = ResultReport(columns, source=output_file) if report else None
+        shortlist_writer = shortlist > 1 and outputs.enter_context(
+            ResultWriter(shortlist_path(output_file), columns=SHORTLIST_COLUMNS, sheet_name='Candidatos'))
+        for idx, result in enumerate(matches):
+            row = result.as_row(columns)
+            writer.write_row(row)
+            if result_report is not None:
+                result_report.add(row)
+            if shortlist_writer:
+                for row in result.shortlist_rows():
+                    shortlist_writer.write_row(row)
+
+            if result.matched:
+                matches_found += 1
+                if matches_found <= 10:  # Show first 10 matches
+                    print(f"✓ Match {matches_found}:")
+                    print(f"  HCM: {str(result.product)[:60]}")
+                    print(f"  RHC: {str(result.rhc_product)[:60]}")
+                    print(f"  Similarity: {result.score:.2%}")
+                    print()
+
+            # Progress indicator
+            if (idx + 1) % 500 == 0:
+                print(f"Processed {idx + 1}/{total} products ({matches_found} matches so far)...")
+    total = writer.rows_written
+
     # Summary
     print()
     print("="*60)
     print("MATCHING SUMMARY")
     print("="*60)
-    print(f"Total HCM products: {len(df_hcm)}")
+    print(f"Total HCM products: {total}")
     print(f"Matches found: {matches_found}")
-    print(f"Match rate: {matches_found/len(df_hcm)*100:.2f}%")
-    print(f"No match: {len(df_hcm) - matches_found}")
+    print(f"Match rate: {matches_found/total*100:.2f}%" if total else "Match rate: -")
+    print(f"No match: {total - matches_found}")
+    if stats['memo_hits']:
+        print(f"Repeated descriptions: {stats['memo_hits']} scored once "
+              f"(~{stats['memo_saved_s']:.2f}s saved)")
+    if exact_first:
+        print(f"Exact-key matches: {stats['exact_hits']} ({stats['exact_hits']/total*100:.2f}% of the rows "
+              f"never went to fuzzy scoring)" if total else "Exact-key matches: -")
+    if incremental:
+        print(f"Reused results: {stats['store_hits'] + stats['store_reused']} | Scored: {stats['store_scored']}")
     print()
     print(f"Output file: {output_file}")
+    if shortlist > 1:
+        print(f"Review shortlist: {shortlist_path(output_file)}")
+    if report:
+        json_path, text_path = report_paths(output_file)
+        result_report.save(json_path)
+        result_report.save_text(text_path)
+        print(f"Result report: {json_path}, {text_path}")
     print("="*60)
 
 if __name__ == "__main__":
-    # You can adjust the threshold here (0.0 to 1.0)
+    parser = argparse.ArgumentParser(description="Pharmaceutical fuzzy matching (HCM base -> RHC lookup)")
     # 0.75 = 75% similarity required
-    pharmaceutical_fuzzy_matching(threshold=0.75)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="similarity threshold (0.0 to 1.0)")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--output', default='equivalencias_farmaceuticas_hcm_base.xlsx',
+                        help="output file; the extension picks the format (.xlsx, .csv, .parquet or .feather)")
+    parser.add_argument('--base', default='base_hcm.xlsx', help="products to match (.xlsx, .csv, .parquet or .feather)")
+    parser.add_argument('--rhc', default='base_rhc.xlsx', help="RHC catalogue (.xlsx, .csv, .parquet or .feather)")
+    parser.add_argument('--similarity', choices=list(SIMILARITY_BACKENDS), default=DEFAULT_SIMILARITY,
+                        help="text similarity backend")
+    parser.add_argument('--blocking', action='store_true', help="only compare products of the same category")
+    parser.add_argument('--shortlist', type=int, default=1,
+                        help="candidates kept per product for review (> 1 writes <output>_candidatos)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="reuse stored results and only score new or edited rows")
+    parser.add_argument('--exact-first', action='store_true',
+                        help="match exact (normalized) names by lookup and only fuzzy-score the rest")
+    parser.add_argument('--report', action='store_true',
+                        help="also write the result report (<output>_relatorio.json and .txt)")
+    args = parser.parse_args()
+    pharmaceutical_fuzzy_matching(threshold=args.threshold, workers=args.workers, output_file=args.output,
+                                  base_file=args.base, rhc_file=args.rhc, similarity=args.similarity,
+                                  blocking=args.blocking, shortlist=args.shortlist,
+                                  incremental=args.incremental, exact_first=args.exact_first,
+                                  report=args.report)
@@ -0,0 +1,70 @@
+"""
+Relatório de arquivos de resultado e de bases (saneamento.report)
+Substitui os scripts verify_* / inspect_* de antes: cada arquivo (.xlsx,
+.csv, .parquet ou .feather) é lido uma vez, em streaming, e o relatório
+traz linhas, matches, células preenchidas por coluna, o histograma da
+similaridade e amostras. Sem argumentos, cobre os arquivos que aqueles
+scripts liam (os que existirem).
+
+Reports go to report_results.txt and report_results.json (one entry per file;
+not versioned, like the other generated reports).
+"""
+
+import argparse
+import json
+import os
+import time
+
+from saneamento.report import SAMPLE_ROWS, report_file
+
+# Os arquivos de verify_fuzzy*.py, verify_resultado.py, verify_hcm.py, inspect_*.py
+DEFAULT_FILES = [
+    'equivalencias_farmaceuticas_hcm_base.xlsx',
+    'equivalencias_farmaceuticas.xlsx',
+    'resultado_de_para.xlsx',
+    'base_de_para.xlsx',
+    'base_hcm.xlsx',
+    'base_rhc.xlsx',
+]
+REPORT_FILE = 'report_results'
+
+
+def report_results(files=None, output=REPORT_FILE, match_column=None, samples=SAMPLE_ROWS):
+    explicit = bool(files)
+    files = files or DEFAULT_FILES
+    text, reports = [], {}
+    for path in files:
+        if not os.path.exists(path):
+            if explicit:
+                print(f"{path}: not found")
+            continue
+        start = time.perf_counter()
+        try:
+            report = report_file(path, match_column=match_column, samples=samples)
+        except (OSError, ValueError) as e:
+            print(f"{path}: error reading file: {e}")
+            text += [f"{'='*20} {path} {'='*20}", f"Erro ao ler o arquivo: {e}", ""]
+            continue
+        elapsed = time.perf_counter() - start
+        reports[path] = report.to_dict()
+        text += report.text_lines() + [""]
+        matches = f", {report.matches:,} matches" if report.match_column else ""
+        print(f"{path}: {report.rows:,} rows{matches} ({elapsed:.2f}s)")
+
+    with open(f"{output}.txt", 'w', encoding='utf-8') as f:
+        f.write('\n'.join(text))
+    with open(f"{output}.json", 'w', encoding='utf-8') as f:
+        json.dump(reports, f, indent=2, ensure_ascii=False, default=str)
+    print(f"Reports: {output}.txt, {output}.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-pass report of result and base files")
+    parser.add_argument('files', nargs='*', help="tables to report (.xlsx, .csv, .parquet or .feather); "
+                                                 "default: the files of the former verify/inspect scripts")
+    parser.add_argument('--output', default=REPORT_FILE, help="report name, without extension (.txt and .json)")
+    parser.add_argument('--match-column', help="column that is filled on matched rows "
+                                               "(default: CÓDIGO RHC or CÓDIGO HCM)")
+    parser.add_argument('--samples', type=int, default=SAMPLE_ROWS, help="rows kept per sample")
+    args = parser.parse_args()
+    report_results(args.files, args.output, args.match_column, args.samples)
@@ -0,0 +1,13 @@
+"""
+Núcleo compartilhado do Sistema de Matching Farmacêutico
+(usado pelo app Streamlit, pela interface Tkinter e pelos scripts de linha de comando).
+"""
+
+from saneamento.normalization import (
+    PHARMACEUTICAL_SYNONYMS,
+    build_normalizer,
+    compile_synonyms,
+    normalize_pharmaceutical_text,
+)
+from saneamento.matcher import Candidate, MatchResult, Matcher
+from saneamento.store import ResultStore
@@ -0,0 +1,497 @@
+"""
+Motor de matching em lote (NumPy)
+Guarda o catálogo RHC como arrays (CSR de token ids, ids de conjuntos de
+concentração e de marca) e calcula os termos baratos do score para todos os
+candidatos de uma consulta de uma vez. A similaridade de texto (ver
+saneamento/similarity.py) só roda nos candidatos cujo limite superior
+(termos baratos + quick_ratio vetorizado) ainda supera o melhor score.
+"""
+
+import heapq
+import json
+from array import array
+from collections import Counter, namedtuple
+from itertools import islice
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from saneamento.blocking import block_id, item_block
+from saneamento.features import preprocess_texts
+from saneamento.readers import dataframe_rows
+from saneamento.similarity import DEFAULT_SIMILARITY, similarity_scorer
+
+MIN_TOKEN_LEN = 3
+
+# Folga no limite superior para não podar por erro de arredondamento
+_BOUND_SLACK = 1e-9
+
+# Pesos do score (os mesmos de calculate_similarity_fast)
+BASIC_WEIGHT = 0.35
+INGREDIENT_WEIGHT = 0.65
+CONCENTRATION_BONUS = 0.15
+CONCENTRATION_PENALTY = 0.15
+BRAND_BONUS = 0.2
+
+# Limites de geração de candidatos: padrão do Matcher, logo de todas as
+# interfaces e da API HTTP (recall de 100% em base_hcm x base_rhc, ver
+# verify_matching.py); best_match() sem eles (None) é exaustivo
+DEFAULT_MAX_DF = 0.1
+DEFAULT_MAX_CANDIDATES = 200
+
+# Item do catálogo ranqueado por best_matches: score final e termos do score
+# (similaridade de texto e overlap de princípio ativo em 0..1; concentração e
+# marca como bônus/penalidade somados ao score)
+ScoredCandidate = namedtuple('ScoredCandidate', ['position', 'score', 'text', 'ingredient', 'concentration', 'brand'])
+
+# Linhas pré-processadas por vez (em colunas) ao montar o catálogo
+PREPROCESS_CHUNK_SIZE = 1024
+
+
+def _transpose(indptr, indices, n_cols):
+    """CSR (rows x cols) -> CSR (cols x rows), i.e. token -> item postings."""
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    t_indices = rows[order]
+    t_indptr = np.zeros(n_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=n_cols), out=t_indptr[1:])
+    return t_indptr, t_indices
+
+
+def _column_array(values):
+    """List -> NumPy array that np.load() can read back without pickle."""
+    array = np.asarray(values)
+    if array.dtype == object:
+        # Colunas mistas (ex.: códigos numéricos e texto) viram texto
+        array = np.asarray(['' if pd.isna(v) else str(v) for v in values], dtype=str)
+    return array
+
+
+def _char_counts(texts):
+    """(alphabet -> column, counts matrix item x char) for the quick_ratio bound."""
+    alphabet = {ch: i for i, ch in enumerate(sorted(set().union(*texts)))}
+    # Uma contagem nunca passa do tamanho do texto: 1 byte por célula quase sempre basta
+    dtype = np.uint8 if max(map(len, texts), default=0) <= np.iinfo(np.uint8).max else np.int16
+    counts = np.zeros((len(texts), len(alphabet)), dtype=dtype)
+    for i, text in enumerate(texts):
+        for ch, n in Counter(text).items():
+            counts[i, alphabet[ch]] = n
+    return alphabet, counts
+
+
+def _intern(table, value):
+    """Dense id of a hashable value in table (added if new); None/empty -> -1."""
+    return table.setdefault(value, len(table)) if value else -1
+
+
+class BatchMatcher:
+    """
+    Array-backed RHC catalogue that scores every candidate of a query at once.
+
+    Built from the dicts returned by preprocess_texts (with 'result_code' and
+    'result_prod', kept in .codes/.products by position), consumed one at a
+    time: pass a generator and no per-item dict or set outlives its row. The
+    catalogue keeps no per-product Python objects besides the normalized
+    text, code and product (token ids, concentration/brand ids and
+    character counts live in flat arrays). best_match()
+    returns the same score as looping calculate_similarity_fast over the
+    inverted-index candidates; ties are resolved in favour of the lowest
+    catalogue position.
+
+    Everything is held in plain lists and NumPy arrays, so to_arrays() /
+    from_arrays() round-trip the catalogue through an .npz file without
+    re-normalizing (see saneamento/catalogue.py).
+    """
+
+    # Preenchidos por saneamento.catalogue.load_rhc_catalogue
+    catalogue_key = None
+    from_cache = False
+
+    def __init__(self, items):
+        self.norms, self.codes, self.products = [], [], []
+        self.vocab = {}
+        self.conc_table, self.brand_table = {}, {}
+        vocab = self.vocab
+
+        # Buffers planos (array.array) preenchidos item a item; viram arrays NumPy no fim
+        indexed_indptr, indexed_ids = array('q', [0]), array('i')
+        words_indptr, words_ids = array('q', [0]), array('i')
+        words_len, conc_ids, brand_ids, block_ids = array('i'), array('i'), array('i'), array('b')
+
+        for item in items:
+            self.norms.append(item['norm'])
+            self.codes.append(item['result_code'])
+            self.products.append(item['result_prod'])
+
+            ids = {token: vocab.setdefault(token, len(vocab)) for token in item['tokens']}
+            # Índice invertido: só tokens com 3+ caracteres
+            indexed_ids.extend(sorted(i for token, i in ids.items() if len(token) >= MIN_TOKEN_LEN))
+            indexed_indptr.append(len(indexed_ids))
+            # Primeiras 5 palavras (subconjunto dos tokens) para a contagem de overlap
+            words_ids.extend(sorted(ids[token] for token in item['words_5']))
+            words_indptr.append(len(words_ids))
+            words_len.append(item['words_5_len'])
+
+            conc_ids.append(_intern(self.conc_table, item['concs']))
+            brand_ids.append(_intern(self.brand_table, item['brand']))
+            # Bloco de categoria (saneamento/blocking.py), -1 = indefinido
+            block_ids.append(block_id(item.get('block')))
+
+        self.n_items = len(self.norms)
+        n_tokens = len(vocab)
+
+        # Índice invertido como CSR token -> itens
+        self.index_indptr, self.index_items = _transpose(
+            np.frombuffer(indexed_indptr, dtype=np.int64), np.frombuffer(indexed_ids, dtype=np.int32), n_tokens)
+
+        # Primeiras 5 palavras: CSR item -> tokens (a transposta sai em _derive_arrays)
+        self.words_indptr = np.array(words_indptr, dtype=np.int64)
+        self.words_ids = np.array(words_ids, dtype=np.int32)
+        self.words_len = np.array(words_len, dtype=np.int32)
+
+        self.conc_ids = np.array(conc_ids, dtype=np.int32)
+        self.brand_ids = np.array(brand_ids, dtype=np.int32)
+        self.block_ids = np.array(block_ids, dtype=np.int8)
+
+        # Contagem de caracteres por item: limite quick_ratio da similaridade de texto
+        self.alphabet, self.char_counts = _char_counts(self.norms)
+        self._derive_arrays()
+
+    def _derive_arrays(self):
+        """Arrays computed from the stored ones (not saved in the catalogue file)."""
+        n_tokens = len(self.vocab)
+        self.words_t_indptr, self.words_t_items = _transpose(self.words_indptr, self.words_ids, n_tokens)
+        self.norm_len = self.char_counts.sum(axis=1, dtype=np.int32)
+
+        # Frequência de documento de cada token indexado e IDF suavizado
+        self.doc_freq = np.diff(self.index_indptr)
+        self.idf = np.log((1 + self.n_items) / (1 + self.doc_freq)) + 1
+
+    def __len__(self):
+        return self.n_items
+
+    def to_arrays(self):
+        """Flat dict of NumPy arrays holding the whole catalogue (np.savez-ready)."""
+        tokens = sorted(self.vocab, key=self.vocab.get)
+        concs = sorted(self.conc_table, key=self.conc_table.get)
+        brands = sorted(self.brand_table, key=self.brand_table.get)
+        return {
+            'norms': np.asarray(self.norms, dtype=str),
+            'codes': _column_array(self.codes),
+            'products': _column_array(self.products),
+            'tokens': np.asarray(tokens, dtype=str),
+            'index_indptr': self.index_indptr,
+            'index_items': self.index_items,
+            'words_indptr': self.words_indptr,
+            'words_ids': self.words_ids,
+            'words_len': self.words_len,
+            'conc_ids': self.conc_ids,
+            'conc_table': np.asarray([json.dumps(sorted(c)) for c in concs], dtype=str),
+            'brand_ids': self.brand_ids,
+            'brand_table': np.asarray(brands, dtype=str),
+            'block_ids': self.block_ids,
+            'alphabet': np.asarray(''.join(sorted(self.alphabet, key=self.alphabet.get))),
+            'char_counts': self.char_counts,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuilds a matcher from to_arrays() output (e.g. an np.load() result)."""
+        matcher = cls.__new__(cls)
+        matcher.norms = arrays['norms'].tolist()
+        matcher.codes = arrays['codes'].tolist()
+        matcher.products = arrays['products'].tolist()
+        matcher.n_items = len(matcher.norms)
+
+        matcher.vocab = {token: i for i, token in enumerate(arrays['tokens'].tolist())}
+        matcher.index_indptr = arrays['index_indptr']
+        matcher.index_items = arrays['index_items']
+        matcher.words_indptr = arrays['words_indptr']
+        matcher.words_ids = arrays['words_ids']
+        matcher.words_len = arrays['words_len']
+
+        matcher.conc_ids = arrays['conc_ids']
+        matcher.conc_table = {
+            frozenset(map(tuple, json.loads(c))): i for i, c in enumerate(arrays['conc_table'].tolist())
+        }
+        matcher.brand_ids = arrays['brand_ids']
+        matcher.brand_table = {brand: i for i, brand in enumerate(arrays['brand_table'].tolist())}
+        matcher.block_ids = arrays['block_ids']
+
+        matcher.alphabet = {ch: i for i, ch in enumerate(arrays['alphabet'].item())}
+        matcher.char_counts = arrays['char_counts']
+        matcher._derive_arrays()
+        return matcher
+
+    @property
+    def n_indexed_tokens(self):
+        """Number of distinct tokens with a non-empty posting list."""
+        return int(np.count_nonzero(self.doc_freq))
+
+    def _token_ids(self, tokens, min_len=0):
+        vocab = self.vocab
+        return [vocab[t] for t in tokens if len(t) >= min_len and t in vocab]
+
+    def _postings(self, indptr, values, token_ids):
+        if not token_ids:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate([values[indptr[t]:indptr[t + 1]] for t in token_ids])
+
+    def candidates(self, query, max_df=None, max_candidates=None, blocking=False, block_fallback=True,
+                   stats=None):
+        """
+        Catalogue positions (ascending) sharing at least one indexed token
+        with the query.
+
+        max_df drops query tokens found in more than max_df items (a fraction
+        of the catalogue when < 1, an item count otherwise), unless every
+        token of the query is that common. max_candidates keeps only the
+        candidates with the highest summed IDF of the shared tokens (ties
+        go to the lower position).
+
+        With blocking, only items in the query's block (query['block']) or
+        with an undefined block are kept; if that leaves nothing and
+        block_fallback is set, the unblocked candidates are used. stats
+        (a Counter) gets 'blocked' (candidates removed) and 'block_fallback'.
+        """
+        ids = self._token_ids(query['tokens'], MIN_TOKEN_LEN)
+        if max_df is not None:
+            ceiling = max_df * self.n_items if max_df < 1 else max_df
+            ids = [t for t in ids if self.doc_freq[t] <= ceiling] or ids
+        postings = self._postings(self.index_indptr, self.index_items, ids)
+        if max_candidates is None:
+            candidates = np.unique(postings)
+        else:
+            candidates, inverse = np.unique(postings, return_inverse=True)
+            weights = np.repeat(self.idf[ids], self.doc_freq[ids])
+            idf_overlap = np.bincount(inverse, weights=weights, minlength=len(candidates))
+
+        query_block = block_id(query.get('block'))
+        if blocking and query_block >= 0 and len(candidates):
+            cand_blocks = self.block_ids[candidates]
+            compatible = (cand_blocks == query_block) | (cand_blocks < 0)
+            if compatible.any() or not block_fallback:
+                if stats is not None:
+                    stats['blocked'] += int(len(candidates) - np.count_nonzero(compatible))
+                candidates = candidates[compatible]
+                if max_candidates is not None:
+                    idf_overlap = idf_overlap[compatible]
+            elif stats is not None:
+                stats['block_fallback'] += 1
+
+        if max_candidates is None or len(candidates) <= max_candidates:
+            return candidates
+        top = np.lexsort((candidates, -idf_overlap))[:max_candidates]
+        return np.sort(candidates[top])
+
+    def partial_scores(self, query, candidates):
+        """
+        Score terms that do not need the text similarity, for all candidates:
+        (ingredient overlap, concentration bonus, brand bonus, concentration penalty).
+        """
+        word_ids = self._token_ids(query['words_5'])
+        hits = self._postings(self.words_t_indptr, self.words_t_items, word_ids)
+        intersection = np.bincount(hits, minlength=self.n_items)[candidates]
+        overlap = intersection / np.maximum(self.words_len[candidates], query['words_5_len'])
+
+        conc_bonus = np.zeros(len(candidates))
+        conc_penalty = np.zeros(len(candidates))
+        if query['concs']:
+            cand_concs = self.conc_ids[candidates]
+            query_conc = self.conc_table.get(query['concs'], -2)
+            has_conc = cand_concs >= 0
+            conc_bonus[has_conc & (cand_concs == query_conc)] = CONCENTRATION_BONUS
+            conc_penalty[has_conc & (cand_concs != query_conc)] = CONCENTRATION_PENALTY
+
+        brand_bonus = np.zeros(len(candidates))
+        if query['brand']:
+            query_brand = self.brand_table.get(query['brand'], -2)
+            brand_bonus[self.brand_ids[candidates] == query_brand] = BRAND_BONUS
+
+        return overlap, conc_bonus, brand_bonus, conc_penalty
+
+    def quick_ratios(self, query, candidates):
+        """
+        difflib quick_ratio() of the query against every candidate: an upper
+        bound of both the 'ratio' and 'indel' similarities.
+        """
+        query_counts = np.zeros(len(self.alphabet), dtype=np.int16)
+        alphabet = self.alphabet
+        for ch, n in Counter(query['norm']).items():
+            if ch in alphabet:
+                query_counts[alphabet[ch]] = n
+        matches = np.minimum(self.char_counts[candidates], query_counts).sum(axis=1)
+        total = self.norm_len[candidates] + len(query['norm'])
+        ratios = np.ones(len(candidates))
+        np.divide(2.0 * matches, total, out=ratios, where=total > 0)
+        return ratios
+
+    def _ranked_candidates(self, query, stats, **candidate_options):
+        """
+        (candidates, score terms, upper bounds, visiting order) of a query,
+        or None without candidates; adds the candidate counters and timers
+        to stats.
+        """
+        start = perf_counter()
+        candidates = self.candidates(query, stats=stats, **candidate_options)
+        if stats is not None:
+            stats['queries'] += 1
+            stats['candidates'] += len(candidates)
+            stats['t_candidates'] += perf_counter() - start
+        if not len(candidates):
+            return None
+        start = perf_counter()
+
+        terms = self.partial_scores(query, candidates)
+        overlap, conc_bonus, brand_bonus, conc_penalty = terms
+        cheap = overlap * INGREDIENT_WEIGHT + conc_bonus + brand_bonus - conc_penalty
+        bound = np.minimum(cheap + BASIC_WEIGHT * self.quick_ratios(query, candidates), 1.0) + _BOUND_SLACK
+        order = np.lexsort((candidates, -bound))
+
+        if stats is not None:
+            stats['t_bounds'] += perf_counter() - start
+        return candidates, terms, bound, order
+
+    def best_match(self, query, min_score=0, max_scored=None, similarity=DEFAULT_SIMILARITY, stats=None,
+                   max_df=None, max_candidates=None, blocking=False, block_fallback=True):
+        """
+        Returns (position, score) of the best catalogue item, or (None, 0).
+
+        Candidates are visited by decreasing upper bound (cheap terms plus the
+        quick_ratio bound of the text similarity) and the scan stops as soon
+        as the bound can no longer reach min_score or beat the best score so
+        far (so a result below min_score is only a partial best). With
+        max_scored, at most max_scored similarity calls are made (approximate
+        mode). similarity names a backend of saneamento.similarity. If stats
+        (a Counter) is given, 'queries', 'candidates' and 'scored' (pairs that
+        needed the full similarity) are added to it; pruned = candidates - scored.
+        It also accumulates the seconds spent per step in 't_candidates',
+        't_bounds' and 't_similarity' (see saneamento.instrumentation).
+        max_df, max_candidates, blocking and block_fallback restrict candidate
+        generation (see candidates()).
+        """
+        ranked = self._ranked_candidates(query, stats, max_df=max_df, max_candidates=max_candidates,
+                                         blocking=blocking, block_fallback=block_fallback)
+        if ranked is None:
+            return None, 0
+        candidates, (overlap, conc_bonus, brand_bonus, conc_penalty), bound, order = ranked
+        start = perf_counter()
+
+        best_pos, best_score = None, 0
+        score_text = similarity_scorer(similarity, query['norm'])
+        norms = self.norms
+        scored = 0
+        for rank, i in enumerate(order.tolist()):
+            if bound[i] < max(best_score, min_score) or (max_scored is not None and rank >= max_scored):
+                break
+            pos = int(candidates[i])
+            basic_score = score_text(norms[pos])
+            scored += 1
+            # Mesma ordem de operações de calculate_similarity_fast (score bit a bit igual)
+            final_score = (
+                (basic_score * BASIC_WEIGHT) +
+                (float(overlap[i]) * INGREDIENT_WEIGHT) +
+                float(conc_bonus[i]) +
+                float(brand_bonus[i]) -
+                float(conc_penalty[i])
+            )
+            score = max(0, min(1, final_score))
+            if score > best_score or (score == best_score and best_pos is not None and pos < best_pos):
+                best_pos, best_score = pos, score
+
+        if stats is not None:
+            stats['scored'] += scored
+            stats['t_similarity'] += perf_counter() - start
+        return best_pos, best_score
+
+    def best_matches(self, query, k, min_score=0, similarity=DEFAULT_SIMILARITY, stats=None,
+                     max_df=None, max_candidates=None, blocking=False, block_fallback=True):
+        """
+        The k best catalogue items scoring at least min_score, as
+        ScoredCandidate tuples (score and per-term breakdown), best first;
+        ties go to the lowest position, so the first entry is best_match()'s
+        result whenever that reaches min_score.
+
+        Same single scan as best_match(), keeping a bounded heap of the k
+        best: once it is full, the scan stops when the upper bound can no
+        longer beat its k-th score. Options and stats as in best_match().
+        """
+        ranked = self._ranked_candidates(query, stats, max_df=max_df, max_candidates=max_candidates,
+                                         blocking=blocking, block_fallback=block_fallback)
+        if ranked is None:
+            return []
+        candidates, (overlap, conc_bonus, brand_bonus, conc_penalty), bound, order = ranked
+        start = perf_counter()
+
+        # Heap mínimo de (score, -posição, ...): o topo é o k-ésimo melhor
+        heap = []
+        score_text = similarity_scorer(similarity, query['norm'])
+        norms = self.norms
+        scored = 0
+        for i in order.tolist():
+            if bound[i] < (max(heap[0][0], min_score) if len(heap) == k else min_score):
+                break
+            pos = int(candidates[i])
+            basic_score = score_text(norms[pos])
+            scored += 1
+            final_score = (
+                (basic_score * BASIC_WEIGHT) +
+                (float(overlap[i]) * INGREDIENT_WEIGHT) +
+                float(conc_bonus[i]) +
+                float(brand_bonus[i]) -
+                float(conc_penalty[i])
+            )
+            score = max(0, min(1, final_score))
+            if score < min_score:
+                continue
+            entry = (score, -pos, basic_score, float(overlap[i]), float(conc_bonus[i] - conc_penalty[i]),
+                     float(brand_bonus[i]))
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heappushpop(heap, entry)
+
+        if stats is not None:
+            stats['scored'] += scored
+            stats['t_similarity'] += perf_counter() - start
+        return [ScoredCandidate(-neg_pos, score, text, ingredient, concentration, brand)
+                for score, neg_pos, text, ingredient, concentration, brand in sorted(heap, reverse=True)]
+
+
+def query_key(query):
+    """
+    Everything best_match and best_matches read from a query (normalized
+    text, concentrations, brand, block): queries with equal keys get equal
+    results.
+    """
+    return query['norm'], query['concs'], query['brand'], query.get('block')
+
+
+def build_matcher_from_rows(rows):
+    """
+    Pre-processes ProductRow(code, product, especie) tuples (e.g. streamed
+    by saneamento.readers.ProductSheet) into a BatchMatcher. The category
+    block comes from especie when given, otherwise from the text. Rows are
+    pre-processed column-wise in chunks of PREPROCESS_CHUNK_SIZE, so only
+    the compact catalogue (and one chunk of dicts) is kept.
+    """
+    def items():
+        rows_iter = iter(rows)
+        while chunk := list(islice(rows_iter, PREPROCESS_CHUNK_SIZE)):
+            for row, item in zip(chunk, preprocess_texts([row.product for row in chunk])):
+                item['block'] = item_block(item, row.especie)
+                # Store essential result fields cleanly
+                item['result_code'] = row.code
+                item['result_prod'] = row.product
+                yield item
+
+    return BatchMatcher(items())
+
+
+def build_rhc_matcher(df):
+    """
+    Pre-processes an RHC DataFrame (CÓDIGO and PRODUTO by name or the first
+    two columns, optional ESPÉCIE) into a BatchMatcher.
+    """
+    return build_matcher_from_rows(dataframe_rows(df))
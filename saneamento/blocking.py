@@ -0,0 +1,86 @@
+"""
+Blocagem por categoria de produto
+Cada item recebe um bloco: MEDICAMENTO, MATERIAL, NUTRICAO ou OUTROS. O bloco
+vem da coluna ESPÉCIE quando a planilha a tem (ex.: "1 - DROGAS E
+MEDICAMENTOS", "34 - OPME - RHC") e, sem ela, é inferido do texto pelas
+formas farmacêuticas, unidades de concentração e termos típicos de material.
+Sem evidência suficiente o bloco fica indefinido e o item é compatível com
+qualquer bloco.
+"""
+
+import pandas as pd
+
+BLOCKS = ('MEDICAMENTO', 'MATERIAL', 'NUTRICAO', 'OUTROS')
+
+# Trechos da ESPÉCIE -> bloco (verificados nesta ordem)
+ESPECIE_BLOCKS = [
+    ('MEDICAMENTO', 'MEDICAMENTO'),
+    ('DROGAS', 'MEDICAMENTO'),
+    ('GASES MEDICINAIS', 'MEDICAMENTO'),
+    ('MATERIAL MEDICO', 'MATERIAL'),
+    ('OPME', 'MATERIAL'),
+    ('KIT', 'MATERIAL'),
+    ('EQUIPAMENTOS MEDI', 'MATERIAL'),
+    ('NUTRICAO', 'NUTRICAO'),
+    ('DIETA', 'NUTRICAO'),
+    ('ALIMENTICIOS', 'NUTRICAO'),
+]
+
+# Formas farmacêuticas e termos exclusivos de medicamentos, como o normalizador os deixa
+# (CLORIDRATO vira HCL e SODICO vira SODIO antes da blocagem)
+MEDICINE_TOKENS = frozenset({
+    'COMPRIMIDO', 'CPD', 'CAPSULA', 'DRAGEA', 'DRAG', 'AMPOLA', 'COLIRIO', 'GOTAS', 'GTS',
+    'XAROPE', 'SUSPENSAO', 'POMADA', 'ELIXIR', 'SUPOSITORIO', 'INJETAVEL', 'HCL', 'MG', 'MCG',
+    'UI', 'SODICA', 'SODIO', 'DICLORIDRATO', 'ACETATO', 'VITAMINA', 'INSULINA', 'IMUNOGLOBULINA',
+})
+
+# Unidades de concentração (como escritas) que indicam princípio ativo (ML e G também aparecem em material)
+MEDICINE_UNITS = ('MG', 'MCG', 'UI')
+
+# Termos típicos de material (texto normalizado, sem acentos)
+MATERIAL_TOKENS = frozenset({
+    'FIO', 'CATETER', 'CANULA', 'SONDA', 'AGULHA', 'BALAO', 'GUIA', 'TRAQUEOSTOMIA',
+    'ENDOTRAQUEAL', 'DESCARTAVEL', 'CURATIVO', 'DRENO', 'STENT', 'CATGUT', 'PARAFUSO', 'VICRYL',
+    'MARCADOR', 'PLACA', 'COLETOR', 'PINCA', 'FOLEY', 'LAMINA', 'GRAMPEADOR', 'PROLENE',
+    'MONONYLON', 'NYLON', 'LUVA', 'MASCARA', 'ELETRODO', 'INTRODUTOR', 'ESCOVA', 'EQUIPO', 'GAZE',
+    'COMPRESSA', 'ATADURA', 'ESTERIL', 'CIRURGICO', 'BIOPSIA', 'ASPIRACAO', 'SILICONE', 'CONSIG',
+})
+
+
+def especie_block(especie):
+    """Block of an ESPÉCIE value, or None when empty."""
+    if especie is None or pd.isna(especie) or not str(especie).strip():
+        return None
+    text = str(especie).upper()
+    for fragment, block in ESPECIE_BLOCKS:
+        if fragment in text:
+            return block
+    return 'OUTROS'
+
+
+def infer_block(item):
+    """
+    Medicine vs. material from a preprocess_item() dict: dosage forms and
+    active-ingredient concentration units against typical material terms.
+    Returns None when the evidence is tied.
+    """
+    tokens = item['tokens']
+    medicine = len(tokens & MEDICINE_TOKENS)
+    medicine += any(unit in MEDICINE_UNITS for unit in item['conc_units'])
+    material = len(tokens & MATERIAL_TOKENS)
+    if medicine > material:
+        return 'MEDICAMENTO'
+    if material > medicine:
+        return 'MATERIAL'
+    return None
+
+
+def item_block(item, especie=None):
+    """Block from the ESPÉCIE value when given, otherwise inferred from the text."""
+    return especie_block(especie) or infer_block(item)
+
+
+def block_id(block):
+    """Position in BLOCKS, -1 for an undefined block."""
+    return BLOCKS.index(block) if block is not None else -1
+
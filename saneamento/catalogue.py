@@ -0,0 +1,179 @@
+"""
+Catálogo RHC persistido em disco
+O catálogo pré-processado (textos normalizados, token ids, concentrações,
+marcas e índice invertido) é gravado como .npz, identificado pelo hash do
+conteúdo da planilha RHC e pelas regras de pré-processamento. Os pontos de
+entrada carregam o arquivo em milissegundos; se a planilha ou as regras
+mudarem, a chave muda e o catálogo é reconstruído automaticamente. A tabela
+RHC em si (todas as colunas, para o de-para) também é convertida uma vez
+para Feather, pela mesma chave de conteúdo, e relida em milissegundos.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from saneamento.batch import MIN_TOKEN_LEN, BatchMatcher, build_matcher_from_rows
+from saneamento.blocking import ESPECIE_BLOCKS, MATERIAL_TOKENS, MEDICINE_TOKENS, MEDICINE_UNITS
+from saneamento.features import CANONICAL_UNITS, CONCENTRATION_PATTERN, CONCENTRATION_UNITS
+from saneamento.normalization import PHARMACEUTICAL_SYNONYMS
+from saneamento.readers import open_products, pyarrow, read_table, table_format
+
+# Incrementar ao mudar o layout dos arrays ou o código de pré-processamento
+# (mudanças nas tabelas de sinônimos/concentrações/blocagem já mudam a chave sozinhas)
+CATALOGUE_FORMAT = 4
+
+CACHE_DIR = os.environ.get(
+    'SANEAMENTO_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.catalogo_rhc'),
+)
+
+# Catálogos mantidos em disco (os menos usados recentemente são apagados)
+MAX_CACHED = 20
+
+
+def rules_fingerprint():
+    """Hash of everything that changes the preprocessing (tables, patterns, format)."""
+    rules = (
+        CATALOGUE_FORMAT, MIN_TOKEN_LEN, list(PHARMACEUTICAL_SYNONYMS.items()), CONCENTRATION_PATTERN,
+        list(CONCENTRATION_UNITS.items()), list(CANONICAL_UNITS.items()),
+        ESPECIE_BLOCKS, sorted(MEDICINE_TOKENS), MEDICINE_UNITS, sorted(MATERIAL_TOKENS),
+    )
+    return hashlib.sha256(repr(rules).encode('utf-8')).hexdigest()
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def catalogue_key(data):
+    """Content hash of an RHC workbook (bytes) combined with the preprocessing rules."""
+    digest = hashlib.sha256(data)
+    digest.update(rules_fingerprint().encode('ascii'))
+    return digest.hexdigest()[:32]
+
+
+def catalogue_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, f"rhc_{key}.npz")
+
+
+def save_catalogue(matcher, path):
+    """Writes matcher.to_arrays() to path atomically (temp file + rename)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, format=np.asarray(CATALOGUE_FORMAT), **matcher.to_arrays())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_catalogue(path):
+    """Loads a saved catalogue, or returns None if it is missing, stale or unreadable."""
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            if int(arrays['format']) != CATALOGUE_FORMAT:
+                return None
+            return BatchMatcher.from_arrays(arrays)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _prune(cache_dir, keep, pattern='rhc_*.npz'):
+    paths = sorted(glob.glob(os.path.join(cache_dir, pattern)), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_rhc_catalogue(source, cache_dir=None):
+    """
+    Returns the BatchMatcher for an RHC workbook (or CSV, Parquet, Feather
+    table), from the on-disk catalogue when one exists for its content,
+    otherwise building and saving it.
+
+    source is a path, raw bytes or a file-like object (e.g. a Streamlit
+    upload). When building, the sheet is streamed (CÓDIGO, PRODUTO and
+    ESPÉCIE only) and its header validated by saneamento.readers. The
+    returned matcher carries the key in .catalogue_key and whether it came
+    from disk in .from_cache.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    data = _read_bytes(source)
+    key = catalogue_key(data)
+    path = catalogue_path(key, cache_dir)
+
+    matcher = load_catalogue(path)
+    if matcher is not None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        from_cache = True
+    else:
+        matcher = build_matcher_from_rows(open_products(data, table_format(source)))
+        from_cache = False
+        try:
+            save_catalogue(matcher, path)
+            _prune(cache_dir, MAX_CACHED)
+        except OSError:
+            # Sem permissão de escrita: segue com o catálogo em memória
+            pass
+
+    matcher.catalogue_key = key
+    matcher.from_cache = from_cache
+    return matcher
+
+
+def table_cache_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, f"tabela_{key}.feather")
+
+
+def load_rhc_table(source, cache_dir=None):
+    """
+    The RHC table as a DataFrame (all columns, as read_table reads it),
+    from its Feather copy when one exists for the content, otherwise read
+    and converted once. source is a path (any table_format), raw bytes or a
+    file-like object. Without pyarrow, or for columns Arrow can't store, it
+    is simply read every time.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    fmt = table_format(source)
+    data = _read_bytes(source)
+    if pyarrow is None or fmt == 'feather':
+        return read_table(data, fmt)
+    path = table_cache_path(hashlib.sha256(data).hexdigest()[:32], cache_dir)
+    try:
+        df = read_table(path, 'feather')
+        os.utime(path)
+        return df
+    except (OSError, pyarrow.ArrowInvalid):
+        pass
+
+    df = read_table(data, fmt)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+        _prune(cache_dir, MAX_CACHED, 'tabela_*.feather')
+    except (OSError, pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # Sem permissão de escrita ou tipos mistos numa coluna: segue sem a cópia
+        pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
@@ -0,0 +1,197 @@
+"""
+De-para por nome exato (chave normalizada)
+Usado pelos scripts de de-para (create_combined_depara.py,
+match_hcm_to_rhc.py, match_products.py, app.py e saneamento_app.py): a
+chave é o PRODUTO sem acentos, sem espaços nas pontas e em maiúsculas. Os
+acentos saem com str.translate sobre a coluna inteira (tabela preenchida
+caractere a caractere na primeira ocorrência, com o mesmo resultado do NFKD
+sem marcas combinantes), e a junção é um hash join sobre as chaves, sem
+copiar os DataFrames de entrada. O resultado tem sempre uma linha por linha
+da base: itens RHC com a mesma chave não multiplicam linhas (fica o
+primeiro, ou todos os códigos na mesma célula) e vão para a planilha de
+conflitos. depara_files() é o corpo comum dos scripts: lê, valida, junta,
+mostra as contagens e grava.
+"""
+
+import os
+import unicodedata
+from collections import Counter, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from saneamento.catalogue import load_rhc_table
+from saneamento.readers import read_table
+from saneamento.writers import write_table
+
+RHC_COLUMNS = {'CÓDIGO': 'CÓDIGO RHC', 'PRODUTO': 'PRODUTO RHC'}
+
+# Itens RHC com a mesma chave: o que vai para a linha da base
+DUPLICATE_POLICIES = {
+    'first': "Primeiro item do catálogo",
+    'list': "Todos os itens, na mesma célula",
+}
+
+# Separador dos valores na política 'list'
+LIST_SEPARATOR = ' | '
+
+# Planilha de conflitos: uma linha por item RHC de chave repetida, agrupados pela chave
+CONFLICT_COLUMNS = ['CHAVE', 'CÓDIGO RHC', 'PRODUTO RHC', 'ESCOLHIDO', 'LINHAS AFETADAS']
+
+# Resultado de depara_join: o de-para, os conflitos e as contagens (ver depara_join)
+DeparaJoin = namedtuple('DeparaJoin', ['result', 'conflicts', 'stats'])
+
+
+class _FoldTable(dict):
+    """str.translate table: code point -> NFKD decomposition without combining marks, filled on first use."""
+
+    def __missing__(self, code):
+        decomposed = unicodedata.normalize('NFKD', chr(code))
+        folded = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+        self[code] = folded
+        return folded
+
+
+_FOLD = _FoldTable()
+
+
+def fold_keys(values):
+    """
+    Match keys of a whole column (Series or iterable): accents removed,
+    stripped, upper-cased; '' for empty cells. Same keys as
+    normalize_text, one translate + strip + upper per value.
+    """
+    fold = _FOLD
+    return ['' if value is None or (not isinstance(value, str) and pd.isna(value))
+            else str(value).translate(fold).strip().upper() for value in values]
+
+
+def normalize_text(text):
+    """Normalize text for matching: remove accents, uppercase and strip whitespace."""
+    return fold_keys([text])[0]
+
+
+def _first_positions(right_index, left_keys):
+    # Posição do primeiro item de cada chave da esquerda na direita (-1 sem par ou chave vazia)
+    first = ~right_index.duplicated(keep='first')
+    found = right_index[first].get_indexer(left_keys)
+    positions = np.flatnonzero(first)[found]
+    return np.where((found >= 0) & (np.asarray(left_keys, dtype=object) != ''), positions, -1), first
+
+
+def _joined(values):
+    return LIST_SEPARATOR.join(str(value) for value in values if not pd.isna(value))
+
+
+def depara_join(left, right, key_column='PRODUTO', right_columns=RHC_COLUMNS, duplicates='first'):
+    """
+    left with right_columns of right appended (renamed, e.g. CÓDIGO ->
+    CÓDIGO RHC) where the normalized key_column values are equal, one row
+    per left row in left order; unmatched rows get NaN. When several right
+    rows share a key, duplicates ('first' or 'list', see
+    DUPLICATE_POLICIES) picks the first one or joins all their values with
+    LIST_SEPARATOR. Returns a DeparaJoin: the result, the conflicts
+    (CONFLICT_COLUMNS, one row per right row of a repeated key) and a
+    Counter with 'rows', 'matches', 'rhc_rows', 'duplicate_keys',
+    'duplicate_rows' (right rows left out by 'first') and 'ambiguous_rows'
+    (left rows whose key is repeated on the right).
+    """
+    if duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f"Política de chaves repetidas desconhecida: {duplicates!r}. "
+                         f"Opções: {', '.join(DUPLICATE_POLICIES)}")
+    left_keys = fold_keys(left[key_column])
+    right_index = pd.Index(fold_keys(right[key_column]))
+    right_pos, first = _first_positions(right_index, left_keys)
+
+    # Chaves repetidas na RHC (vazias não contam: nunca casam); sem repetidas, nada a contar
+    if first.all():
+        repeated = np.zeros(len(right_index), dtype=bool)
+    else:
+        repeated = right_index.duplicated(keep=False) & (right_index != '')
+    repeated_keys = right_index[repeated]
+    left_counts = pd.Index(left_keys).value_counts() if repeated.any() else pd.Series(dtype=np.int64)
+
+    # Cópia rasa da base: só as colunas RHC são acrescentadas
+    result = left.reset_index(drop=True)
+    for source, target in right_columns.items():
+        values = right[source].reset_index(drop=True)
+        if duplicates == 'list' and repeated.any():
+            # Códigos como objetos: os únicos não viram float ao lado dos textos 'a | b'
+            column = values.astype(object).reindex(right_pos).to_numpy(copy=True)
+            joined = values[repeated].groupby(np.asarray(repeated_keys, dtype=object), sort=False).agg(_joined)
+            hit = joined.index.get_indexer(left_keys)
+            column[hit >= 0] = joined.to_numpy()[hit[hit >= 0]]
+        else:
+            column = values.reindex(right_pos).to_numpy()
+        result[target] = column
+
+    conflicts = pd.DataFrame({
+        'CHAVE': repeated_keys,
+        **{target: right[source].to_numpy()[repeated] for source, target in right_columns.items()},
+        'ESCOLHIDO': np.where(first[repeated] | (duplicates == 'list'), 'SIM', 'NÃO'),
+        'LINHAS AFETADAS': left_counts.reindex(repeated_keys, fill_value=0).to_numpy(),
+    }).sort_values('CHAVE', kind='stable', ignore_index=True)
+
+    n_keys = repeated_keys.nunique()
+    stats = Counter({
+        'rows': len(result),
+        'matches': int((right_pos >= 0).sum()),
+        'rhc_rows': len(right),
+        'duplicate_keys': n_keys,
+        'duplicate_rows': int(repeated.sum()) - n_keys,
+        'ambiguous_rows': int(left_counts.reindex(repeated_keys.unique(), fill_value=0).sum()),
+    })
+    return DeparaJoin(result, conflicts, stats)
+
+
+def exact_depara(left, right, key_column='PRODUTO', right_columns=RHC_COLUMNS, duplicates='first'):
+    """The de-para DataFrame of depara_join (one row per left row)."""
+    return depara_join(left, right, key_column, right_columns, duplicates).result
+
+
+def depara_files(base_path, rhc_path, output_path, duplicates='first'):
+    """
+    De-para of two files by exact normalized PRODUTO: reads base_path and
+    rhc_path (both need CÓDIGO and PRODUTO), runs depara_join, prints the
+    counts and writes the result to output_path with the conflicts on a
+    Conflitos sheet. Inputs and output may be .xlsx, .csv, .parquet or
+    .feather (by extension). Returns the DeparaJoin.
+    """
+    try:
+        print("Loading files...")
+        # Depois da primeira execução a tabela RHC vem da cópia colunar, sem reler o Excel
+        df_base = read_table(base_path)
+        df_rhc = load_rhc_table(rhc_path)
+    except Exception as e:
+        print(f"Error reading input files: {e}")
+        raise
+
+    required = {'CÓDIGO', 'PRODUTO'}
+    for path, df in ((base_path, df_base), (rhc_path, df_rhc)):
+        if not required.issubset(df.columns):
+            raise KeyError(f"Missing columns in {path}: {required - set(df.columns)}")
+        print(f"Loaded {os.path.splitext(os.path.basename(path))[0]}: {df.shape}")
+
+    # Hash join sobre as chaves dobradas coluna a coluna, sem copiar as entradas
+    join = depara_join(df_base, df_rhc, duplicates=duplicates)
+    stats = join.stats
+
+    print("\nMatching completed!")
+    print(f"Found {stats['matches']} matches out of {stats['rows']} rows.")
+    if stats['rows']:
+        print(f"Match rate: {stats['matches'] / stats['rows'] * 100:.2f}%")
+    if stats['duplicate_keys']:
+        print(f"Repeated RHC names: {stats['duplicate_keys']} "
+              f"({stats['duplicate_rows']} extra RHC rows, {stats['ambiguous_rows']} rows affected) "
+              "- listed in Conflitos")
+
+    try:
+        print(f"\nSaving to {output_path}...")
+        # Conflitos numa planilha à parte (ou num arquivo _conflitos ao lado, fora do .xlsx)
+        write_table(join.result, output_path, sheets={'Conflitos': join.conflicts} if len(join.conflicts) else None)
+        print("Done!")
+        print(f"Output file: {output_path}")
+    except Exception as e:
+        print(f"Error saving output file: {e}")
+        raise
+    return join
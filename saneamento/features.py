@@ -0,0 +1,209 @@
+"""
+Extração de features e score de similaridade
+Features pré-computadas por produto (texto normalizado, concentrações,
+marca, tokens) e o score rápido usado por todos os motores de matching.
+"""
+
+import re
+from difflib import SequenceMatcher
+from itertools import chain
+
+import pandas as pd
+
+from saneamento.normalization import normalize_pharmaceutical_text
+
+# Grafias de unidade na planilha -> unidade
+CONCENTRATION_UNITS = {
+    'MCG': 'MCG', 'MICROG': 'MCG',
+    'MG': 'MG',
+    'G': 'G', 'GR': 'G', 'GRS': 'G', 'GRAMA': 'G', 'GRAMAS': 'G',
+    'ML': 'ML',
+    'L': 'L', 'LT': 'L', 'LITRO': 'L', 'LITROS': 'L',
+    'UI': 'UI',
+    '%': '%',
+}
+
+# Unidade -> (unidade canônica, fator): 1G == 1000MG, 1L == 1000ML
+CANONICAL_UNITS = {
+    'MCG': ('MG', 0.001), 'MG': ('MG', 1), 'G': ('MG', 1000),
+    'ML': ('ML', 1), 'L': ('ML', 1000),
+    'UI': ('UI', 1), '%': ('%', 1),
+}
+
+# Número com vírgula ou ponto decimal; ponto seguido de grupos de 3 dígitos é
+# separador de milhar (100.000UI)
+_NUMBER = r'(\d{1,3}(?:\.\d{3})+(?![.,]?\d)|\d+(?:[.,]\d+)?)'
+# Unidade inteira: não pode continuar em letra (10 GOTAS não é 10G; 100%SILIC. é 100%)
+_WORD_UNITS = sorted((u for u in CONCENTRATION_UNITS if u.isalpha()), key=len, reverse=True)
+_UNIT = r'(%|(?:' + '|'.join(_WORD_UNITS) + r')(?![^\W\d_]))'
+
+# Valor e unidade, opcionalmente "por" valor e unidade (500MG/5ML, 10MG/ML)
+CONCENTRATION_PATTERN = rf'{_NUMBER}\s*{_UNIT}(?:\s*/\s*{_NUMBER}?\s*{_UNIT})?'
+_CONCENTRATION_RE = re.compile(CONCENTRATION_PATTERN)
+_BRAND_RE = re.compile(r'\(([A-Z]+)\)')
+_DIGIT_RE = re.compile(r'\d')
+
+# Casas decimais mantidas no valor canônico (0.1G -> 100.0MG, sem resíduo de float)
+_VALUE_DIGITS = 6
+
+
+def _quantity(number, unit):
+    """(canonical value, canonical unit) of a matched number and unit spelling."""
+    if ',' in number:
+        number = number.replace('.', '').replace(',', '.')
+    elif number.count('.') > 1 or (number.count('.') == 1 and _is_thousands(number)):
+        number = number.replace('.', '')
+    canonical, factor = CANONICAL_UNITS[CONCENTRATION_UNITS[unit]]
+    return round(float(number) * factor, _VALUE_DIGITS), canonical
+
+
+def _is_thousands(number):
+    integer, _, decimals = number.partition('.')
+    return len(decimals) == 3 and integer[:1] != '0'
+
+
+def parse_concentration(match):
+    """
+    Structured concentrations of a CONCENTRATION_PATTERN match: a tuple of
+    (value, unit) or (value, unit, per_value, per_unit) entries, with the
+    units canonicalized (mass in MG, volume in ML, UI, %).
+
+    A ratio is kept only when the per part has a value in another unit
+    (500MG/5ML). "Per one unit" (10MG/ML) keeps the value alone, since the
+    same product is written both as 10MG/ML 1ML and 10MG 1ML, and a pair
+    in the same unit (1G/0,5G, an association) gives two values.
+    """
+    value, unit, per_value, per_unit = match.groups()
+    quantity = _quantity(value, unit)
+    if per_value is None:
+        return (quantity,)
+    per = _quantity(per_value, per_unit)
+    if per[1] == quantity[1]:
+        return (quantity, per)
+    return (quantity + per,)
+
+
+def extract_concentration(text):
+    """Frozenset of structured concentrations (see parse_concentration) in text."""
+    return frozenset(chain.from_iterable(map(parse_concentration, _CONCENTRATION_RE.finditer(text.upper()))))
+
+def extract_brand_name(text):
+    match = _BRAND_RE.search(text.upper())
+    if match:
+        return match.group(1)
+    return None
+
+
+def extract_concentrations(texts):
+    """
+    (concentrations, source units) of each upper-cased text in a column:
+    the concentrations as in extract_concentration, and the unit of each
+    value as written (after the spelling table, e.g. 'G', 'MCG'), used by
+    the category inference. Texts without a digit skip the regex.
+    """
+    empty = frozenset()
+    finditer = _CONCENTRATION_RE.finditer
+    concs, units = [], []
+    for text in texts:
+        if not _DIGIT_RE.search(text):
+            concs.append(empty)
+            units.append(empty)
+            continue
+        matches = list(finditer(text))
+        concs.append(frozenset(chain.from_iterable(map(parse_concentration, matches))))
+        units.append(frozenset(CONCENTRATION_UNITS[match.group(2)] for match in matches))
+    return concs, units
+
+
+def extract_brand_names(texts):
+    """extract_brand_name for a column of upper-cased texts."""
+    search = _BRAND_RE.search
+    return [(match.group(1) if (match := search(text)) else None) if '(' in text else None for text in texts]
+
+
+def preprocess_texts(texts):
+    """
+    Pre-computes the matching features of a column of product texts at
+    once: the texts are normalized and upper-cased as lists, and the
+    concentration and brand patterns run column-wise. Returns one
+    preprocess_item dict per text (id and row are None); 'concs' is a
+    frozenset of structured concentrations, compared by plain equality.
+    """
+    texts = list(texts)
+    norms = list(map(normalize_pharmaceutical_text, texts))
+    # Células vazias (None/NaN) ou numéricas vindas da planilha
+    uppers = ['' if text is None or pd.isna(text) else str(text).upper() for text in texts]
+
+    concs, conc_units = extract_concentrations(uppers)
+
+    items = []
+    for text, norm_text, conc, units, brand in zip(texts, norms, concs, conc_units, extract_brand_names(uppers)):
+        # Tokens (for indexing) and First 5 words (for active ingredient check)
+        words = norm_text.split()
+        words_5 = set(words[:5])  # Use set for faster intersection O(1) vs O(N)
+        items.append({
+            'id': None,
+            'original': text,
+            'norm': norm_text,
+            'concs': conc,
+            'conc_units': units,
+            'brand': brand,
+            'tokens': set(words),
+            'words_5': words_5,
+            'words_5_len': max(len(words_5), 1),
+            'row': None,
+        })
+    return items
+
+
+def preprocess_item(idx, text, row_data):
+    """
+    Pre-computes all features needed for matching for a single item.
+    Returns a dictionary of features (see preprocess_texts for a column).
+    """
+    item = preprocess_texts([text])[0]
+    item['id'] = idx
+    item['row'] = row_data # Store the full row data for result retrieval
+    return item
+
+
+def calculate_similarity_fast(input_item, candidate_item):
+    """
+    Calculates similarity using pre-computed features. 
+    Much faster than the original function.
+    """
+    # 1. Basic Sequence Matcher (still needed, but on cached normalized strings)
+    # Using quick_ratio() first can be an optimization, but .ratio() is robust
+    basic_score = SequenceMatcher(None, input_item['norm'], candidate_item['norm']).ratio()
+    
+    # 2. Concentrations
+    concentration_penalty = 0
+    concentration_bonus = 0
+    
+    if input_item['concs'] and candidate_item['concs']:
+        if input_item['concs'] == candidate_item['concs']:
+            concentration_bonus = 0.15
+        else:
+            concentration_penalty = 0.15
+            
+    # 3. Active Ingredient (Word Overlap)
+    # Using pre-computed sets
+    intersection = len(input_item['words_5'] & candidate_item['words_5'])
+    # Denom needs max length, we stored input's length, check candidate
+    max_len = max(input_item['words_5_len'], candidate_item['words_5_len'])
+    ingredient_overlap = intersection / max_len
+    
+    # 4. Brand
+    brand_bonus = 0
+    if input_item['brand'] and candidate_item['brand'] and input_item['brand'] == candidate_item['brand']:
+        brand_bonus = 0.2
+        
+    final_score = (
+        (basic_score * 0.35) + 
+        (ingredient_overlap * 0.65) + 
+        concentration_bonus + 
+        brand_bonus - 
+        concentration_penalty
+    )
+    
+    return max(0, min(1, final_score))
@@ -0,0 +1,201 @@
+"""
+Instrumentação do matching
+Tempo de parede por etapa (catálogo RHC, leitura da base, busca de
+candidatos, similaridade de texto, gravação do resultado), contadores
+(consultas, candidatos, chamadas de similaridade, acertos de cache, de
+consultas repetidas e da chave exata) e linhas
+por segundo, num relatório estruturado (dict/JSON). O custo são algumas
+chamadas a perf_counter por linha, pequeno o bastante para ficar sempre
+ligado. Sob demanda, a execução pode ser perfilada com cProfile ou, se
+instalado, com o pyinstrument (amostragem).
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import pyinstrument
+except ImportError:  # optional dependency
+    pyinstrument = None
+
+PROFILE_MODES = {
+    'off': "Desligado",
+    'cprofile': "cProfile (determinístico)",
+    'pyinstrument': "pyinstrument (amostragem)",
+}
+
+# Modo de perfil padrão, ex.: SANEAMENTO_PROFILE=cprofile
+DEFAULT_PROFILE = os.environ.get('SANEAMENTO_PROFILE', 'off')
+
+# Funções listadas no perfil do cProfile (por tempo acumulado)
+PROFILE_TOP = 25
+
+# Tempos acumulados pelo BatchMatcher.best_match em stats (somados entre processos)
+MATCHER_TIMERS = ('t_candidates', 't_bounds', 't_similarity')
+
+# Tempo que as consultas repetidas teriam custado (ver parallel.QueryMemo)
+MEMO_SAVED = 'memo_saved_s'
+
+# Nomes das etapas e dos tempos do matcher na interface
+STAGE_LABELS = {
+    'rhc_catalogue': "Catálogo RHC",
+    'base_read': "Leitura da base",
+    'matching': "Matching (loop completo)",
+    'write': "Gravação do resultado",
+    'result_report': "Relatório do resultado",
+    'candidates': "Matcher: busca de candidatos",
+    'bounds': "Matcher: scores parciais e limites",
+    'similarity': "Matcher: similaridade de texto",
+}
+
+
+def timing_rows(report):
+    """(label, seconds) for every stage and matcher timer of a to_dict() report."""
+    timings = {**report['stages_s'], **report['matcher_s']}
+    return [(STAGE_LABELS.get(name, name), seconds) for name, seconds in timings.items()]
+
+
+def available_profile_modes():
+    """Profile modes usable in this environment (pyinstrument is optional)."""
+    return [mode for mode in PROFILE_MODES if mode != 'pyinstrument' or pyinstrument is not None]
+
+
+class RunReport:
+    """
+    Stage timers and counters of one matching run.
+
+    Wrap each stage in `with report.stage(name)`, wrap a row iterator in
+    report.timed(rows, name) to time only the reading, and merge the
+    matcher's stats Counter with add_stats(). finish() stops the clock (and
+    the profiler); to_dict() / to_json() / save() give the structured
+    report. profile is 'off', 'cprofile' or 'pyinstrument'; the profiler
+    covers the calling thread only (not worker processes).
+    """
+
+    def __init__(self, profile='off', **config):
+        if profile not in PROFILE_MODES:
+            raise ValueError(f"Modo de perfil desconhecido: {profile!r}. Opções: {', '.join(PROFILE_MODES)}")
+        if profile == 'pyinstrument' and pyinstrument is None:
+            raise ValueError("O perfil por amostragem precisa do pacote pyinstrument (pip install pyinstrument).")
+        self.config = config
+        self.stages = {}
+        self.counters = Counter()
+        self.profile_mode = profile
+        self.profile_text = None
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.wall_s = None
+        self._start = time.perf_counter()
+
+        self._profiler = None
+        if profile == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif profile == 'pyinstrument':
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the wall time of the with-block to stage name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def timed(self, iterable, name):
+        """Yields from iterable, adding the time spent producing each item to stage name."""
+        self.stages.setdefault(name, 0.0)
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stages[name] += time.perf_counter() - start
+                return
+            self.stages[name] += time.perf_counter() - start
+            yield item
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_stats(self, stats):
+        """Merges a best_match / match_rows stats Counter (counts and t_* timers)."""
+        self.counters.update(stats)
+
+    def finish(self):
+        """Stops the clock and the profiler; returns self. Calling it again is a no-op."""
+        if self.wall_s is not None:
+            return self
+        self.wall_s = time.perf_counter() - self._start
+        if self.profile_mode == 'cprofile':
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            self.profile_text = out.getvalue()
+        elif self.profile_mode == 'pyinstrument':
+            self._profiler.stop()
+            self.profile_text = self._profiler.output_text()
+        self._profiler = None
+        return self
+
+    def to_dict(self):
+        wall_s = self.wall_s if self.wall_s is not None else time.perf_counter() - self._start
+        counters = {name: n for name, n in self.counters.items() if name not in MATCHER_TIMERS + (MEMO_SAVED,)}
+        rows = counters.get('rows', 0)
+        queries = counters.get('queries', 0)
+        candidates = counters.get('candidates', 0)
+        memo_hits = counters.get('memo_hits', 0)
+        exact_hits = counters.get('exact_hits', 0)
+        matcher_s = sum(self.counters[name] for name in MATCHER_TIMERS)
+        return {
+            'started': self.started,
+            'wall_s': wall_s,
+            'config': self.config,
+            'stages_s': dict(self.stages),
+            'matcher_s': {name[2:]: self.counters[name] for name in MATCHER_TIMERS},
+            'counters': counters,
+            'rows_per_s': rows / wall_s if wall_s else 0.0,
+            'candidates_per_query': candidates / queries if queries else 0.0,
+            'similarity_calls': counters.get('scored', 0),
+            'pruned_share': (candidates - counters.get('scored', 0)) / candidates if candidates else 0.0,
+            # Consultas respondidas pela memória, entre todas as consultas pontuadas ou lembradas
+            'memo_hit_rate': memo_hits / (memo_hits + queries) if memo_hits + queries else 0.0,
+            'memo_saved_s': self.counters[MEMO_SAVED],
+            # Linhas resolvidas pela chave exata, sem matching por similaridade, e o tempo que
+            # elas teriam custado ao tempo médio do matcher por consulta pontuada
+            'exact_share': exact_hits / rows if rows else 0.0,
+            'exact_saved_s': exact_hits * matcher_s / queries if queries else 0.0,
+            'profile': {'mode': self.profile_mode, 'text': self.profile_text},
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False, default=str)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json())
+
+    def summary_lines(self):
+        """Human-readable summary (one line per stage and per matcher timer)."""
+        report = self.to_dict()
+        lines = [f"Tempo total: {report['wall_s']:.2f}s | {report['rows_per_s']:.1f} linhas/s"]
+        for label, seconds in timing_rows(report):
+            lines.append(f"  {label}: {seconds:.2f}s")
+        lines.append(f"Candidatos/consulta: {report['candidates_per_query']:.1f} | "
+                     f"chamadas de similaridade: {report['similarity_calls']:,} | "
+                     f"podados: {report['pruned_share']:.1%}")
+        if report['counters'].get('memo_hits'):
+            lines.append(f"Consultas repetidas: {report['counters']['memo_hits']:,} "
+                         f"({report['memo_hit_rate']:.1%}) | tempo poupado: ~{report['memo_saved_s']:.2f}s")
+        if report['counters'].get('exact_hits'):
+            lines.append(f"Chave exata: {report['counters']['exact_hits']:,} linhas ({report['exact_share']:.1%}) "
+                         f"sem matching por similaridade | tempo poupado: ~{report['exact_saved_s']:.2f}s")
+        return lines
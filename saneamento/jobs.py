@@ -0,0 +1,191 @@
+"""
+Execução de matching em segundo plano
+Fila de jobs atendida por um pool de threads com limite de execuções
+simultâneas (SANEAMENTO_MAX_JOBS); os demais esperam na fila, em ordem de
+chegada. Cada job tem um id, progresso consultável a qualquer momento,
+cancelamento cooperativo (verificado a cada atualização de progresso) e o
+resultado ou o erro ao terminar. Usado pelo app Streamlit, em que o job
+sobrevive às reexecuções do script e é compartilhado entre as sessões. Jobs
+terminados que ninguém recolheu (sessão abandonada) expiram depois de
+SANEAMENTO_JOB_TTL_S segundos, com os arquivos de resultado apagados.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs executados ao mesmo tempo (os demais esperam na fila), ex.: SANEAMENTO_MAX_JOBS=2
+DEFAULT_MAX_JOBS = int(os.environ.get('SANEAMENTO_MAX_JOBS', '1'))
+
+# Segundos que um job terminado fica disponível sem ser recolhido (forget), ex.: SANEAMENTO_JOB_TTL_S=600
+DEFAULT_JOB_TTL_S = float(os.environ.get('SANEAMENTO_JOB_TTL_S', '3600'))
+
+JOB_STATES = {
+    'queued': "Na fila",
+    'running': "Em execução",
+    'done': "Concluído",
+    'failed': "Erro",
+    'cancelled': "Cancelado",
+}
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Raised by Job.progress() in the job's thread once cancellation was requested."""
+
+
+class Job:
+    """
+    One background run. The job function reports progress with
+    progress(done, total, message), which also raises JobCancelled after
+    cancel(); status is one of JOB_STATES. result (or error, a message) is
+    set when the job finishes.
+    """
+
+    def __init__(self, name=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = 'queued'
+        self.done = 0
+        self.total = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    def progress(self, done, total=None, message=None):
+        """Updates the progress (called by the job function); raises JobCancelled if cancelled."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def fraction(self):
+        """Share of the work done (0.0 to 1.0), 0.0 while the total is unknown."""
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Cancels a queued job at once; a running one stops at its next progress()."""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.status = 'cancelled'
+            self.finished = time.time()
+
+    def _run(self, func, args, kwargs):
+        if self._cancel.is_set():
+            self.status = 'cancelled'
+            self.finished = time.time()
+            return
+        self.status = 'running'
+        self.started = time.time()
+        try:
+            self.result = func(self, *args, **kwargs)
+            self.status = 'done'
+        except JobCancelled:
+            self.status = 'cancelled'
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            self.finished = time.time()
+
+
+class JobRunner:
+    """
+    Queue of Jobs run by max_jobs threads, in submission order.
+
+        runner = JobRunner(max_jobs=2)
+        job = runner.submit(func, *args)   # func(job, *args) -> result
+        runner.get(job.id).fraction
+
+    Jobs stay available by id until forget(), or until ttl seconds after
+    they finished (see expire(), run on every submit); on_expire(job) is
+    then called to release what the job left behind, e.g. its result files.
+    The work itself may still use worker processes (Matcher(workers=...)).
+    """
+
+    def __init__(self, max_jobs=DEFAULT_MAX_JOBS, ttl=DEFAULT_JOB_TTL_S, on_expire=None):
+        self.max_jobs = max(1, max_jobs)
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self._executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='matching-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, name=None, **kwargs):
+        """Queues func(job, *args, **kwargs) and returns its Job (expired jobs are swept first)."""
+        self.expire()
+        job = Job(name)
+        with self._lock:
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(job._run, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """The Job with this id, or None (unknown or forgotten)."""
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def forget(self, job_id):
+        """Drops a job from the runner (cancelling it if still pending); returns it or None."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None and not job.is_finished:
+            job.cancel()
+        return job
+
+    def expire(self, now=None):
+        """Forgets the jobs finished more than ttl seconds ago, calling on_expire for each; returns them."""
+        deadline = (now if now is not None else time.time()) - self.ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.is_finished and job.finished < deadline]
+            for job in expired:
+                del self._jobs[job.id]
+        if self.on_expire is not None:
+            for job in expired:
+                self.on_expire(job)
+        return expired
+
+    def queue_position(self, job):
+        """Number of jobs queued or running that were submitted before job (0 once it runs)."""
+        if job.status != 'queued':
+            return 0
+        with self._lock:
+            return sum(1 for other in self._jobs.values()
+                       if not other.is_finished and other.submitted < job.submitted)
+
+    def active(self):
+        """Jobs queued or running, in submission order."""
+        with self._lock:
+            return sorted((job for job in self._jobs.values() if not job.is_finished), key=lambda job: job.submitted)
+
+    def shutdown(self, cancel=True):
+        """Stops the runner; with cancel, pending jobs are cancelled and running ones asked to stop."""
+        if cancel:
+            for job in self.active():
+                job.cancel()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,267 @@
+"""
+Matcher: ponto de entrada único do matching
+Reúne catálogo RHC (saneamento/catalogue.py), leitura das bases
+(saneamento/readers.py) e o motor em lote (saneamento/batch.py,
+saneamento/parallel.py) atrás de fit / match / match_one. O app Streamlit,
+as interfaces Tkinter e o script de linha de comando usam este objeto, com
+os mesmos pesos, penalidades e limites de candidatos.
+"""
+
+import os
+from collections import namedtuple
+from itertools import tee
+
+import pandas as pd
+
+from saneamento.batch import DEFAULT_MAX_CANDIDATES, DEFAULT_MAX_DF, BatchMatcher, build_rhc_matcher
+from saneamento.blocking import item_block
+from saneamento.catalogue import load_rhc_catalogue
+from saneamento.depara import fold_keys, normalize_text
+from saneamento.features import preprocess_item
+from saneamento.parallel import DEFAULT_CHUNK_SIZE, DEFAULT_MEMO_SIZE, match_rows, shortlist_rows
+from saneamento.readers import dataframe_rows, open_products
+from saneamento.similarity import DEFAULT_SIMILARITY
+from saneamento.writers import RESULT_COLUMNS, SHORTLIST_COLUMNS
+
+DEFAULT_THRESHOLD = 0.75
+
+# Etapa que produziu cada resultado (ver Matcher(exact_first=True)), com o rótulo da coluna ORIGEM
+MATCH_TIERS = {
+    'exact': "Chave exata",
+    'fuzzy': "Similaridade",
+}
+
+# Score mínimo de um candidato na lista de revisão (abaixo do limite do match)
+DEFAULT_SHORTLIST_MIN_SCORE = 0.5
+
+# Candidato da lista de revisão, com os termos do score (ver batch.ScoredCandidate)
+Candidate = namedtuple('Candidate', ['rhc_code', 'rhc_product', 'score', 'text', 'ingredient', 'concentration',
+                                     'brand', 'position'])
+
+
+class MatchResult(namedtuple('MatchResult', ['code', 'product', 'rhc_code', 'rhc_product', 'score', 'position',
+                                             'shortlist', 'tier'], defaults=((), 'fuzzy'))):
+    """
+    Best RHC item for one base product. position (in the catalogue),
+    rhc_code and rhc_product are None when no item reached the threshold;
+    score is then the best partial score (see BatchMatcher.best_match).
+    shortlist holds the ranked Candidate tuples when the Matcher keeps more
+    than one (the first one is the match when it reached the threshold).
+    tier (a MATCH_TIERS key) is 'exact' for a normalized-key hit (score
+    1.0, no shortlist: nothing to review) and 'fuzzy' otherwise.
+    """
+
+    __slots__ = ()
+
+    @property
+    def matched(self):
+        return self.position is not None
+
+    def as_row(self, columns=RESULT_COLUMNS):
+        """
+        Result row keyed by columns (base code, base product, RHC code, RHC
+        product, similarity and, with TIERED_RESULT_COLUMNS, the tier label).
+        """
+        similarity = f"{self.score:.2%}" if self.matched else None
+        tier = MATCH_TIERS[self.tier] if self.matched else None
+        return dict(zip(columns, (self.code, self.product, self.rhc_code, self.rhc_product, similarity, tier)))
+
+    def shortlist_rows(self, columns=SHORTLIST_COLUMNS):
+        """Long-format rows of the shortlist, one per candidate (see SHORTLIST_COLUMNS)."""
+        for rank, candidate in enumerate(self.shortlist, 1):
+            yield dict(zip(columns, (
+                self.code, self.product, rank, candidate.rhc_code, candidate.rhc_product,
+                f"{candidate.score:.2%}", f"{candidate.text:.2%}", f"{candidate.ingredient:.2%}",
+                f"{candidate.concentration:+.2f}", f"{candidate.brand:+.2f}",
+            )))
+
+
+def _rows(base):
+    # DataFrame, arquivo (XLSX, CSV, Parquet ou Feather: caminho, bytes, upload) ou iterável de ProductRow
+    if isinstance(base, pd.DataFrame):
+        return dataframe_rows(base)
+    if isinstance(base, (str, os.PathLike, bytes, bytearray)) or hasattr(base, 'read'):
+        return open_products(base)
+    return base
+
+
+class Matcher:
+    """
+    Matches base products against an RHC catalogue.
+
+        matcher = Matcher(threshold=0.75).fit('base_rhc.xlsx')
+        for result in matcher.match('base_hcm.xlsx'):
+            ...
+        matcher.match_one('DIPIRONA 500MG COMPRIMIDO')
+
+    similarity, max_df, max_candidates and blocking are the best_match
+    options; workers > 1 spreads match() over a process pool (same results).
+    Repeated base descriptions (same normalized features) are scored once
+    per process, up to memo_size distinct queries (see parallel.QueryMemo).
+    With shortlist = k > 1, every result also carries the k best candidates
+    scoring at least shortlist_min_score, with the per-term breakdown, from
+    the same single scan (BatchMatcher.best_matches). With exact_first, a
+    product whose normalized PRODUTO (accents, case and outer spaces
+    ignored, as in the de-para scripts) equals a catalogue item's is matched
+    to it by a dict lookup; only the other rows are scored.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, similarity=DEFAULT_SIMILARITY, max_df=DEFAULT_MAX_DF,
+                 max_candidates=DEFAULT_MAX_CANDIDATES, blocking=False, workers=1, chunk_size=DEFAULT_CHUNK_SIZE,
+                 shortlist=1, shortlist_min_score=DEFAULT_SHORTLIST_MIN_SCORE, memo_size=DEFAULT_MEMO_SIZE,
+                 exact_first=False):
+        self.threshold = threshold
+        self.similarity = similarity
+        self.max_df = max_df
+        self.max_candidates = max_candidates
+        self.blocking = blocking
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.memo_size = memo_size
+        self.shortlist = shortlist
+        self.shortlist_min_score = min(shortlist_min_score, threshold)
+        self.exact_first = exact_first
+        self.catalogue = None
+        self._exact_keys = (None, None)
+
+    @property
+    def options(self):
+        """Keyword options passed to BatchMatcher.best_match."""
+        return {
+            'min_score': self.threshold,
+            'similarity': self.similarity,
+            'max_df': self.max_df,
+            'max_candidates': self.max_candidates,
+            'blocking': self.blocking,
+        }
+
+    def fit(self, rhc, cache_dir=None):
+        """
+        Loads the RHC catalogue and returns self. rhc is a workbook or a
+        CSV/Parquet/Feather table (path, bytes or file-like; the on-disk
+        catalogue is reused when its content is unchanged), a DataFrame, or
+        an already built BatchMatcher.
+        """
+        if isinstance(rhc, BatchMatcher):
+            self.catalogue = rhc
+        elif isinstance(rhc, pd.DataFrame):
+            self.catalogue = build_rhc_matcher(rhc)
+        else:
+            self.catalogue = load_rhc_catalogue(rhc, cache_dir=cache_dir)
+        return self
+
+    def _check_fitted(self):
+        if self.catalogue is None:
+            raise ValueError("Catálogo RHC não carregado: chame fit() antes do matching.")
+
+    def __len__(self):
+        return len(self.catalogue) if self.catalogue is not None else 0
+
+    @property
+    def from_cache(self):
+        return self.catalogue is not None and self.catalogue.from_cache
+
+    @property
+    def exact_keys(self):
+        """Normalized PRODUTO -> first catalogue position with it, built once per catalogue."""
+        catalogue, keys = self._exact_keys
+        if catalogue is not self.catalogue:
+            self._check_fitted()
+            keys = {}
+            for pos, key in enumerate(fold_keys(self.catalogue.products)):
+                if key:
+                    keys.setdefault(key, pos)
+            self._exact_keys = (self.catalogue, keys)
+        return keys
+
+    def _exact_result(self, code, product, pos):
+        catalogue = self.catalogue
+        return MatchResult(code, product, catalogue.codes[pos], catalogue.products[pos], 1.0, pos, tier='exact')
+
+    def _result(self, code, product, pos, score):
+        if pos is None or score < self.threshold:
+            return MatchResult(code, product, None, None, score, None)
+        catalogue = self.catalogue
+        return MatchResult(code, product, catalogue.codes[pos], catalogue.products[pos], score, pos)
+
+    def _shortlist_result(self, code, product, ranked):
+        catalogue = self.catalogue
+        shortlist = tuple(
+            Candidate(catalogue.codes[c.position], catalogue.products[c.position], c.score, c.text, c.ingredient,
+                      c.concentration, c.brand, c.position)
+            for c in ranked
+        )
+        pos, score = (ranked[0].position, ranked[0].score) if ranked else (None, 0)
+        return self._result(code, product, pos, score)._replace(shortlist=shortlist)
+
+    @property
+    def _shortlist_options(self):
+        return {**self.options, 'min_score': self.shortlist_min_score}
+
+    def match(self, base, stats=None, store=None):
+        """
+        Yields a MatchResult per base product, in input order, as the base is
+        read. base is a workbook or a CSV/Parquet/Feather table (path, bytes
+        or file-like; see readers.open_products), a DataFrame or an iterable
+        of ProductRow. stats (a Counter) accumulates the matcher
+        counters and timers (see BatchMatcher.best_match). With store (a
+        saneamento.store.ResultStore), results of earlier runs are reused and
+        only new or affected rows are scored. With exact_first, stats also
+        gets 'exact_hits' (rows resolved without scoring).
+        """
+        self._check_fitted()
+        if self.exact_first:
+            yield from self._match_tiered(_rows(base), stats, store)
+            return
+        yield from self._match_fuzzy(_rows(base), stats, store)
+
+    def _match_tiered(self, rows, stats, store):
+        # 1ª etapa: chave exata (busca num dict); só as demais linhas vão para a similaridade, e os
+        # resultados das duas etapas voltam na ordem da base
+        exact_keys = self.exact_keys
+        tagged, pending = tee((row, exact_keys.get(normalize_text(row.product))) for row in rows)
+        fuzzy = self._match_fuzzy((row for row, pos in pending if pos is None), stats, store)
+        try:
+            for row, pos in tagged:
+                if pos is None:
+                    yield next(fuzzy)
+                    continue
+                if stats is not None:
+                    stats['exact_hits'] += 1
+                yield self._exact_result(row.code, row.product, pos)
+        finally:
+            # Fecha antes o gerador da similaridade: com store, ele grava os resultados pendentes
+            fuzzy.close()
+
+    def _match_fuzzy(self, rows, stats, store):
+        if store is not None:
+            yield from store.match(self, rows, stats=stats)
+            return
+        if self.shortlist > 1:
+            shortlists = shortlist_rows(self.catalogue, rows, self.shortlist, workers=self.workers,
+                                        chunk_size=self.chunk_size, stats=stats, memo_size=self.memo_size,
+                                        **self._shortlist_options)
+            for row, ranked in shortlists:
+                yield self._shortlist_result(row.code, row.product, ranked)
+            return
+        matches = match_rows(self.catalogue, rows, workers=self.workers, chunk_size=self.chunk_size,
+                             stats=stats, memo_size=self.memo_size, **self.options)
+        for row, pos, score in matches:
+            yield self._result(row.code, row.product, pos, score)
+
+    def match_one(self, text, especie=None, code=None, stats=None):
+        """MatchResult for a single product text (ESPÉCIE optional, for blocking)."""
+        self._check_fitted()
+        if self.exact_first:
+            pos = self.exact_keys.get(normalize_text(text))
+            if pos is not None:
+                if stats is not None:
+                    stats['exact_hits'] += 1
+                return self._exact_result(code, text, pos)
+        query = preprocess_item(None, text, None)
+        query['block'] = item_block(query, especie)
+        if self.shortlist > 1:
+            ranked = self.catalogue.best_matches(query, self.shortlist, stats=stats, **self._shortlist_options)
+            return self._shortlist_result(code, text, ranked)
+        pos, score = self.catalogue.best_match(query, stats=stats, **self.options)
+        return self._result(code, text, pos, score)
@@ -0,0 +1,142 @@
+"""
+Normalização de textos farmacêuticos
+Compila a tabela de sinônimos uma única vez em uma expressão regular e
+reescreve o texto em uma só passada (em vez de um str.replace por entrada).
+"""
+
+import re
+
+import pandas as pd
+
+# Dicionário de sinônimos (conhecimento de farmacêutico)
+PHARMACEUTICAL_SYNONYMS = {
+    # === PRINCÍPIOS ATIVOS ===
+    'CLAV': 'CLAVULANATO', 'CLAVUL': 'CLAVULANATO',
+    'AMOX': 'AMOXICILINA', 'AMOXILINA': 'AMOXICILINA', 'AMOXI': 'AMOXICILINA',
+    'AC.': 'ACIDO', 'AC ': 'ACIDO ',
+    'ACETILSAL': 'ACETILSALICILICO', 'ASS': 'ACETILSALICILICO', 'AAS': 'ACETILSALICILICO',
+    'DIPIR': 'DIPIRONA', 'PARACET': 'PARACETAMOL', 'IBUPRO': 'IBUPROFENO',
+    'CEFALEX': 'CEFALEXINA', 'AZITRO': 'AZITROMICINA', 'CLARITRO': 'CLARITROMICINA',
+    'METFORM': 'METFORMINA', 'ATENOL': 'ATENOLOL', 'CAPTOP': 'CAPTOPRIL',
+    'ENALAPRIL': 'ENALAPRIL', 'LOSART': 'LOSARTANA', 'SINVAST': 'SINVASTATINA',
+    'ATORVAST': 'ATORVASTATINA', 'OMEPRAZ': 'OMEPRAZOL', 'PANTOPRAZ': 'PANTOPRAZOL',
+    'RANITID': 'RANITIDINA',
+
+    # === SAIS E COMPOSTOS ===
+    'SODICO': 'SODIO', 'POTASSICO': 'POTASSIO', 'CALCICO': 'CALCIO',
+    'CLORIDRATO': 'HCL', 'SULFATO': 'SO4', 'FOSFATO': 'PO4',
+
+    # === FORMAS FARMACÊUTICAS ===
+    'COMP.': 'COMPRIMIDO', 'COMP ': 'COMPRIMIDO ', 'COMPR': 'COMPRIMIDO', 'CPR': 'COMPRIMIDO',
+    'CAPS': 'CAPSULA', 'CAP': 'CAPSULA',
+    'AMP.': 'AMPOLA', 'AMP ': 'AMPOLA ', 'AMPOLA': 'AMPOLA',
+    'FA.': 'FRASCO', 'FA ': 'FRASCO ', 'FR.': 'FRASCO', 'FR ': 'FRASCO ', 'FRASCO': 'FRASCO',
+    'ENV.': 'ENVELOPE', 'ENV ': 'ENVELOPE ',
+    'SOL.': 'SOLUCAO', 'SOL ': 'SOLUCAO ',
+    'SUSP.': 'SUSPENSAO', 'SUSP ': 'SUSPENSAO ',
+    'XPE': 'XAROPE', 'XAROPE': 'XAROPE',
+    'POM': 'POMADA', 'CREME': 'CREME', 'GEL': 'GEL',
+    'SPRAY': 'SPRAY', 'AEROSOL': 'AEROSOL', 'GOTAS': 'GOTAS', 'COLIR': 'COLIRIO',
+
+    # === UNIDADES DE MEDIDA ===
+    'GR ': 'G ', 'GR)': 'G)', 'GRS': 'G', 'GRAMA': 'G', 'GRAMAS': 'G',
+    'ML.': 'ML', 'MG.': 'MG', 'G.': 'G', 'MCG': 'MCG', 'MICROG': 'MCG',
+    'UI': 'UI', 'UNIDADES': 'UI', '%': 'PORCENTO',
+
+    # === OUTROS MAPPINGS ===
+    'VO': 'ORAL', 'IV': 'INTRAVENOSO', 'IM': 'INTRAMUSCULAR',
+    'SC': 'SUBCUTANEO', 'TOP': 'TOPICO',
+    'C/': 'COM', 'S/': 'SEM',
+    ' DE ': ' ', ' DA ': ' ', ' DO ': ' ', ' PARA ': ' ',
+    '(*.*)': '', '*': '', '+': ' ', '-': ' ', '/': ' ', '(': '', ')': '', '[': '', ']': '',
+}
+
+# Uma "letra" é qualquer caractere alfabético (inclui acentuados); dígitos e
+# pontuação contam como fronteira, de modo que 500GR -> 500G mas FLUIMUCIL
+# não vira FLU-INTRAMUSCULAR-UCIL.
+_WORD_SPLIT = re.compile(r'([^\W\d_]+)')
+
+
+def compile_synonyms(synonyms):
+    """
+    Compiles a synonym table into a single-pass rewriter.
+
+    The text is split once into words (runs of letters) and separators, and
+    the keys are classified into three kinds of rules:
+    - word rules ('AMOX', 'COMP.', ' DE ', 'GR)'): replace a whole word only.
+      A trailing dot is consumed when the table has a dotted variant of the
+      key ('COMP.', 'MG.').
+    - prefix rules ('C/', 'S/'): a whole word followed by the given punctuation.
+    - symbol rules ('%', '(*.*)', '-'): literal, match anywhere, applied
+      after the words (only the ones actually present in the text).
+
+    Identity entries ('AMPOLA': 'AMPOLA') are dropped. Returns a function
+    that rewrites an already upper-cased string.
+    """
+    words = {}
+    dotted = set()
+    prefixes = {}
+    symbols = {}
+
+    for old, new in synonyms.items():
+        core = old.strip()
+        word = core.rstrip('.)')
+        if word[:1].isalpha() and word.isalnum():
+            words[word] = new.strip().rstrip('.)')
+            if core.endswith('.'):
+                dotted.add(word)
+            continue
+        head = _WORD_SPLIT.match(old)
+        tail = old[head.end():] if head else old
+        if head and not _WORD_SPLIT.search(tail):
+            prefixes[head.group()] = (tail, new)
+        else:
+            symbols[old] = new
+
+    words = {w: r for w, r in words.items() if w != r or w in dotted}
+    symbols = list(symbols.items())
+    lookup = words.get
+
+    def rewrite(text):
+        parts = _WORD_SPLIT.split(text)
+        found = parts[1::2]
+        if prefixes.keys().isdisjoint(found) and ('.' not in text or dotted.isdisjoint(found)):
+            parts[1::2] = [lookup(w, w) for w in found]
+        else:
+            # Caminho lento só quando há ponto final ou prefixo a consumir
+            for i in range(1, len(parts), 2):
+                word, sep = parts[i], parts[i + 1]
+                if word in prefixes and sep.startswith(prefixes[word][0]):
+                    tail, new = prefixes[word]
+                    parts[i], parts[i + 1] = new, sep[len(tail):]
+                    continue
+                if word in dotted and sep.startswith('.'):
+                    parts[i + 1] = sep[1:]
+                parts[i] = lookup(word, word)
+
+        text = ''.join(parts)
+        for old, new in symbols:
+            if old in text:
+                text = text.replace(old, new)
+        return text
+
+    return rewrite
+
+
+def build_normalizer(synonyms):
+    """
+    Returns a normalize(text) function for the given synonym table:
+    NaN-safe, upper-cased, rewritten in one pass and whitespace-collapsed.
+    """
+    rewrite = compile_synonyms(synonyms)
+
+    def normalize(text):
+        if pd.isna(text):
+            return ""
+        text = rewrite(str(text).upper().strip())
+        return ' '.join(text.split())
+
+    return normalize
+
+
+normalize_pharmaceutical_text = build_normalizer(PHARMACEUTICAL_SYNONYMS)
@@ -0,0 +1,213 @@
+"""
+Matching em múltiplos processos
+Divide as linhas da base em blocos e distribui entre um ProcessPoolExecutor.
+O estado compartilhado (catálogo RHC já pré-processado) vai para cada
+processo uma única vez, no initializer (herdado via fork no Linux, enviado
+como snapshot serializado no Windows/macOS), e nunca por tarefa. Cada
+processo lembra os resultados das consultas já vistas (QueryMemo), então
+descrições repetidas na base são pontuadas uma vez só.
+"""
+
+import os
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat, tee
+from time import perf_counter
+
+from saneamento.batch import query_key
+from saneamento.blocking import item_block
+from saneamento.features import preprocess_texts
+
+DEFAULT_CHUNK_SIZE = 256
+
+# Resultados de consultas lembrados por processo (0 desliga a memória)
+DEFAULT_MEMO_SIZE = 65536
+
+# Blocos em andamento por processo: a entrada é lida só um pouco à frente do resultado
+_IN_FLIGHT_PER_WORKER = 2
+
+# Estado do processo worker, preenchido pelo initializer
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _run_chunk(args):
+    func, chunk = args
+    return func(_shared, chunk)
+
+
+def available_workers():
+    """Number of CPUs this process may use."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class QueryMemo:
+    """
+    LRU memo of query results keyed by batch.query_key, bounded to size
+    entries. Rows whose texts normalize to the same features (the same
+    PRODUTO under another code, a stripped (*.*) suffix...) reuse the first
+    result; each entry keeps the seconds its computation took, so hits also
+    report the time saved.
+    """
+
+    def __init__(self, size=DEFAULT_MEMO_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query, compute, counts):
+        """compute()'s result for query, reused for equal keys; counts gets 'memo_hits' and 'memo_saved_s'."""
+        key = query_key(query)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            counts['memo_hits'] += 1
+            counts['memo_saved_s'] += entry[1]
+            return entry[0]
+        start = perf_counter()
+        result = compute()
+        self._entries[key] = (result, perf_counter() - start)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return result
+
+
+def _memo(memo_size):
+    return QueryMemo(memo_size) if memo_size else None
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def imap_chunks(func, shared, items, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Applies func(shared, chunk) to consecutive chunks of items and yields the
+    individual results in input order.
+
+    func must be a module-level function returning one result per element.
+    With workers <= 1 everything runs in-process through the same func, so
+    the serial and parallel paths produce identical results. items is
+    consumed lazily: at most a few chunks per worker are read ahead of the
+    results, so a streamed sheet is never held in memory as a whole.
+    """
+    if workers <= 1:
+        for chunk in _chunks(items, chunk_size):
+            yield from func(shared, chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as executor:
+        pending = deque()
+        for chunk in _chunks(items, chunk_size):
+            pending.append(executor.submit(_run_chunk, (func, chunk)))
+            if len(pending) >= workers * _IN_FLIGHT_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _match_texts_chunk(shared, rows):
+    matcher, options, memo = shared
+    results = []
+    # Features do bloco inteiro de uma vez (em colunas)
+    queries = preprocess_texts(text for text, _ in rows)
+    for query, (_, especie) in zip(queries, rows):
+        query['block'] = item_block(query, especie)
+        counts = Counter()
+        compute = partial(matcher.best_match, query, stats=counts, **options)
+        pos, score = memo.get(query, compute, counts) if memo is not None else compute()
+        results.append((pos, score, counts))
+    return results
+
+
+def _shortlist_texts_chunk(shared, rows):
+    matcher, k, options, memo = shared
+    results = []
+    queries = preprocess_texts(text for text, _ in rows)
+    for query, (_, especie) in zip(queries, rows):
+        query['block'] = item_block(query, especie)
+        counts = Counter()
+        compute = partial(matcher.best_matches, query, k, stats=counts, **options)
+        results.append((memo.get(query, compute, counts) if memo is not None else compute(), counts))
+    return results
+
+
+def _match_pairs(matcher, pairs, workers, chunk_size, stats, memo_size, options):
+    # Com workers > 1 cada processo recebe a sua cópia (vazia) da memória
+    shared = (matcher, options, _memo(memo_size))
+    for pos, score, counts in imap_chunks(_match_texts_chunk, shared, pairs, workers, chunk_size):
+        if stats is not None:
+            stats.update(counts)
+            stats['pruned'] += counts['candidates'] - counts['scored']
+        yield pos, score
+
+
+def _shortlist_pairs(matcher, pairs, k, workers, chunk_size, stats, memo_size, options):
+    shared = (matcher, k, options, _memo(memo_size))
+    for shortlist, counts in imap_chunks(_shortlist_texts_chunk, shared, pairs, workers, chunk_size):
+        if stats is not None:
+            stats.update(counts)
+            stats['pruned'] += counts['candidates'] - counts['scored']
+        yield shortlist
+
+
+def match_texts(matcher, texts, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, stats=None, especies=None,
+                memo_size=DEFAULT_MEMO_SIZE, **options):
+    """
+    Yields matcher.best_match() -> (position, score) for each product text,
+    in input order, optionally spread over `workers` processes.
+
+    especies, aligned with texts, gives each query's ESPÉCIE for blocking
+    (otherwise the block is inferred from the text). options go to
+    best_match (min_score, similarity, max_df, max_candidates, blocking,
+    block_fallback, max_scored). If stats (a Counter) is given, it accumulates
+    best_match's counters plus 'pruned' (candidate pairs skipped by the
+    upper bound). Queries with the same features are scored once per
+    process (QueryMemo of memo_size entries, 0 disables it); stats then gets
+    'memo_hits' and 'memo_saved_s' (seconds the first computations took).
+    """
+    pairs = zip(texts, especies if especies is not None else repeat(None))
+    yield from _match_pairs(matcher, pairs, workers, chunk_size, stats, memo_size, options)
+
+
+def match_rows(matcher, rows, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, stats=None, memo_size=DEFAULT_MEMO_SIZE,
+               **options):
+    """
+    match_texts for ProductRow tuples (e.g. a saneamento.readers.ProductSheet):
+    yields (row, position, score) as the rows are read, using each row's
+    ESPÉCIE for blocking.
+    """
+    rows, pending = tee(rows)
+    pairs = ((row.product, row.especie) for row in pending)
+    for row, (pos, score) in zip(rows, _match_pairs(matcher, pairs, workers, chunk_size, stats, memo_size, options)):
+        yield row, pos, score
+
+
+def shortlist_rows(matcher, rows, k, workers=1, chunk_size=DEFAULT_CHUNK_SIZE, stats=None,
+                   memo_size=DEFAULT_MEMO_SIZE, **options):
+    """
+    match_rows with matcher.best_matches(): yields (row, shortlist) with the
+    k best ScoredCandidate tuples of each row, as the rows are read. options
+    go to best_matches (min_score, similarity, max_df, max_candidates,
+    blocking, block_fallback).
+    """
+    rows, pending = tee(rows)
+    pairs = ((row.product, row.especie) for row in pending)
+    yield from zip(rows, _shortlist_pairs(matcher, pairs, k, workers, chunk_size, stats, memo_size, options))
@@ -0,0 +1,453 @@
+"""
+Leitura de planilhas de produtos em streaming
+Lê só as colunas CÓDIGO, PRODUTO e (opcional) ESPÉCIE com o openpyxl em modo
+read-only, linha a linha, sem montar a planilha inteira em um DataFrame.
+Catálogos hospitalares de 100k+ linhas cabem na memória e o matching começa
+antes do arquivo terminar de ser lido. Além de XLSX, os pontos de entrada
+leem CSV, Parquet e Feather (formato pela extensão ou pelo conteúdo): os
+formatos colunares carregam em milissegundos e servem para encadear etapas,
+deixando o XLSX para a planilha final. TableRows percorre todas as colunas
+de uma tabela (um resultado, por exemplo) linha a linha, nos mesmos formatos.
+"""
+
+import codecs
+import csv
+import io
+import math
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import repeat
+
+import openpyxl
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional dependency
+    pyarrow = None
+
+ProductRow = namedtuple('ProductRow', ['code', 'product', 'especie'])
+
+# Extensão -> formato de tabela lido pelos pontos de entrada
+TABLE_FORMATS = {
+    '.xlsx': 'xlsx',
+    '.xlsm': 'xlsx',
+    '.xls': 'xls',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+}
+
+# Assinaturas dos formatos binários (início do arquivo)
+TABLE_MAGIC = {
+    b'PAR1': 'parquet',
+    b'ARROW1': 'feather',
+    b'PK\x03\x04': 'xlsx',
+    b'\xd0\xcf\x11\xe0': 'xls',
+}
+
+# Variações de cabeçalho aceitas -> nome padrão
+HEADER_ALIASES = {
+    'CÓDIGO DO PRODUTO': 'CÓDIGO',
+    'CODIGO DO PRODUTO': 'CÓDIGO',
+    'CODIGO': 'CÓDIGO',
+    'COD': 'CÓDIGO',
+    'DESCRIÇÃO': 'PRODUTO',
+    'DESCRICAO': 'PRODUTO',
+    'NOME': 'PRODUTO',
+    'ESPECIE': 'ESPÉCIE',
+}
+
+
+def normalize_header(name):
+    """'Código do Produto ' -> 'CÓDIGO', etc."""
+    name = str(name).upper().strip() if name is not None else ''
+    return HEADER_ALIASES.get(name, name)
+
+
+def resolve_columns(header):
+    """
+    Positions of (code, product, especie) in a header row. CÓDIGO and
+    PRODUTO are found by name or, failing that, are the first two columns;
+    ESPÉCIE is optional (None when absent).
+    """
+    names = [normalize_header(name) for name in header]
+    while names and not names[-1]:
+        names.pop()
+    if len(names) < 2:
+        raise ValueError(f"O arquivo deve ter ao menos 2 colunas (CÓDIGO e PRODUTO). Encontrado: {len(names)} coluna(s).")
+
+    code = names.index('CÓDIGO') if 'CÓDIGO' in names else 0
+    product = names.index('PRODUTO') if 'PRODUTO' in names else 1
+    especie = next((i for i, name in enumerate(names) if name.startswith('ESPÉCIE')), None)
+    return code, product, especie
+
+
+def _code_value(value):
+    # Como o pd.read_excel: códigos numéricos gravados como texto viram inteiros
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    elif hasattr(source, 'seek'):
+        source.seek(0)
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+class ProductSheet:
+    """
+    Streaming view of the first sheet (or sheet_name) of a product workbook.
+
+    source is a path, raw bytes or a file-like object (e.g. a Streamlit
+    upload). Iterating yields ProductRow(code, product, especie) for every
+    non-empty row after the header; blank cells are None and digit-only codes
+    become ints (as pd.read_excel infers them). n_rows is the row
+    count declared by the sheet (None if the file doesn't declare it), meant
+    for progress bars only.
+    """
+
+    def __init__(self, source, sheet_name=None):
+        self.source = source
+        self.sheet_name = sheet_name
+        workbook = _open(source)
+        try:
+            sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            self.code_col, self.product_col, self.especie_col = resolve_columns(header)
+            self.columns = [normalize_header(name) for name in header]
+            self.n_rows = sheet.max_row - 1 if sheet.max_row else None
+        finally:
+            workbook.close()
+
+    @property
+    def has_especie(self):
+        return self.especie_col is not None
+
+    def __iter__(self):
+        workbook = _open(self.source)
+        try:
+            sheet = workbook[self.sheet_name] if self.sheet_name else workbook.worksheets[0]
+            code_col, product_col, especie_col = self.code_col, self.product_col, self.especie_col
+            last_col = max(code_col, product_col, especie_col or 0) + 1
+            for values in sheet.iter_rows(min_row=2, max_col=last_col, values_only=True):
+                values = values + (None,) * (last_col - len(values))
+                code, product = values[code_col], values[product_col]
+                if code is None and product is None:
+                    continue
+                yield ProductRow(_code_value(code), product, values[especie_col] if especie_col is not None else None)
+        finally:
+            workbook.close()
+
+
+# Separadores tentados na leitura de CSV (o ';' é o do Excel em português)
+CSV_DELIMITERS = ';,\t'
+
+# Codificações tentadas na leitura de CSV, nesta ordem: UTF-8 (com ou sem BOM)
+# e a do Excel em português ("CSV (separado por vírgulas)" grava em cp1252)
+CSV_ENCODINGS = ('utf-8-sig', 'cp1252')
+
+# Bytes do início do arquivo usados para escolher a codificação
+CSV_SAMPLE_BYTES = 1024 * 1024
+
+
+def sniff_delimiter(first_line):
+    """The CSV_DELIMITERS delimiter of a header line (';' when it can't tell)."""
+    try:
+        return csv.Sniffer().sniff(first_line, CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return CSV_DELIMITERS[0]
+
+
+def csv_rows(source, delimiter=None):
+    """
+    ProductRow tuples of a CSV product list (text, bytes or a text file
+    object), with the header resolved as in ProductSheet. The delimiter is
+    sniffed among CSV_DELIMITERS unless given; bytes are decoded with the
+    first of CSV_ENCODINGS that fits. Empty cells are None and digit-only
+    codes become ints.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = bytes(source).decode(csv_encoding(source))
+    lines = io.StringIO(source) if isinstance(source, str) else source
+    if delimiter is None:
+        sample = lines.read(64 * 1024)
+        lines.seek(0)
+        delimiter = sniff_delimiter(sample.split('\n', 1)[0])
+    reader = csv.reader(lines, delimiter=delimiter)
+    code_col, product_col, especie_col = resolve_columns(next(reader, ()))
+    last_col = max(code_col, product_col, especie_col or 0) + 1
+    for values in reader:
+        values = [value if value != '' else None for value in values] + [None] * (last_col - len(values))
+        code, product = values[code_col], values[product_col]
+        if code is None and product is None:
+            continue
+        yield ProductRow(_code_value(code), product, values[especie_col] if especie_col is not None else None)
+
+
+def dataframe_rows(df):
+    """
+    ProductRow tuples of an already loaded DataFrame, with the columns
+    resolved as in ProductSheet. The columns are pulled out once as lists
+    (no per-row Series).
+    """
+    code_col, product_col, especie_col = resolve_columns(df.columns)
+    especies = df.iloc[:, especie_col].tolist() if especie_col is not None else repeat(None)
+    return map(ProductRow, df.iloc[:, code_col].tolist(), df.iloc[:, product_col].tolist(), especies)
+
+
+def _head(source, n=8):
+    # Primeiros bytes de um caminho, bytes ou arquivo (a posição do arquivo não muda)
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source[:n])
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()[:n]
+    if hasattr(source, 'read'):
+        position = source.tell()
+        head = source.read(n)
+        source.seek(position)
+        return head if isinstance(head, bytes) else head.encode('utf-8')
+    with open(source, 'rb') as f:
+        return f.read(n)
+
+
+def _text_encoding(head):
+    # Primeira de CSV_ENCODINGS que decodifica o início do arquivo (None: não é texto);
+    # o decodificador incremental aceita um caractere cortado no fim da amostra
+    if b'\x00' in head:
+        return None
+    for encoding in CSV_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return None
+
+
+def csv_encoding(source):
+    """
+    The CSV_ENCODINGS encoding of a CSV file (path, bytes or binary file),
+    chosen from its first CSV_SAMPLE_BYTES; UTF-8 when none fits.
+    """
+    return _text_encoding(_head(source, CSV_SAMPLE_BYTES)) or CSV_ENCODINGS[0]
+
+
+def table_format(source, default='xlsx'):
+    """
+    'xlsx', 'xls', 'csv', 'parquet' or 'feather': from the extension of a
+    path (or of an upload's name), otherwise from the first bytes (UTF-8 or
+    cp1252 text is taken as CSV); default when neither tells.
+    """
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', None)
+    if name is not None:
+        fmt = TABLE_FORMATS.get(os.path.splitext(str(name))[1].lower())
+        if fmt is not None:
+            return fmt
+    head = _head(source, CSV_SAMPLE_BYTES)
+    for magic, fmt in TABLE_MAGIC.items():
+        if head.startswith(magic):
+            return fmt
+    return 'csv' if head and _text_encoding(head) else default
+
+
+def _require_pyarrow(fmt):
+    if fmt in ('parquet', 'feather') and pyarrow is None:
+        raise ValueError(f"O formato {fmt} precisa do pacote pyarrow (pip install pyarrow).")
+
+
+def _binary(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+@contextmanager
+def csv_lines(source):
+    """
+    Text stream over a CSV (path, bytes or binary file object), decoded
+    with csv_encoding(source) while it is read: the file is never held as
+    one string. A file object given by the caller is left open.
+    """
+    encoding = csv_encoding(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding=encoding, newline='') as lines:
+            yield lines
+        return
+    binary = _binary(source)
+    lines = io.TextIOWrapper(binary, encoding=encoding, newline='')
+    try:
+        yield lines
+    finally:
+        # Solta o arquivo do chamador sem fechá-lo (o TextIOWrapper o fecharia junto)
+        lines.detach()
+
+
+def _csv_header(lines):
+    # (cabeçalho, separador) da primeira linha
+    first_line = lines.readline()
+    delimiter = sniff_delimiter(first_line)
+    return next(csv.reader([first_line], delimiter=delimiter), []), delimiter
+
+
+def read_table(source, fmt=None):
+    """
+    A whole table as a DataFrame: XLSX/XLS (first sheet), CSV (delimiter
+    and encoding sniffed, see csv_lines), Parquet or Feather. fmt defaults to
+    table_format(source); source is a path, bytes or a file-like object.
+    """
+    fmt = fmt or table_format(source)
+    _require_pyarrow(fmt)
+    if fmt == 'csv':
+        with csv_lines(source) as lines:
+            delimiter = _csv_header(lines)[1]
+            lines.seek(0)
+            return pd.read_csv(lines, sep=delimiter)
+    if fmt == 'parquet':
+        return pd.read_parquet(_binary(source))
+    if fmt == 'feather':
+        return pd.read_feather(_binary(source))
+    return pd.read_excel(_binary(source))
+
+
+def _cell(value):
+    # Célula de uma tabela colunar como o openpyxl a entrega: NaN vira None, código 30270.0 vira 30270
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+class ProductTable:
+    """
+    ProductSheet for CSV, Parquet, Feather (and legacy .xls) product tables:
+    same header resolution, same ProductRow values (blank cells None,
+    digit-only codes ints, empty rows skipped). CSV is streamed from the
+    source, decoded as it is read (n_rows None: counting would mean reading
+    it twice); the other formats are loaded at once, which for the columnar
+    ones takes milliseconds.
+    """
+
+    def __init__(self, source, fmt=None):
+        self.source = source
+        self.fmt = fmt or table_format(source, default='csv')
+        if self.fmt == 'xlsx':
+            raise ValueError("Planilhas .xlsx são lidas pelo ProductSheet (use open_products).")
+        if self.fmt == 'csv':
+            self._df = None
+            with csv_lines(source) as lines:
+                header, self._delimiter = _csv_header(lines)
+            self.n_rows = None
+        else:
+            self._df = read_table(source, self.fmt)
+            header = list(self._df.columns)
+            self.n_rows = len(self._df)
+        self.code_col, self.product_col, self.especie_col = resolve_columns(header)
+        self.columns = [normalize_header(name) for name in header]
+
+    @property
+    def has_especie(self):
+        return self.especie_col is not None
+
+    def __iter__(self):
+        if self._df is None:
+            with csv_lines(self.source) as lines:
+                yield from csv_rows(lines, self._delimiter)
+            return
+        for code, product, especie in dataframe_rows(self._df):
+            code, product = _cell(code), _cell(product)
+            if code is None and product is None:
+                continue
+            yield ProductRow(_code_value(code), product, _cell(especie) if self.has_especie else None)
+
+
+def open_products(source, fmt=None):
+    """
+    ProductSheet (XLSX) or ProductTable (CSV, Parquet, Feather) of a
+    product file, by fmt or table_format(source).
+    """
+    fmt = fmt or table_format(source)
+    if fmt == 'xlsx':
+        return ProductSheet(source)
+    return ProductTable(source, fmt)
+
+
+class TableRows:
+    """
+    Streaming view of every column of a table (e.g. a result file): XLSX
+    (first sheet, openpyxl read-only), CSV (delimiter sniffed), Parquet and
+    Feather (one record batch at a time). columns is the header as written;
+    iterating yields one tuple per non-empty row, with blank cells None and
+    integral floats and digit-only text as ints (as ProductSheet delivers
+    codes: the CSV and Arrow results store codes as text). Legacy .xls is
+    loaded at once.
+    """
+
+    def __init__(self, source, fmt=None):
+        self.source = source
+        self.fmt = fmt or table_format(source)
+        _require_pyarrow(self.fmt)
+        self.columns = next(self._rows(header=True), [])
+
+    def __iter__(self):
+        width = len(self.columns)
+        for values in self._rows(header=False):
+            values = tuple(_code_value(_cell(value)) for value in values[:width])
+            if not any(value is not None and value != '' for value in values):
+                continue
+            yield values + (None,) * (width - len(values))
+
+    def _rows(self, header):
+        # Cabeçalho (uma lista) ou as linhas de dados, conforme o formato
+        if self.fmt == 'xlsx':
+            workbook = _open(self.source)
+            try:
+                rows = workbook.worksheets[0].iter_rows(values_only=True)
+                first = next(rows, ())
+                if header:
+                    names = list(first)
+                    while names and names[-1] is None:
+                        names.pop()
+                    yield names
+                    return
+                yield from rows
+            finally:
+                workbook.close()
+        elif self.fmt == 'csv':
+            with csv_lines(self.source) as lines:
+                names, delimiter = _csv_header(lines)
+                if header:
+                    yield names
+                    return
+                for values in csv.reader(lines, delimiter=delimiter):
+                    yield [value if value != '' else None for value in values]
+        elif self.fmt in ('parquet', 'feather'):
+            if self.fmt == 'parquet':
+                table = pyarrow.parquet.ParquetFile(_binary(self.source))
+                names, batches = table.schema_arrow.names, table.iter_batches()
+            else:
+                table = pyarrow.ipc.open_file(_binary(self.source))
+                names = table.schema.names
+                batches = (table.get_batch(i) for i in range(table.num_record_batches))
+            if header:
+                yield list(names)
+                return
+            for batch in batches:
+                yield from zip(*(column.to_pylist() for column in batch.columns))
+        else:
+            df = read_table(self.source, self.fmt)
+            if header:
+                yield list(df.columns)
+                return
+            yield from df.itertuples(index=False, name=None)
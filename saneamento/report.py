@@ -0,0 +1,259 @@
+"""
+Relatório de um resultado de matching em uma passada
+Contagens (linhas, matches, células preenchidas por coluna), histograma e
+resumo da similaridade e amostras (primeiras linhas, primeiros matches e
+não matches, maiores e menores similaridades) acumulados linha a linha, com
+memória constante: só as amostras ficam guardadas. Alimentado pelas mesmas
+linhas que vão para o ResultWriter, no fim da execução o relatório já está
+pronto, sem reler o arquivo gravado; report_file faz o mesmo percorrendo um
+arquivo de qualquer formato (TableRows). Sai em JSON e em texto.
+"""
+
+import heapq
+import json
+import math
+import os
+
+import pandas as pd
+
+from saneamento.readers import TableRows
+
+# Coluna da similaridade ('78.55%' no resultado)
+SCORE_COLUMN = 'SIMILARIDADE'
+
+# Coluna que diz se a linha tem match (a primeira presente no resultado)
+MATCH_COLUMNS = ('CÓDIGO RHC', 'CÓDIGO HCM')
+
+# Faixas do histograma da similaridade (de 0% a 100%)
+HISTOGRAM_BINS = 20
+
+# Linhas guardadas por amostra
+SAMPLE_ROWS = 10
+
+SAMPLE_LABELS = {
+    'head': "Primeiras linhas",
+    'first_matches': "Primeiros matches",
+    'first_non_matches': "Primeiros sem match",
+    'top': "Maiores similaridades",
+    'bottom': "Menores similaridades",
+}
+
+# Largura máxima de uma célula nas amostras do relatório em texto
+TEXT_COLWIDTH = 50
+
+
+def report_paths(path):
+    """'resultado.xlsx' -> ('resultado_relatorio.json', 'resultado_relatorio.txt')."""
+    root = os.path.splitext(str(path))[0]
+    return f"{root}_relatorio.json", f"{root}_relatorio.txt"
+
+
+def _plain(value):
+    # Valor como o TableRows o lê do arquivo: escalares numpy viram Python, NaN vira None, 30270.0 vira 30270
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _filled(value):
+    return value is not None and value != ''
+
+
+def parse_score(value):
+    """'78.55%', 0.7855 or 78.55 -> 0.7855; None for empty cells and text that is not a number."""
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            score = float(text.rstrip('%').replace(',', '.'))
+        except ValueError:
+            return None
+        if text.endswith('%'):
+            score /= 100
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        score = float(value)
+    else:
+        return None
+    if math.isnan(score):
+        return None
+    return score / 100 if score > 1 else score
+
+
+class ResultReport:
+    """
+    Single-pass statistics of a result table.
+
+    columns is the header; add() takes each row (a dict keyed by column, as
+    MatchResult.as_row gives it, or a sequence in column order). A row
+    matches when match_column (default: the first of MATCH_COLUMNS in
+    columns; None when there is none) is filled; score_column is parsed with
+    parse_score into a histogram of bins equal ranges and top/bottom
+    samples. to_dict() / to_json() / save() give the structured report,
+    text_lines() / save_text() the text one.
+    """
+
+    def __init__(self, columns, match_column=None, score_column=SCORE_COLUMN, samples=SAMPLE_ROWS,
+                 bins=HISTOGRAM_BINS, source=None):
+        self.columns = list(columns)
+        if match_column is None:
+            match_column = next((name for name in MATCH_COLUMNS if name in self.columns), None)
+        elif match_column not in self.columns:
+            raise ValueError(f"Coluna de match {match_column!r} não está no resultado. "
+                             f"Colunas: {', '.join(map(str, self.columns))}")
+        self.match_column = match_column
+        self.score_column = score_column if score_column in self.columns else None
+        self.source = source
+        self.samples = samples
+        self.bins = bins
+        self._match = self.columns.index(match_column) if match_column is not None else None
+        self._score = self.columns.index(self.score_column) if self.score_column is not None else None
+
+        self.rows = 0
+        self.matches = 0
+        self.non_null = [0] * len(self.columns)
+        self.histogram = [0] * bins
+        self.scored = 0
+        self.score_sum = 0.0
+        self.score_min = self.score_max = None
+        self.head = []
+        self.first_matches = []
+        self.first_non_matches = []
+        # Heaps de tamanho samples: (chave, linha); em empate fica a linha anterior
+        self._top = []
+        self._bottom = []
+
+    def add(self, row):
+        """Counts one result row."""
+        if isinstance(row, dict):
+            values = [_plain(row.get(name)) for name in self.columns]
+        else:
+            values = [_plain(value) for value in row]
+            values += [None] * (len(self.columns) - len(values))
+        index = self.rows
+        self.rows += 1
+        for i, value in enumerate(values):
+            self.non_null[i] += _filled(value)
+        if len(self.head) < self.samples:
+            self.head.append(values)
+
+        if self._match is not None:
+            if _filled(values[self._match]):
+                self.matches += 1
+                if len(self.first_matches) < self.samples:
+                    self.first_matches.append(values)
+            elif len(self.first_non_matches) < self.samples:
+                self.first_non_matches.append(values)
+
+        score = parse_score(values[self._score]) if self._score is not None else None
+        if score is not None:
+            self.scored += 1
+            self.score_sum += score
+            self.score_min = score if self.score_min is None else min(self.score_min, score)
+            self.score_max = score if self.score_max is None else max(self.score_max, score)
+            self.histogram[min(max(int(score * self.bins), 0), self.bins - 1)] += 1
+            if self.samples:
+                for heap, key in ((self._top, (score, -index)), (self._bottom, (-score, -index))):
+                    if len(heap) < self.samples:
+                        heapq.heappush(heap, (key, values))
+                    elif key > heap[0][0]:
+                        heapq.heapreplace(heap, (key, values))
+
+    def add_rows(self, rows):
+        """Counts every row of an iterable; returns self."""
+        for row in rows:
+            self.add(row)
+        return self
+
+    def sample(self, name):
+        """Rows of a SAMPLE_LABELS sample, as lists in column order (top: highest score first)."""
+        if name in ('top', 'bottom'):
+            return [values for _, values in sorted(getattr(self, '_' + name), reverse=True)]
+        return getattr(self, name)
+
+    def to_dict(self):
+        matched = self._match is not None
+        width = 1 / self.bins
+        return {
+            'source': None if self.source is None else str(self.source),
+            'columns': self.columns,
+            'rows': self.rows,
+            'match_column': self.match_column,
+            'matches': self.matches if matched else None,
+            'non_matches': self.rows - self.matches if matched else None,
+            'match_rate': self.matches / self.rows if matched and self.rows else None,
+            'non_null': dict(zip(map(str, self.columns), self.non_null)),
+            'score': None if self._score is None else {
+                'column': self.score_column,
+                'rows': self.scored,
+                'mean': self.score_sum / self.scored if self.scored else None,
+                'min': self.score_min,
+                'max': self.score_max,
+                'histogram': [{'from': round(i * width, 6), 'to': round((i + 1) * width, 6), 'rows': n}
+                              for i, n in enumerate(self.histogram)],
+            },
+            'samples': {name: [dict(zip(map(str, self.columns), values)) for values in self.sample(name)]
+                        for name in SAMPLE_LABELS
+                        if (name not in ('first_matches', 'first_non_matches') or matched)
+                        and (name not in ('top', 'bottom') or self._score is not None)},
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False, default=str)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_json())
+
+    def text_lines(self):
+        """Human-readable report (counts, histogram and the samples as tables)."""
+        report = self.to_dict()
+        lines = [f"{'='*20} {report['source'] or 'Resultado'} {'='*20}",
+                 f"Linhas: {report['rows']:,} | Colunas: {len(self.columns)}"]
+        if report['matches'] is not None:
+            lines.append(f"Matches ({self.match_column} preenchido): {report['matches']:,} "
+                         f"({report['match_rate'] or 0:.2%}) | sem match: {report['non_matches']:,}")
+        lines.append("")
+        lines.append("Células preenchidas por coluna:")
+        width = max((len(name) for name in report['non_null']), default=0)
+        for name, n in report['non_null'].items():
+            lines.append(f"  {name:<{width}} {n:>9,}")
+
+        score = report['score']
+        if score is not None and score['rows']:
+            lines.append("")
+            lines.append(f"{self.score_column}: {score['rows']:,} linhas | média {score['mean']:.2%} | "
+                         f"mín. {score['min']:.2%} | máx. {score['max']:.2%}")
+            # Só as faixas entre a menor e a maior similaridade
+            filled = [i for i, b in enumerate(score['histogram']) if b['rows']]
+            histogram = score['histogram'][filled[0]:filled[-1] + 1]
+            peak = max(b['rows'] for b in histogram)
+            for b in histogram:
+                lines.append(f"  {b['from']:>4.0%} - {b['to']:>4.0%} {b['rows']:>9,} "
+                             + '#' * round(40 * b['rows'] / peak))
+
+        for name, rows in report['samples'].items():
+            lines.append("")
+            lines.append("=" * 60)
+            lines.append(f"{SAMPLE_LABELS[name].upper()} ({len(rows)})")
+            lines.append("=" * 60)
+            if rows:
+                # Células como texto: códigos não viram float ao lado das vazias
+                cells = [['' if value is None else str(value) for value in row.values()] for row in rows]
+                lines.append(pd.DataFrame(cells, columns=list(report['non_null'])).to_string(
+                    index=False, max_colwidth=TEXT_COLWIDTH))
+        return lines
+
+    def save_text(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.text_lines()) + '\n')
+
+
+def report_file(source, fmt=None, **options):
+    """ResultReport of a table file (path, bytes or file-like), read in one streaming pass."""
+    rows = TableRows(source, fmt)
+    options.setdefault('source', source if isinstance(source, (str, os.PathLike)) else None)
+    return ResultReport(rows.columns, **options).add_rows(rows)
@@ -0,0 +1,84 @@
+"""
+Similaridade de texto plugável
+'ratio' é o difflib.SequenceMatcher.ratio() histórico do sistema. 'indel' é
+a similaridade Indel normalizada, 1 - (inserções + remoções) / (len(a) + len(b)),
+ou seja 2*LCS / (len(a) + len(b)), a mesma métrica de rapidfuzz.fuzz.ratio:
+usa o rapidfuzz quando instalado e, senão, um LCS bit-paralelo em inteiros
+do Python. As duas ficam sempre abaixo do quick_ratio (interseção dos
+multiconjuntos de caracteres), que o BatchMatcher usa como limite superior.
+"""
+
+from difflib import SequenceMatcher
+
+try:
+    from rapidfuzz.distance import Indel as _rapidfuzz_indel
+except ImportError:  # optional dependency
+    _rapidfuzz_indel = None
+
+DEFAULT_SIMILARITY = 'ratio'
+
+
+def _sequence_matcher_scorer(query):
+    def score(candidate):
+        return SequenceMatcher(None, query, candidate).ratio()
+    return score
+
+
+def _lcs_length(masks, n, candidate):
+    """Bit-parallel LCS length (Hyyrö) of the query encoded in masks against candidate."""
+    v = (1 << n) - 1
+    for ch in candidate:
+        u = v & masks.get(ch, 0)
+        v = (v + u) | (v - u)
+    v &= (1 << n) - 1
+    return n - bin(v).count('1')
+
+
+def _indel_scorer(query):
+    if _rapidfuzz_indel is not None:
+        normalized_similarity = _rapidfuzz_indel.normalized_similarity
+
+        def score(candidate):
+            return normalized_similarity(query, candidate)
+        return score
+
+    # Máscara de posições de cada caractere da consulta, montada uma vez por consulta
+    masks = {}
+    for i, ch in enumerate(query):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    n = len(query)
+
+    def score(candidate):
+        total = n + len(candidate)
+        if not total:
+            return 1.0
+        distance = total - 2 * _lcs_length(masks, n, candidate)
+        return 1 - distance / total
+    return score
+
+
+SIMILARITY_BACKENDS = {
+    'ratio': _sequence_matcher_scorer,
+    'indel': _indel_scorer,
+}
+
+# Rótulos para as interfaces
+SIMILARITY_LABELS = {
+    'ratio': "SequenceMatcher (padrão)",
+    'indel': "Indel/LCS (mais rápido)",
+}
+
+
+def similarity_scorer(name, query):
+    """
+    Returns score(candidate) -> similarity in [0, 1] of query against
+    candidate for the named backend ('ratio' or 'indel').
+    """
+    try:
+        factory = SIMILARITY_BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Similaridade desconhecida: {name!r}. Opções: {', '.join(SIMILARITY_BACKENDS)}"
+        ) from None
+    return factory(query)
+
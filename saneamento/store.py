@@ -0,0 +1,273 @@
+"""
+Resultados persistentes para re-matching incremental
+Cada resultado fica num SQLite com a chave (texto da base normalizado em
+caixa e espaços, versão do catálogo RHC, hash da configuração do score). Numa nova execução
+as linhas já vistas voltam direto do banco e só as novas ou editadas passam
+pelo matcher. Quando o catálogo RHC muda, o resultado da versão anterior é
+reaproveitado nas linhas que não têm nenhum token indexado em comum com os
+itens incluídos ou removidos; só as demais são pontuadas de novo.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from saneamento.batch import MIN_TOKEN_LEN
+from saneamento.blocking import especie_block
+from saneamento.catalogue import CACHE_DIR, rules_fingerprint
+from saneamento.matcher import Candidate, MatchResult
+from saneamento.normalization import normalize_pharmaceutical_text
+
+STORE_FILE = 'resultados.sqlite'
+
+# Versões do catálogo mantidas por configuração (as menos usadas são apagadas)
+MAX_VERSIONS = 5
+
+# Resultados novos gravados por transação
+COMMIT_EVERY = 1000
+
+# Segundos que uma conexão espera pelo lock de escrita de outra (execuções simultâneas
+# do JobRunner gravam no mesmo banco)
+BUSY_TIMEOUT_S = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    config TEXT, catalogue TEXT, n_items INTEGER, last_used REAL,
+    PRIMARY KEY (config, catalogue)
+);
+CREATE TABLE IF NOT EXISTS catalogue_items (catalogue TEXT, code, product);
+CREATE INDEX IF NOT EXISTS catalogue_items_catalogue ON catalogue_items (catalogue);
+CREATE TABLE IF NOT EXISTS results (
+    config TEXT, catalogue TEXT, text TEXT, block TEXT,
+    rhc_code, rhc_product, score REAL, shortlist TEXT,
+    PRIMARY KEY (config, catalogue, text, block)
+) WITHOUT ROWID;
+"""
+
+
+def config_hash(matcher):
+    """Hash of the options that change a result (threshold, best_match options, shortlist)."""
+    config = {
+        'threshold': matcher.threshold,
+        'shortlist': matcher.shortlist,
+        'shortlist_min_score': matcher.shortlist_min_score if matcher.shortlist > 1 else None,
+        **matcher.options,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def catalogue_version(catalogue):
+    """catalogue_key of a catalogue loaded from a workbook, otherwise a hash of its items and rules."""
+    if catalogue.catalogue_key:
+        return catalogue.catalogue_key
+    digest = hashlib.sha256(repr(list(zip(catalogue.codes, catalogue.products))).encode('utf-8'))
+    digest.update(rules_fingerprint().encode('ascii'))
+    return digest.hexdigest()[:32]
+
+
+def _indexed_tokens(norm):
+    return {token for token in norm.split() if len(token) >= MIN_TOKEN_LEN}
+
+
+def text_key(product):
+    """
+    Store key of a base product text: upper-cased, whitespace collapsed.
+    Every matching feature (normalized text, concentrations, brand) comes
+    from this string, so equal keys always get equal results.
+    """
+    if product is None or pd.isna(product):
+        return ''
+    return ' '.join(str(product).upper().split())
+
+
+def _item_key(code, product):
+    # Como texto: o catálogo lido do .npz traz códigos mistos como texto
+    return str(code), str(product)
+
+
+class ResultStore:
+    """
+    SQLite store of match results, reused across runs by Matcher.match(store=...).
+
+    path defaults to resultados.sqlite in the catalogue cache directory
+    (SANEAMENTO_CACHE_DIR). A result is looked up by the base row's text
+    (text_key, plus its ESPÉCIE block when blocking), the catalogue
+    version and the scoring configuration, so the same text in another row
+    or another upload is not scored again. Several stores may be open on
+    the same file at once (one per job): the database runs in WAL mode and
+    a writer waits up to BUSY_TIMEOUT_S for another one's transaction.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, STORE_FILE)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Streamlit e Tkinter rodam o matching fora da thread que criou a conexão
+        self._db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S, check_same_thread=False)
+        # WAL: leituras não esperam a gravação de outra execução, e as gravações esperam a vez
+        # (até BUSY_TIMEOUT_S) em vez de falhar com "database is locked"
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _previous_version(self, config, version):
+        return self._db.execute(
+            "SELECT catalogue, n_items FROM versions WHERE config = ? AND catalogue != ? "
+            "ORDER BY last_used DESC LIMIT 1", (config, version)).fetchone()
+
+    def _register(self, config, version, catalogue):
+        db = self._db
+        with db:
+            if db.execute("SELECT 1 FROM catalogue_items WHERE catalogue = ? LIMIT 1", (version,)).fetchone() is None:
+                db.executemany("INSERT INTO catalogue_items VALUES (?, ?, ?)",
+                               ((version, code, product) for code, product in zip(catalogue.codes, catalogue.products)))
+            db.execute("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?)",
+                       (config, version, len(catalogue), time.time()))
+            stale = [row[0] for row in db.execute(
+                "SELECT catalogue FROM versions WHERE config = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+                (config, MAX_VERSIONS))]
+            for old in stale:
+                db.execute("DELETE FROM versions WHERE config = ? AND catalogue = ?", (config, old))
+                db.execute("DELETE FROM results WHERE config = ? AND catalogue = ?", (config, old))
+            db.execute("DELETE FROM catalogue_items WHERE catalogue NOT IN (SELECT catalogue FROM versions)")
+
+    def changed_tokens(self, previous, previous_n, catalogue, max_df=None):
+        """
+        Indexed tokens of the items added to or removed from the previous
+        catalogue version, plus the tokens whose max_df cut-off flips because
+        the catalogue size changed. A base row sharing none of them gets the
+        same candidates, hence the same result, in both versions (with
+        max_candidates, the IDF order of a truncated candidate list can still
+        shift with the catalogue size; verify_store.py measures it).
+        """
+        old_items = {_item_key(code, product) for code, product in self._db.execute(
+            "SELECT code, product FROM catalogue_items WHERE catalogue = ?", (previous,))}
+        changed = old_items.symmetric_difference(map(_item_key, catalogue.codes, catalogue.products))
+        tokens = set()
+        for _, product in changed:
+            tokens |= _indexed_tokens(normalize_pharmaceutical_text(product))
+
+        if max_df is not None and max_df < 1 and previous_n != len(catalogue):
+            low, high = sorted((max_df * previous_n, max_df * len(catalogue)))
+            flipped = np.flatnonzero((catalogue.doc_freq > low) & (catalogue.doc_freq <= high))
+            names = {i: token for token, i in catalogue.vocab.items()}
+            tokens.update(names[i] for i in flipped.tolist())
+        return tokens
+
+    def _lookup(self, config, version, text, block, positions):
+        row = self._db.execute(
+            "SELECT rhc_code, rhc_product, score, shortlist FROM results "
+            "WHERE config = ? AND catalogue = ? AND text = ? AND block = ?", (config, version, text, block)).fetchone()
+        if row is None:
+            return None
+        rhc_code, rhc_product, score, shortlist = row
+        position = None
+        if rhc_product is not None:
+            position = positions.get(_item_key(rhc_code, rhc_product))
+            if position is None:
+                return None
+        candidates = ()
+        if shortlist is not None:
+            candidates = []
+            for code, product, *terms in json.loads(shortlist):
+                pos = positions.get(_item_key(code, product))
+                if pos is None:
+                    return None
+                candidates.append(Candidate(code, product, *terms, pos))
+            candidates = tuple(candidates)
+        return rhc_code, rhc_product, score, position, candidates
+
+    def match(self, matcher, rows, stats=None):
+        """
+        Yields a MatchResult per ProductRow, in input order, like
+        matcher.match(rows): stored results are returned directly and only
+        the remaining rows go through the matcher (in order, same workers).
+        stats gets 'store_hits' (same catalogue), 'store_reused' (previous
+        catalogue, untouched tokens) and 'store_scored'.
+        """
+        catalogue = matcher.catalogue
+        config = config_hash(matcher)
+        version = catalogue_version(catalogue)
+        previous = self._previous_version(config, version)
+        self._register(config, version, catalogue)
+        changed = self.changed_tokens(*previous, catalogue, matcher.max_df) if previous else None
+
+        positions = {}
+        for pos, item in enumerate(map(_item_key, catalogue.codes, catalogue.products)):
+            positions.setdefault(item, pos)
+
+        def key(row):
+            block = (especie_block(row.especie) or '') if matcher.blocking else ''
+            return text_key(row.product), block
+
+        # Linhas lidas e ainda não devolvidas: (linha, chave, resultado guardado ou None)
+        pending = deque()
+        new_results = []
+
+        def misses():
+            for row in rows:
+                text, block = key(row)
+                stored = self._lookup(config, version, text, block, positions)
+                source = 'store_hits'
+                if stored is None and changed is not None and \
+                        _indexed_tokens(normalize_pharmaceutical_text(row.product)).isdisjoint(changed):
+                    stored = self._lookup(config, previous[0], text, block, positions)
+                    source = 'store_reused'
+                    if stored is not None:
+                        new_results.append((text, block, stored))
+                if stored is not None and stats is not None:
+                    stats[source] += 1
+                pending.append((row, (text, block), stored))
+                if stored is None:
+                    yield row
+
+        def save():
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((config, version, text, block, rhc_code, rhc_product, score,
+                      json.dumps([candidate[:-1] for candidate in shortlist]) if matcher.shortlist > 1 else None)
+                     for text, block, (rhc_code, rhc_product, score, _, shortlist) in new_results))
+            new_results.clear()
+
+        # Resultados do matcher (só das linhas sem resultado guardado), na ordem das linhas
+        scored = matcher.match(misses(), stats=stats)
+        ready = deque()
+        exhausted = False
+        try:
+            while True:
+                while pending and (pending[0][2] is not None or ready):
+                    row, (text, block), stored = pending.popleft()
+                    if stored is not None:
+                        yield MatchResult(row.code, row.product, *stored)
+                        continue
+                    result = ready.popleft()
+                    if stats is not None:
+                        stats['store_scored'] += 1
+                    new_results.append((text, block, (result.rhc_code, result.rhc_product, result.score, result.position,
+                                                       result.shortlist)))
+                    if len(new_results) >= COMMIT_EVERY:
+                        save()
+                    yield result
+                if exhausted:
+                    break
+                try:
+                    ready.append(next(scored))
+                except StopIteration:
+                    exhausted = True
+        finally:
+            scored.close()
+            save()
@@ -0,0 +1,218 @@
+"""
+Gravação incremental do resultado do matching
+Cada linha de resultado é gravada assim que é produzida: XLSX pelo
+xlsxwriter em modo constant_memory, CSV pelo módulo csv e Parquet ou
+Feather (se o pyarrow estiver instalado) em lotes. O pico de memória não
+cresce com o tamanho do resultado; não há lista de dicts nem DataFrame
+intermediário. write_table grava um DataFrame inteiro (de-para) no formato
+da extensão do arquivo.
+"""
+
+import csv
+import io
+import math
+import os
+
+import xlsxwriter
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional dependency
+    pyarrow = None
+
+RESULT_COLUMNS = ['CÓDIGO BASE', 'PRODUTO BASE', 'CÓDIGO RHC', 'PRODUTO RHC', 'SIMILARIDADE']
+
+# Com a etapa de chave exata (Matcher(exact_first=True)): ORIGEM diz qual etapa achou o match
+TIERED_RESULT_COLUMNS = RESULT_COLUMNS + ['ORIGEM']
+
+# Lista de revisão em formato longo: uma linha por candidato (ver Matcher(shortlist=k))
+SHORTLIST_COLUMNS = [
+    'CÓDIGO BASE', 'PRODUTO BASE', 'ORDEM', 'CÓDIGO RHC', 'PRODUTO RHC', 'SIMILARIDADE',
+    'TEXTO', 'PRINCÍPIO ATIVO', 'CONCENTRAÇÃO', 'MARCA',
+]
+
+OUTPUT_FORMATS = {
+    'xlsx': ("Excel (.xlsx)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'csv': ("CSV (.csv)", "text/csv"),
+    'parquet': ("Parquet (.parquet)", "application/octet-stream"),
+    'feather': ("Feather (.feather)", "application/octet-stream"),
+}
+
+# Formatos colunares (precisam do pyarrow)
+ARROW_FORMATS = ('parquet', 'feather')
+
+# Linhas por lote gravado no Parquet/Feather
+PARQUET_BATCH_ROWS = 10_000
+
+
+def available_formats():
+    """Output formats usable in this environment (parquet and feather need pyarrow)."""
+    return [fmt for fmt in OUTPUT_FORMATS if fmt not in ARROW_FORMATS or pyarrow is not None]
+
+
+def formats_label(formats=None):
+    """'.xlsx, .csv, .parquet ou .feather': the output extensions (default available_formats()) for the interfaces."""
+    extensions = [f".{fmt}" for fmt in (formats or available_formats())]
+    return extensions[0] if len(extensions) == 1 else f"{', '.join(extensions[:-1])} ou {extensions[-1]}"
+
+
+def format_from_path(path, default='xlsx'):
+    """'resultado.csv' -> 'csv'; unknown or missing extension -> default."""
+    ext = os.path.splitext(str(path))[1].lower().lstrip('.')
+    return ext if ext in OUTPUT_FORMATS else default
+
+
+def sheet_path(path, name):
+    """('resultado.csv', 'Conflitos') -> 'resultado_conflitos.csv': a companion table next to the result."""
+    root, ext = os.path.splitext(str(path))
+    return f"{root}_{name.lower()}{ext}"
+
+
+def shortlist_path(path):
+    """'resultado.xlsx' -> 'resultado_candidatos.xlsx' (the long-format shortlist next to the result)."""
+    return sheet_path(path, 'candidatos')
+
+
+def _clean(value):
+    # NaN vira célula vazia (o xlsxwriter não grava NaN)
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class ResultWriter:
+    """
+    Appends result rows to an XLSX, CSV, Parquet or Feather file as they are produced.
+
+    target is a path or a binary file object (e.g. a temporary file for a
+    download). fmt defaults to the path's extension. Use as a context
+    manager, or call close(); rows written counts the data rows.
+    """
+
+    def __init__(self, target, columns=RESULT_COLUMNS, fmt=None, sheet_name='Resultado'):
+        self.fmt = fmt or format_from_path(target if isinstance(target, (str, os.PathLike)) else '')
+        if self.fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de saída desconhecido: {self.fmt!r}. Opções: {', '.join(OUTPUT_FORMATS)}")
+        if self.fmt in ARROW_FORMATS and pyarrow is None:
+            raise ValueError(f"O formato {self.fmt} precisa do pacote pyarrow (pip install pyarrow).")
+
+        self.columns = list(columns)
+        self.rows_written = 0
+        self._closed = False
+
+        if self.fmt == 'xlsx':
+            self._workbook = xlsxwriter.Workbook(target, {
+                'constant_memory': True,
+                'strings_to_formulas': False,
+                'strings_to_urls': False,
+            })
+            self._sheet = self._workbook.add_worksheet(sheet_name)
+            header_format = self._workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+            self._sheet.write_row(0, 0, self.columns, header_format)
+        elif self.fmt == 'csv':
+            self._own_file = isinstance(target, (str, os.PathLike))
+            binary = open(target, 'wb') if self._own_file else target
+            # utf-8 com BOM e ';' para o Excel em português abrir direto
+            self._text = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='', write_through=True)
+            self._csv = csv.writer(self._text, delimiter=';')
+            self._csv.writerow(self.columns)
+        else:
+            self._target = target
+            self._batch = []
+            self._arrow = None
+
+    def write_row(self, values):
+        """Appends one row (a sequence in column order, or a dict keyed by column)."""
+        if isinstance(values, dict):
+            values = [values.get(column) for column in self.columns]
+        values = [_clean(v) for v in values]
+
+        self.rows_written += 1
+        if self.fmt == 'xlsx':
+            self._sheet.write_row(self.rows_written, 0, values)
+        elif self.fmt == 'csv':
+            self._csv.writerow(['' if v is None else v for v in values])
+        else:
+            self._batch.append(values)
+            if len(self._batch) >= PARQUET_BATCH_ROWS:
+                self._flush_arrow()
+
+    def _flush_arrow(self):
+        # Todas as colunas como texto: o schema não muda entre lotes (códigos mistos, lotes só com nulos)
+        schema = pyarrow.schema([(column, pyarrow.string()) for column in self.columns])
+        columns = list(zip(*self._batch)) if self._batch else [() for _ in self.columns]
+        arrays = [pyarrow.array([None if v is None else str(v) for v in values], pyarrow.string())
+                  for values in columns]
+        if self._arrow is None:
+            if self.fmt == 'parquet':
+                self._arrow = pyarrow.parquet.ParquetWriter(self._target, schema)
+            else:
+                # Feather v2 = arquivo Arrow IPC, gravado lote a lote
+                self._arrow = pyarrow.ipc.new_file(self._target, schema)
+        self._arrow.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+        self._batch = []
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.fmt == 'xlsx':
+            self._workbook.close()
+        elif self.fmt == 'csv':
+            self._text.flush()
+            if self._own_file:
+                self._text.close()
+            else:
+                self._text.detach()
+        else:
+            if self._batch or self._arrow is None:
+                self._flush_arrow()
+            self._arrow.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _arrow_safe(df):
+    # Colunas de objetos com tipos mistos (códigos 123 e 'A-1', células 'a | b') vão como texto
+    mixed = [column for column in df.columns if df[column].dtype == object
+             and df[column].dropna().map(type).nunique() > 1]
+    return df.astype({column: 'string' for column in mixed}) if mixed else df
+
+
+def write_table(df, path, sheets=None, fmt=None):
+    """
+    Writes a whole DataFrame to path in the format of its extension (xlsx,
+    csv, parquet or feather; fmt overrides it). sheets ({name: DataFrame})
+    are companion tables: more sheets of the workbook, or files at
+    sheet_path(path, name) for the other formats. Returns the paths written.
+    CSV is written as ResultWriter does (UTF-8 with BOM, ';').
+    """
+    fmt = fmt or format_from_path(path)
+    if fmt in ARROW_FORMATS and pyarrow is None:
+        raise ValueError(f"O formato {fmt} precisa do pacote pyarrow (pip install pyarrow).")
+    sheets = sheets or {}
+    if fmt == 'xlsx':
+        with pd.ExcelWriter(path) as writer:
+            df.to_excel(writer, index=False)
+            for name, table in sheets.items():
+                table.to_excel(writer, index=False, sheet_name=name)
+        return [path]
+
+    paths = []
+    for target, table in [(path, df)] + [(sheet_path(path, name), table) for name, table in sheets.items()]:
+        if fmt == 'csv':
+            table.to_csv(target, sep=';', index=False, encoding='utf-8-sig')
+        elif fmt == 'parquet':
+            _arrow_safe(table).to_parquet(target, index=False)
+        else:
+            _arrow_safe(table).reset_index(drop=True).to_feather(target)
+        paths.append(target)
+    return paths
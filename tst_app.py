@@ -5,241 +5,253 @@ Streamlit Version - Otimizado & UI Modernizada
 """
 
 import streamlit as st
-import pandas as pd
-import re
-from difflib import SequenceMatcher
-import io
+import json
+import hashlib
+import os
+import tempfile
+import threading
 import time
+from collections import Counter
+from contextlib import ExitStack, closing
+
+from saneamento.catalogue import load_rhc_catalogue
+from saneamento.instrumentation import (DEFAULT_PROFILE, PROFILE_MODES, RunReport, available_profile_modes,
+                                       timing_rows)
+from saneamento.jobs import JOB_STATES, JobRunner
+from saneamento.matcher import DEFAULT_SHORTLIST_MIN_SCORE, DEFAULT_THRESHOLD, Matcher
+from saneamento.parallel import available_workers
+from saneamento.readers import open_products
+from saneamento.report import ResultReport
+from saneamento.similarity import DEFAULT_SIMILARITY, SIMILARITY_LABELS
+from saneamento.store import ResultStore
+from saneamento.writers import (OUTPUT_FORMATS, RESULT_COLUMNS, SHORTLIST_COLUMNS, TIERED_RESULT_COLUMNS,
+                                ResultWriter, available_formats)
 
 # =============================================================================
-# CONSTANTS & CONFIGURATION
+# CORE LOGIC FUNCTIONS
 # =============================================================================
 
-# Dicionário de sinônimos movido para escopo global para evitar recriação
-PHARMACEUTICAL_SYNONYMS = {
-    # === PRINCÍPIOS ATIVOS ===
-    'CLAV': 'CLAVULANATO', 'CLAVUL': 'CLAVULANATO',
-    'AMOX': 'AMOXICILINA', 'AMOXILINA': 'AMOXICILINA', 'AMOXI': 'AMOXICILINA',
-    'AC.': 'ACIDO', 'AC ': 'ACIDO ',
-    'ACETILSAL': 'ACETILSALICILICO', 'ASS': 'ACETILSALICILICO', 'AAS': 'ACETILSALICILICO',
-    'DIPIR': 'DIPIRONA', 'PARACET': 'PARACETAMOL', 'IBUPRO': 'IBUPROFENO',
-    'CEFALEX': 'CEFALEXINA', 'AZITRO': 'AZITROMICINA', 'CLARITRO': 'CLARITROMICINA',
-    'METFORM': 'METFORMINA', 'ATENOL': 'ATENOLOL', 'CAPTOP': 'CAPTOPRIL',
-    'ENALAPRIL': 'ENALAPRIL', 'LOSART': 'LOSARTANA', 'SINVAST': 'SINVASTATINA',
-    'ATORVAST': 'ATORVASTATINA', 'OMEPRAZ': 'OMEPRAZOL', 'PANTOPRAZ': 'PANTOPRAZOL',
-    'RANITID': 'RANITIDINA',
-    
-    # === SAIS E COMPOSTOS ===
-    'SODICO': 'SODIO', 'POTASSICO': 'POTASSIO', 'CALCICO': 'CALCIO',
-    'CLORIDRATO': 'HCL', 'SULFATO': 'SO4', 'FOSFATO': 'PO4',
-    
-    # === FORMAS FARMACÊUTICAS ===
-    'COMP.': 'COMPRIMIDO', 'COMP ': 'COMPRIMIDO ', 'COMPR': 'COMPRIMIDO', 'CPR': 'COMPRIMIDO',
-    'CAPS': 'CAPSULA', 'CAP': 'CAPSULA',
-    'AMP.': 'AMPOLA', 'AMP ': 'AMPOLA ', 'AMPOLA': 'AMPOLA',
-    'FA.': 'FRASCO', 'FA ': 'FRASCO ', 'FR.': 'FRASCO', 'FR ': 'FRASCO ', 'FRASCO': 'FRASCO',
-    'ENV.': 'ENVELOPE', 'ENV ': 'ENVELOPE ',
-    'SOL.': 'SOLUCAO', 'SOL ': 'SOLUCAO ',
-    'SUSP.': 'SUSPENSAO', 'SUSP ': 'SUSPENSAO ',
-    'XPE': 'XAROPE', 'XAROPE': 'XAROPE',
-    'POM': 'POMADA', 'CREME': 'CREME', 'GEL': 'GEL',
-    'SPRAY': 'SPRAY', 'AEROSOL': 'AEROSOL', 'GOTAS': 'GOTAS', 'COLIR': 'COLIRIO',
-    
-    # === UNIDADES DE MEDIDA ===
-    'GR ': 'G ', 'GR)': 'G)', 'GRS': 'G', 'GRAMA': 'G', 'GRAMAS': 'G',
-    'ML.': 'ML', 'MG.': 'MG', 'G.': 'G', 'MCG': 'MCG', 'MICROG': 'MCG',
-    'UI': 'UI', 'UNIDADES': 'UI', '%': 'PORCENTO',
-    
-    # === OUTROS MAPPINGS ===
-    'VO': 'ORAL', 'IV': 'INTRAVENOSO', 'IM': 'INTRAMUSCULAR',
-    'SC': 'SUBCUTANEO', 'TOP': 'TOPICO',
-    'C/': 'COM', 'S/': 'SEM',
-    ' DE ': ' ', ' DA ': ' ', ' DO ': ' ', ' PARA ': ' ',
-    '(*.*)': '', '*': '', '+': ' ', '-': ' ', '/': ' ', '(': '', ')': '', '[': '', ']': '',
-}
+# Cache the heavy lifting of processing the RHC base.
+# The catalogues live in one CatalogueCache for every session (st.cache_resource, fetched in the
+# script thread like job_runner()); the jobs only call its get(), never a Streamlit cache.
+# The array-backed matcher is read-only and shared, not copied per rerun. Keyed on the upload
+# content; across restarts the catalogue on disk (content hash of the workbook, see
+# saneamento/catalogue.py) is reused.
+class CatalogueCache:
+    """RHC catalogues by upload content, shared by the jobs of every session."""
 
-CONCENTRATION_PATTERNS = [
-    r'\d+\.?\d*\s*MG', r'\d+\.?\d*\s*ML', r'\d+\.?\d*\s*G',
-    r'\d+\.?\d*\s*%', r'\d+\.?\d*\s*MG/\s*\d+\.?\d*\s*ML',
-    r'\d+\.?\d*\s*MCG', r'\d+\.?\d*\s*UI',
-]
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
 
-# =============================================================================
-# CORE LOGIC FUNCTIONS
-# =============================================================================
+    def get(self, rhc_bytes):
+        """
+        (catalogue, memory_hit). The first job asking for an upload builds
+        its catalogue (memory_hit False); jobs asking meanwhile wait for it,
+        and every later one gets a memory hit. A failed build is retried.
+        """
+        key = hashlib.sha256(rhc_bytes).hexdigest()
+        with self._lock:
+            entry = self._entries.setdefault(key, [threading.Lock(), None])
+        with entry[0]:
+            if entry[1] is not None:
+                return entry[1], True
+            # Header validation (CÓDIGO/PRODUTO, optional ESPÉCIE) happens in saneamento/readers.py
+            entry[1] = load_rhc_catalogue(rhc_bytes)
+            return entry[1], False
 
-def normalize_pharmaceutical_text(text):
-    if pd.isna(text):
-        return ""
-    
-    text = str(text).upper().strip()
-    
-    for old, new in PHARMACEUTICAL_SYNONYMS.items():
-        text = text.replace(old, new)
-    text = ' '.join(text.split())
-    return text
+@st.cache_resource(show_spinner=False)
+def rhc_catalogues():
+    return CatalogueCache()
 
-def extract_concentration(text):
-    concentrations = []
-    text_upper = text.upper()
-    for pattern in CONCENTRATION_PATTERNS:
-        matches = re.findall(pattern, text_upper)
-        concentrations.extend(matches)
-    return set(concentrations)
+def discard_output():
+    """Removes the result files of the previous run (kept on disk, not in session memory)."""
+    for key in ('results', 'shortlist_results'):
+        path = st.session_state.get(key)
+        if path and os.path.exists(path):
+            os.remove(path)
+        st.session_state[key] = None
+    st.session_state['processing_complete'] = False
 
-def extract_brand_name(text):
-    match = re.search(r'\(([A-Z]+)\)', text.upper())
-    if match:
-        return match.group(1)
-    return None
+def remove_job_files(job):
+    """Deletes the result files of a job nobody collected (expired by the JobRunner)."""
+    for key in ('results', 'shortlist_results'):
+        path = (job.result or {}).get(key)
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-def normalize_concentrations(concentrations):
-    normalized = set()
-    for conc in concentrations:
-        conc_norm = (
-            conc.replace(' ', '')
-            .replace('GR', 'G')
-            .replace('GRAMA', 'G')
-            .replace('GRAMAS', 'G')
-        )
-        normalized.add(conc_norm)
-    return normalized
+# One runner for every session: SANEAMENTO_MAX_JOBS matchings run at once, the others wait in line.
+# Finished jobs of abandoned sessions expire after SANEAMENTO_JOB_TTL_S, taking their files along.
+@st.cache_resource(show_spinner=False)
+def job_runner():
+    return JobRunner(on_expire=remove_job_files)
+
+# Seconds between progress refreshes of a running job
+JOB_POLL_S = 1.0
 
-def preprocess_item(idx, text, row_data):
+def run_matching_job(job, base_bytes, rhc_bytes, catalogues, workers, similarity, blocking, output_format, shortlist,
+                     incremental, exact_first, profile):
     """
-    Pre-computes all features needed for matching for a single item.
-    Returns a dictionary of features.
+    One matching run, in a JobRunner thread (no Streamlit calls here): reports
+    progress through job and returns what the results section shows. The RHC
+    catalogue comes from catalogues (the shared CatalogueCache). A cancelled
+    or failed run removes its partial result files.
     """
-    norm_text = normalize_pharmaceutical_text(text)
-    
-    # Concentrations
-    raw_concs = extract_concentration(text)
-    norm_concs = normalize_concentrations(raw_concs) if raw_concs else set()
-    
-    # Brand
-    brand = extract_brand_name(text)
-    
-    # Tokens (for indexing) and First 5 words (for active ingredient check)
-    tokens = set(norm_text.split())
-    words_5 = norm_text.split()[:5]
-    
-    return {
-        'id': idx,
-        'original': text,
-        'norm': norm_text,
-        'concs': norm_concs,
-        'brand': brand,
-        'tokens': tokens,
-        'words_5': set(words_5), # Use set for faster intersection O(1) vs O(N)
-        'words_5_len': max(len(set(words_5)), 1),
-        'row': row_data # Store the full row data for result retrieval
-    }
-
-# Cache the heavy lifting of processing the RHC base
-@st.cache_data(show_spinner=False)
-def preprocess_rhc_base(df):
-    
-    if 'PRODUTO' in df.columns:
-        product_col = 'PRODUTO'
-        code_col = df.columns[0]
-    else:
-        product_col = df.columns[1]
-        code_col = df.columns[0]
+    THRESHOLD = DEFAULT_THRESHOLD
+    # Stage timers and counters (always on; profile only when chosen)
+    report = RunReport(profile=profile, workers=workers, similarity=similarity, blocking=blocking,
+                       output_format=output_format, threshold=THRESHOLD, shortlist=shortlist,
+                       incremental=incremental, exact_first=exact_first)
+    output_path = shortlist_path = None
+    try:
+        # 1. Load Data
+        # XLSX/CSV streamed row by row (CÓDIGO, PRODUTO and ESPÉCIE only), Parquet/Feather loaded at once;
+        # the header is validated here
+        job.progress(0, message="📂 Lendo arquivos...")
+        with report.stage('base_read'):
+            base_sheet = open_products(base_bytes)
         
-    processed_items = []
-    inverted_index = {}
-    
-    for idx, row in df.iterrows():
-        item = preprocess_item(idx, row[product_col], row)
-        # Store essential result fields cleanly
-        item['result_code'] = row[code_col]
-        item['result_prod'] = row[product_col]
+        # 2. Pre-process RHC (Heavy lifting, optimized & cached)
+        # The RHC workbook is only read and validated when no catalogue exists for it yet
+        job.progress(0, message="⚙️ Otimizando Base RHC (Indexação)...")
+        with report.stage('rhc_catalogue'):
+            rhc_catalogue, memory_hit = catalogues.get(rhc_bytes)
+        report.count('catalogue_memory_hits', memory_hit)
+        report.count('catalogue_disk_hits', not memory_hit and rhc_catalogue.from_cache)
+        # Same engine, weights and candidate limits as the Tkinter and command-line front-ends
+        matcher = Matcher(threshold=THRESHOLD, similarity=similarity, blocking=blocking,
+                          workers=workers, shortlist=shortlist, exact_first=exact_first).fit(rhc_catalogue)
         
-        processed_items.append(item)
+        # Each result row goes straight to a temporary file (constant memory), not to a list
+        fd, output_path = tempfile.mkstemp(prefix="resultado_matching_", suffix=f".{output_format}")
+        os.close(fd)
+        if shortlist > 1:
+            # Review shortlist in long format: one row per candidate, written in the same pass
+            fd, shortlist_path = tempfile.mkstemp(prefix="candidatos_matching_", suffix=f".{output_format}")
+            os.close(fd)
+        matches_found = 0
+        # Declared by the sheet, for the progress bar; None for a streamed CSV (no bar, row count only)
+        total = base_sheet.n_rows
+
+        # 3. Matching Loop
+        start_time = time.time()
+        job.progress(0, total, "🔍 Iniciando busca de similaridade...")
         
-        # Build Index
-        for token in item['tokens']:
-            if len(token) < 3: continue
-            if token not in inverted_index:
-                inverted_index[token] = []
-            inverted_index[token].append(idx) # Store index in the list
+        # Score all candidates at once (array engine, early exit on the upper bound),
+        # spread over `workers` processes; results come back in input order while the sheet is read
+        # Candidates whose upper bound can't reach THRESHOLD are pruned (counted in stats)
+        stats = Counter()
+        # report.timed: time spent reading the base rows, apart from matching
+        with ExitStack() as outputs:
+            # Results of earlier runs (same text, catalogue and config) come back from the store
+            store = outputs.enter_context(ResultStore()) if incremental else None
+            # Closed before the store: the generator saves its pending results when it ends
+            matches = outputs.enter_context(closing(
+                matcher.match(report.timed(base_sheet, 'base_read'), stats=stats, store=store)))
+            outputs.enter_context(report.stage('matching'))
+            # ORIGEM: which tier (exact key or similarity) produced each match
+            columns = TIERED_RESULT_COLUMNS if exact_first else RESULT_COLUMNS
+            writer = outputs.enter_context(ResultWriter(output_path, columns=columns, fmt=output_format))
+            # Counts, similarity histogram and samples of the rows written, without reading the file back
+            result_report = ResultReport(columns, source=f"resultado_matching_otimizado.{output_format}")
+            shortlist_writer = shortlist_path and outputs.enter_context(ResultWriter(
+                shortlist_path, columns=SHORTLIST_COLUMNS, fmt=output_format, sheet_name='Candidatos'))
+            for idx, result in enumerate(matches):
+                # Result Decision (below THRESHOLD: RHC columns left empty)
+                matches_found += result.matched
+                result_row = result.as_row(columns)
+                with report.stage('write'):
+                    writer.write_row(result_row)
+                    if shortlist_writer:
+                        for row in result.shortlist_rows():
+                            shortlist_writer.write_row(row)
+                with report.stage('result_report'):
+                    result_report.add(result_row)
             
-    return processed_items, inverted_index
+                # Progress (Throttled for performance); also where a cancellation stops the loop
+                if idx % 50 == 0 or idx + 1 == total:
+                    rate = (idx + 1) / (time.time() - start_time)
+                    done = f"{idx+1}/{total}" if total else f"{idx+1} linha(s)"
+                    job.progress(idx + 1, message=f"⚡ Processando: **{done}** | Velocidade: {rate:.1f} itens/seg")
 
-def calculate_similarity_fast(input_item, candidate_item):
-    """
-    Calculates similarity using pre-computed features. 
-    Much faster than the original function.
-    """
-    # 1. Basic Sequence Matcher (still needed, but on cached normalized strings)
-    # Using quick_ratio() first can be an optimization, but .ratio() is robust
-    basic_score = SequenceMatcher(None, input_item['norm'], candidate_item['norm']).ratio()
-    
-    # 2. Concentrations
-    concentration_penalty = 0
-    concentration_bonus = 0
-    
-    if input_item['concs'] and candidate_item['concs']:
-        if input_item['concs'] == candidate_item['concs']:
-            concentration_bonus = 0.15
-        else:
-            concentration_penalty = 0.15
-            
-    # 3. Active Ingredient (Word Overlap)
-    # Using pre-computed sets
-    intersection = len(input_item['words_5'] & candidate_item['words_5'])
-    # Denom needs max length, we stored input's length, check candidate
-    max_len = max(input_item['words_5_len'], candidate_item['words_5_len'])
-    ingredient_overlap = intersection / max_len
-    
-    # 4. Brand
-    brand_bonus = 0
-    if input_item['brand'] and candidate_item['brand'] and input_item['brand'] == candidate_item['brand']:
-        brand_bonus = 0.2
+        # 4. Finalize (column order comes from RESULT_COLUMNS)
+        total = writer.rows_written
+        report.count('rows', total)
+        report.count('matches', matches_found)
+        report.add_stats(stats)
+        report.finish()
         
-    final_score = (
-        (basic_score * 0.35) + 
-        (ingredient_overlap * 0.65) + 
-        concentration_bonus + 
-        brand_bonus - 
-        concentration_penalty
-    )
-    
-    return max(0, min(1, final_score))
+        summary = (
+            f"✅ **Concluído!** {matches_found} matches em {time.time() - start_time:.1f}s | "
+            f"Pares podados: {stats['pruned']:,} de {stats['candidates']:,}"
+            + (f" | Descartados por categoria: {stats['blocked']:,}" if blocking else "")
+            + (f" | Chave exata: {stats['exact_hits']:,} (sem similaridade)" if exact_first else "")
+            + (f" | Consultas repetidas: {stats['memo_hits']:,}" if stats['memo_hits'] else "")
+            + (f" | Reaproveitados: {stats['store_hits'] + stats['store_reused']:,}" if incremental else "")
+        )
+        job.progress(total, total, summary)
+        return {
+            'results': output_path,
+            'shortlist_results': shortlist_path,
+            'output_format': output_format,
+            'total': total,
+            'matches': matches_found,
+            'run_report': report.to_dict(),
+            'result_report': result_report.to_dict(),
+            'result_report_text': '\n'.join(result_report.text_lines()),
+            'job_summary': summary,
+        }
+    except BaseException:
+        # Cancelled or failed: the partial files are not kept
+        for path in (output_path, shortlist_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        report.finish()
 
-def validate_columns(df):
-    """
-    Validates if the DataFrame has exactly 2 columns and normalizes headers.
-    Renames 'CÓDIGO DO PRODUTO' -> 'CÓDIGO', etc.
-    """
-    # Check column count
-    if len(df.columns) != 2:
-        raise ValueError(f"O arquivo deve ter exatamente 2 colunas. Encontrado: {len(df.columns)} colunas.")
-        
-    # Check column names (Flexible)
-    cols = [str(c).upper().strip() for c in df.columns]
-    
-    # Map common variations to standard
-    replacements = {
-        'CÓDIGO DO PRODUTO': 'CÓDIGO',
-        'CODIGO DO PRODUTO': 'CÓDIGO',
-        'CODIGO': 'CÓDIGO',
-        'COD': 'CÓDIGO',
-        'DESCRIÇÃO': 'PRODUTO',
-        'DESCRICAO': 'PRODUTO',
-        'NOME': 'PRODUTO'
-    }
-    
-    new_cols = []
-    for c in cols:
-        new_cols.append(replacements.get(c, c))
-        
-    df.columns = new_cols
+@st.fragment(run_every=JOB_POLL_S)
+def show_job(job_id):
+    """Progress of this session's job, refreshed every JOB_POLL_S; moves the result to session_state when done."""
+    runner = job_runner()
+    job = runner.get(job_id)
+    if job is None:
+        # Server restarted: the job is gone
+        st.session_state['job_id'] = None
+        st.session_state['job_error'] = "A execução foi interrompida (servidor reiniciado). Execute novamente."
+        st.rerun()
     
-    # Final check - warn but don't crash if different, allowing user to proceed if 2 cols exist
-    # (User asked to remove restriction, so we'll trust the 2-column structure is enough for logic)
+    status = st.container(border=True)
+    status.markdown(f"**Status do Processamento** — {JOB_STATES[job.status]}")
+    if job.status == 'queued':
+        ahead = runner.queue_position(job)
+        status.text(f"⏳ Aguardando na fila ({ahead} execução(ões) à frente, "
+                    f"{runner.max_jobs} simultânea(s) no servidor)...")
+    elif not job.is_finished:
+        status.markdown(job.message or "")
+        if job.total:
+            status.progress(job.fraction)
+    if not job.is_finished:
+        if job.cancel_requested:
+            status.text("Cancelando...")
+        elif status.button("⏹️ Cancelar", key=f"cancel_{job_id}"):
+            job.cancel()
+        return
     
-    return True
+    # Finished: results go to session state, the runner forgets the job
+    runner.forget(job_id)
+    st.session_state['job_id'] = None
+    if job.status == 'done':
+        st.session_state.update(job.result)
+        st.session_state['processing_complete'] = True
+    elif job.status == 'failed':
+        st.session_state['job_error'] = f"Erro durante o processamento: {job.error}"
+    else:
+        st.session_state['job_error'] = "Matching cancelado."
+    st.rerun()
 
 # =============================================================================
 # STREAMLIT APP
@@ -255,6 +267,8 @@ def main():
         st.session_state['processing_complete'] = False
     if 'uploader_key' not in st.session_state:
         st.session_state['uploader_key'] = 0
+    if 'job_id' not in st.session_state:
+        st.session_state['job_id'] = None
 
     # Custom CSS
     st.markdown("""
@@ -293,11 +307,11 @@ def main():
     
     # Instructions
     st.info("""
-        **Padrão Obrigatório:** As planilhas devem conter **exatamente duas colunas** nesta ordem:
+        **Padrão Obrigatório:** As duas primeiras colunas das planilhas devem ser, nesta ordem:
         1. **CÓDIGO**
         2. **PRODUTO**
         
-        Arquivos fora deste padrão não serão processados.
+        Uma coluna **ESPÉCIE** opcional é usada na blocagem por categoria. Arquivos fora deste padrão não serão processados.
     """, icon="ℹ️")
 
     upload_container = st.container(border=True)
@@ -305,15 +319,15 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             uploaded_base = st.file_uploader(
-                "Base Atual Unidade (.xlsx)", 
-                type=["xlsx"],
+                "Base Atual Unidade (.xlsx, .csv, .parquet, .feather)", 
+                type=["xlsx", "csv", "parquet", "feather"],
                 key=f"base_{st.session_state.uploader_key}"
             )
             if uploaded_base: st.markdown(f"<small>✅ {uploaded_base.name}</small>", unsafe_allow_html=True)
         with col2:
             uploaded_rhc = st.file_uploader(
-                "Base RHC (.xlsx)", 
-                type=["xlsx"],
+                "Base RHC (.xlsx, .csv, .parquet, .feather)", 
+                type=["xlsx", "csv", "parquet", "feather"],
                 key=f"rhc_{st.session_state.uploader_key}"
             )
             if uploaded_rhc: st.markdown(f"<small>✅ {uploaded_rhc.name}</small>", unsafe_allow_html=True)
@@ -324,148 +338,164 @@ def main():
     st.markdown("### 2. Processamento")
     
     if uploaded_base and uploaded_rhc:
+        workers = st.number_input(
+            "Processos paralelos",
+            min_value=1,
+            max_value=available_workers(),
+            value=1,
+            help="Número de núcleos usados no matching. O resultado é idêntico ao de 1 processo."
+        )
+        similarity = st.selectbox(
+            "Similaridade de texto",
+            options=list(SIMILARITY_LABELS),
+            index=list(SIMILARITY_LABELS).index(DEFAULT_SIMILARITY),
+            format_func=SIMILARITY_LABELS.get,
+            help="Indel/LCS é bem mais rápido e dá scores próximos, mas não idênticos, aos do SequenceMatcher."
+        )
+        blocking = st.checkbox(
+            "Blocagem por categoria (medicamento × material)",
+            value=False,
+            help="Compara só itens da mesma categoria (coluna ESPÉCIE ou inferida do texto). "
+                 "Se a categoria não tiver candidatos, usa o catálogo inteiro."
+        )
+        output_format = st.selectbox(
+            "Formato do resultado",
+            options=available_formats(),
+            format_func=lambda fmt: OUTPUT_FORMATS[fmt][0],
+            help="As linhas são gravadas no arquivo à medida que o matching avança."
+        )
+        shortlist = st.number_input(
+            "Candidatos por produto (lista de revisão)",
+            min_value=1,
+            max_value=20,
+            value=1,
+            help=f"Acima de 1, gera também uma planilha com os melhores candidatos de cada produto "
+                 f"(score a partir de {DEFAULT_SHORTLIST_MIN_SCORE:.0%}) e os termos do score, na mesma passada."
+        )
+        # Result reuse and the exact-key tier are opt-in: off by default, each run scores every row
+        incremental = st.checkbox(
+            "Reaproveitar resultados de execuções anteriores",
+            value=False,
+            help="Linhas com o mesmo texto, catálogo e configuração voltam do banco de resultados; "
+                 "só as novas ou editadas são pontuadas. Se o catálogo mudou, só as linhas com tokens "
+                 "em comum com os itens alterados."
+        )
+        exact_first = st.checkbox(
+            "Resolver nomes idênticos pela chave exata",
+            value=False,
+            help="Produtos cujo nome normalizado (sem acentos, maiúsculas/minúsculas e espaços nas pontas) "
+                 "é igual ao de um item RHC são resolvidos direto, com 100%; só os demais passam pela "
+                 "similaridade. A coluna ORIGEM indica a etapa de cada match."
+        )
+        profile_modes = available_profile_modes()
+        profile = st.selectbox(
+            "Perfil de execução",
+            options=profile_modes,
+            index=profile_modes.index(DEFAULT_PROFILE) if DEFAULT_PROFILE in profile_modes else 0,
+            format_func=PROFILE_MODES.get,
+            help="Os tempos por etapa são sempre medidos. O perfil detalha as funções (só o processo principal) "
+                 "e deixa a execução mais lenta."
+        )
+        
         # Check if we need to process (Button click)
-        if st.button("▶️ Executar Matching", type="primary", use_container_width=True):
-            
-            status = st.container(border=True)
-            status.markdown("**Status do Processamento**")
-            log = status.empty()
-            pbar = status.progress(0)
-            
-            try:
-                # 1. Load Data
-                log.text("📂 Lendo arquivos Excel...")
-                df_base = pd.read_excel(uploaded_base)
-                
-                # Validation Base
-                validate_columns(df_base)
-                
-                df_rhc = pd.read_excel(uploaded_rhc)
-                
-                # Validation RHC
-                validate_columns(df_rhc)
-                
-                # 2. Pre-process RHC (Heavy lifting, optimized & cached)
-                log.text("⚙️ Otimizando Base RHC (Indexação)...")
-                rhc_items, rhc_index = preprocess_rhc_base(df_rhc)
-                
-                results = []
-                matches_found = 0
-                total = len(df_base)
-                THRESHOLD = 0.75
-                
-                # Identifica colunas da Base Input
-                col_code = df_base.columns[0]
-                col_prod = df_base.columns[1]
-
-                # 3. Matching Loop
-                start_time = time.time()
-                log.text("🔍 Iniciando busca de similaridade...")
-                
-                for idx, row in df_base.iterrows():
-                    
-                    # Preprocess Single Input Item
-                    input_text = row[col_prod]
-                    input_item = preprocess_item(idx, input_text, row)
-                    
-                    # Find candidates via index
-                    candidate_indices = set()
-                    for token in input_item['tokens']:
-                        if len(token) < 3: continue
-                        if token in rhc_index:
-                            candidate_indices.update(rhc_index[token])
-                    
-                    best_match = None
-                    best_score = 0
-                    
-                    if candidate_indices:
-                        # Scan only candidates
-                        for cand_idx in candidate_indices:
-                            cand_item = rhc_items[cand_idx] # Direct access via list index
-                            
-                            score = calculate_similarity_fast(input_item, cand_item)
-                            
-                            if score > best_score:
-                                best_score = score
-                                best_match = cand_item
-                    
-                    # Result Decision
-                    res_entry = {
-                        'CÓDIGO BASE': row[col_code],
-                        'PRODUTO BASE': input_text,
-                        'CÓDIGO RHC': None,
-                        'PRODUTO RHC': None,
-                        'SIMILARIDADE': None
-                    }
-                    
-                    if best_score >= THRESHOLD and best_match:
-                        res_entry['CÓDIGO RHC'] = best_match['result_code']
-                        res_entry['PRODUTO RHC'] = best_match['result_prod']
-                        res_entry['SIMILARIDADE'] = f"{best_score:.2%}"
-                        matches_found += 1
-                        
-                    results.append(res_entry)
-                    
-                    # UI Update (Throttled for performance)
-                    if idx % 50 == 0 or idx == total - 1:
-                        prog = (idx + 1) / total
-                        pbar.progress(prog)
-                        rate = (idx + 1) / (time.time() - start_time)
-                        log.markdown(f"⚡ Processando: **{idx+1}/{total}** | Velocidade: {rate:.1f} itens/seg")
-
-                # 4. Finalize
-                df_results = pd.DataFrame(results)
-                # Ensure column order
-                cols_order = ['CÓDIGO BASE', 'PRODUTO BASE', 'CÓDIGO RHC', 'PRODUTO RHC', 'SIMILARIDADE']
-                df_results = df_results[cols_order]
-                
-                log.markdown(f"✅ **Concluído!** {matches_found} matches em {time.time() - start_time:.1f}s")
-                pbar.progress(1.0)
-                
-                # Store in session state
-                st.session_state['results'] = df_results
-                st.session_state['processing_complete'] = True
-                st.session_state['total'] = total
-                st.session_state['matches'] = matches_found
-                st.rerun()
-
-            except Exception as e:
-                st.error(f"Erro durante o processamento: {e}")
-
+        # The run goes to the shared job queue: it survives reruns and waits its turn behind other users' runs
+        if st.button("▶️ Executar Matching", type="primary", use_container_width=True,
+                     disabled=bool(st.session_state.get('job_id'))):
+            discard_output()
+            job = job_runner().submit(
+                run_matching_job, uploaded_base.getvalue(), uploaded_rhc.getvalue(), rhc_catalogues(),
+                name=uploaded_base.name,
+                workers=workers, similarity=similarity, blocking=blocking, output_format=output_format,
+                shortlist=shortlist, incremental=incremental, exact_first=exact_first, profile=profile)
+            st.session_state['job_id'] = job.id
     else:
         st.info("👆 Anexe as planilhas para começar.")
 
+    # Running or queued job of this session (polled; reruns and other widgets don't stop it)
+    if st.session_state['job_id']:
+        show_job(st.session_state['job_id'])
+    job_error = st.session_state.pop('job_error', None)
+    if job_error:
+        st.error(job_error)
+
     # 3. Results Display (Persistent)
     if st.session_state.get('processing_complete') and st.session_state.get('results') is not None:
         
         st.divider()
         st.markdown("### 3. Resultados")
         
-        df_results = st.session_state['results']
+        output_path = st.session_state['results']
+        output_format = st.session_state['output_format']
         total = st.session_state['total']
         matches_found = st.session_state['matches']
         
+        if st.session_state.get('job_summary'):
+            st.markdown(st.session_state['job_summary'])
         m1, m2, m3 = st.columns(3)
         m1.metric("Total de Itens", total)
         m2.metric("Matches Encontrados", matches_found)
-        m3.metric("Eficiência", f"{matches_found/total*100:.1f}%")
+        m3.metric("Eficiência", f"{matches_found/total*100:.1f}%" if total else "-")
         
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df_results.to_excel(writer, index=False, sheet_name='Resultado')
+        with open(output_path, 'rb') as output:
+            st.download_button(
+                f"📥 BAIXAR RESULTADO ({output_format.upper()})",
+                data=output,
+                file_name=f"resultado_matching_otimizado.{output_format}",
+                mime=OUTPUT_FORMATS[output_format][1],
+                type="primary",
+                use_container_width=True
+            )
+        shortlist_path = st.session_state.get('shortlist_results')
+        if shortlist_path:
+            with open(shortlist_path, 'rb') as output:
+                st.download_button(
+                    f"📋 BAIXAR LISTA DE REVISÃO ({output_format.upper()})",
+                    data=output,
+                    file_name=f"candidatos_matching.{output_format}",
+                    mime=OUTPUT_FORMATS[output_format][1],
+                    use_container_width=True
+                )
         
-        st.download_button(
-            "📥 BAIXAR RESULTADO (XLSX)",
-            data=output.getvalue(),
-            file_name="resultado_matching_otimizado.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            type="primary",
-            use_container_width=True
-        )
+        run_report = st.session_state.get('run_report')
+        if run_report:
+            with st.expander("📊 Relatório de execução"):
+                st.markdown(
+                    f"**{run_report['wall_s']:.2f}s** no total | **{run_report['rows_per_s']:.1f}** linhas/s | "
+                    f"**{run_report['candidates_per_query']:.1f}** candidatos/consulta | "
+                    f"**{run_report['similarity_calls']:,}** chamadas de similaridade | "
+                    f"**{run_report['pruned_share']:.1%}** dos pares podados | "
+                    f"**{run_report['memo_hit_rate']:.1%}** de consultas repetidas "
+                    f"(~{run_report['memo_saved_s']:.2f}s poupados) | "
+                    f"**{run_report['exact_share']:.1%}** resolvidos pela chave exata "
+                    f"(~{run_report['exact_saved_s']:.2f}s de similaridade evitados)"
+                )
+                timings = timing_rows(run_report)
+                st.table({"Etapa": [label for label, _ in timings],
+                          "Tempo (s)": [f"{seconds:.3f}" for _, seconds in timings]})
+                if run_report['profile']['text']:
+                    st.code(run_report['profile']['text'], language=None)
+                st.json({key: run_report[key] for key in ('config', 'counters')}, expanded=False)
+                st.download_button(
+                    "Baixar relatório (JSON)",
+                    data=json.dumps(run_report, indent=2, ensure_ascii=False, default=str),
+                    file_name="relatorio_execucao.json",
+                    mime="application/json"
+                )
+        
+        result_report = st.session_state.get('result_report')
+        if result_report:
+            with st.expander("📋 Relatório do resultado"):
+                st.code(st.session_state['result_report_text'], language=None)
+                st.download_button(
+                    "Baixar relatório do resultado (JSON)",
+                    data=json.dumps(result_report, indent=2, ensure_ascii=False, default=str),
+                    file_name="relatorio_resultado.json",
+                    mime="application/json"
+                )
         
         if st.button("🔄 Nova Análise"):
             # Clear state
-            st.session_state['results'] = None
+            discard_output()
             st.session_state['processing_complete'] = False
             # Increment key to reset file uploaders
             st.session_state['uploader_key'] += 1
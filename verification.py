@@ -0,0 +1,122 @@
+"""
+Shared template of the verify_*.py scripts (one per feature area).
+
+Fixtures: base_hcm.xlsx matched against base_rhc.xlsx, the same files,
+rows and catalogue in every script, read once per process. Each script
+is a list of checks, functions taking a Report: they write their section
+with out() and record their pass/fail conditions with check(). run_checks()
+runs them (all, or the ones named on the command line), writes the report
+and exits with 1 when a check failed.
+
+The reports (<script>.txt) hold timings and local paths of the machine that
+ran them: they are not versioned.
+"""
+
+import argparse
+import sys
+import time
+from functools import lru_cache
+
+from saneamento.batch import build_matcher_from_rows
+from saneamento.matcher import DEFAULT_THRESHOLD
+from saneamento.readers import ProductSheet
+
+BASE_FILE = 'base_hcm.xlsx'
+RHC_FILE = 'base_rhc.xlsx'
+THRESHOLD = DEFAULT_THRESHOLD
+
+
+@lru_cache(maxsize=None)
+def _rows(path):
+    return tuple(ProductSheet(path))
+
+
+def base_rows():
+    """ProductRow tuples of BASE_FILE."""
+    return list(_rows(BASE_FILE))
+
+
+def rhc_rows():
+    """ProductRow tuples of RHC_FILE."""
+    return list(_rows(RHC_FILE))
+
+
+def base_texts():
+    """PRODUTO of every BASE_FILE row."""
+    return [row.product for row in _rows(BASE_FILE)]
+
+
+@lru_cache(maxsize=None)
+def rhc_catalogue():
+    """BatchMatcher of RHC_FILE, built in memory (no disk cache involved)."""
+    return build_matcher_from_rows(_rows(RHC_FILE))
+
+
+def timed(func):
+    """(result, seconds) of func()."""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+class Report:
+    """Text report of a verify script plus the outcome of its checks."""
+
+    def __init__(self, title):
+        self.lines = [f"{'='*20} {title} {'='*20}",
+                      f"Base: {BASE_FILE} | Catálogo: {RHC_FILE} | limite: {THRESHOLD}"]
+        self.failures = []
+        self.args = None
+
+    def out(self, line=''):
+        self.lines.append(line)
+
+    def section(self, title):
+        self.out()
+        self.out("=" * 60)
+        self.out(title)
+        self.out("=" * 60)
+
+    def check(self, label, ok):
+        """Records a pass/fail condition (also written to the report); returns ok."""
+        ok = bool(ok)
+        if not ok:
+            self.failures.append(label)
+        self.out(f"[{'OK' if ok else 'FALHOU'}] {label}")
+        print(f"[{'OK' if ok else 'FALHOU'}] {label}")
+        return ok
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.lines) + '\n')
+
+
+def run_checks(name, title, checks, add_arguments=None):
+    """
+    Command line of a verify script: runs checks (all, or those named as
+    arguments), writes <name>.txt and exits with 1 when a check failed.
+    add_arguments(parser) adds the script's own options; the parsed
+    arguments are report.args.
+    """
+    by_name = {check.__name__.removeprefix('check_'): check for check in checks}
+    parser = argparse.ArgumentParser(description=title)
+    parser.add_argument('checks', nargs='*', metavar='check',
+                        help=f"checks to run: {', '.join(by_name)} (default: all)")
+    if add_arguments is not None:
+        add_arguments(parser)
+    args = parser.parse_args()
+    unknown = [check_name for check_name in args.checks if check_name not in by_name]
+    if unknown:
+        parser.error(f"unknown check: {', '.join(unknown)} (choose from {', '.join(by_name)})")
+
+    report = Report(title)
+    report.args = args
+    for check_name in args.checks or by_name:
+        print(f"--- {check_name}")
+        by_name[check_name](report)
+    report.out()
+    report.out(f"Verificações com falha: {len(report.failures)}"
+               + (f" ({', '.join(report.failures)})" if report.failures else ""))
+    report.save(f"{name}.txt")
+    print(f"{len(report.failures)} falha(s) | Relatório: {name}.txt")
+    sys.exit(1 if report.failures else 0)
@@ -0,0 +1,138 @@
+"""
+Checks of the matching HTTP API (matching_api.py), served in-process on a
+free local port with the RHC fixture as the catalogue.
+
+batch: /match of the whole base (CSV body), as NDJSON and as CSV, must
+  equal Matcher.match in-process.
+shortlist: /match with shortlist=3 for a base where code 1 has candidates
+  and code 2 has none: the CSV must have one result row (ORDEM empty) per
+  base row, in input order, each followed by its candidates; the NDJSON one
+  line per base row; both equal to Matcher.match.
+match_one: /match-one with JSON bodies: an object with a text "produto"
+  gets 200; lists, non-text products and bodies without a product get 400.
+
+Usage: python verify_api.py [check ...]
+Report goes to verify_api.txt.
+"""
+
+import csv
+import http.client
+import io
+import json
+import threading
+from contextlib import contextmanager
+
+from matching_api import MatchingService, make_server
+from saneamento.matcher import Matcher
+from saneamento.readers import ProductRow
+from verification import RHC_FILE, base_rows, rhc_catalogue, run_checks, timed
+
+SHORTLIST = 3
+SHORTLIST_BASE = [
+    ProductRow(1, 'AAS COMP 500 MG', None),
+    ProductRow(2, 'XQZW KRTVB', None),
+]
+
+
+@contextmanager
+def serving(**matcher_options):
+    """Port of a MatchingService over RHC_FILE, served in a thread while the block runs."""
+    server = make_server(MatchingService(RHC_FILE, **matcher_options), port=0, quiet=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def request(port, method, path, body=None, content_type='application/json'):
+    """(status, body text) of one request."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request(method, path, body=body, headers={'Content-Type': content_type})
+    response = connection.getresponse()
+    text = response.read().decode('utf-8-sig')
+    connection.close()
+    return response.status, text
+
+
+def csv_body(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(['CÓDIGO', 'PRODUTO'])
+    writer.writerows([row.code, row.product] for row in rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def as_text(value):
+    # Códigos como texto: o CSV da API não guarda o tipo
+    return None if value is None or value == '' else str(value)
+
+
+def check_batch(report):
+    rows = base_rows()
+    expected = [(as_text(r.code), as_text(r.rhc_code)) for r in Matcher().fit(rhc_catalogue()).match(rows)]
+    body = csv_body(rows)
+    report.section(f"/match da base inteira ({len(rows):,} linhas)")
+    with serving() as port:
+        (status, text), seconds = timed(lambda: request(port, 'POST', '/match', body, 'text/csv'))
+        got = [(as_text(r['codigo']), as_text(r['codigo_rhc'])) for r in map(json.loads, text.splitlines())]
+        report.out(f"ndjson: status {status}, {len(got):,} linhas em {seconds:.2f}s")
+        report.check("ndjson igual ao Matcher.match", status == 200 and got == expected)
+
+        (status, text), seconds = timed(lambda: request(port, 'POST', '/match?formato=csv', body, 'text/csv'))
+        got = [(as_text(r['CÓDIGO BASE']), as_text(r['CÓDIGO RHC']))
+               for r in csv.DictReader(io.StringIO(text), delimiter=';')]
+        report.out(f"csv: status {status}, {len(got):,} linhas em {seconds:.2f}s")
+        report.check("csv igual ao Matcher.match", status == 200 and got == expected)
+
+
+def check_shortlist(report):
+    expected = [(as_text(r.code), as_text(r.rhc_code), len(r.shortlist))
+                for r in Matcher(shortlist=SHORTLIST).fit(rhc_catalogue()).match(SHORTLIST_BASE)]
+    body = csv_body(SHORTLIST_BASE)
+    report.section(f"/match com shortlist={SHORTLIST}")
+    report.out("base: " + ", ".join(f"{row.code} {row.product!r}" for row in SHORTLIST_BASE))
+    report.out(f"Matcher.match (código, código RHC, candidatos): {expected}")
+    with serving(shortlist=SHORTLIST) as port:
+        status, text = request(port, 'POST', '/match?formato=csv', body, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(text), delimiter=';'))
+        results = [row for row in rows if not row['ORDEM']]
+        got = [(row['CÓDIGO BASE'], as_text(row['CÓDIGO RHC']),
+                sum(1 for c in rows if c['ORDEM'] and c['CÓDIGO BASE'] == row['CÓDIGO BASE']))
+               for row in results]
+        ordered = [row['ORDEM'] for row in rows] == [
+            o for _, _, n in expected for o in [''] + [str(k) for k in range(1, n + 1)]]
+        report.out(f"csv: status {status} | linhas de resultado: {len(results)} de {len(SHORTLIST_BASE)}")
+        report.check("csv: um resultado por linha da base, seguido dos candidatos, igual ao Matcher",
+                     status == 200 and ordered and got == expected)
+
+        status, text = request(port, 'POST', '/match', body, 'text/csv')
+        lines = [json.loads(line) for line in text.splitlines() if line]
+        got = [(as_text(r['codigo']), as_text(r['codigo_rhc']), len(r.get('candidatos', []))) for r in lines]
+        report.out(f"ndjson: status {status} | linhas: {len(lines)} de {len(SHORTLIST_BASE)}")
+        report.check("ndjson: uma linha por linha da base, igual ao Matcher", status == 200 and got == expected)
+
+
+def check_match_one(report):
+    text = SHORTLIST_BASE[0].product
+    report.section("/match-one (corpo JSON)")
+    with serving() as port:
+        for body, expected_status in [
+            ({'produto': text}, 200),
+            ({'PRODUTO': text, 'especie': 'MEDICAMENTO'}, 200),
+            ([text], 400),
+            ([{'produto': text}], 400),
+            ({'produto': [text]}, 400),
+            ({'produto': 500}, 400),
+            ({'codigo': 1}, 400),
+            ('texto', 400),
+        ]:
+            label = json.dumps(body, ensure_ascii=False)
+            status, reply = request(port, 'POST', '/match-one', label.encode('utf-8'))
+            report.out(f"{label} -> {status}: {reply[:70]}")
+            report.check(f"{label}: status {expected_status}", status == expected_status)
+
+
+if __name__ == "__main__":
+    run_checks('verify_api', "Verifying matching API", [check_batch, check_shortlist, check_match_one])
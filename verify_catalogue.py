@@ -0,0 +1,138 @@
+"""
+Checks of the RHC catalogue (saneamento.batch, saneamento.catalogue).
+
+disk: builds the catalogue of the RHC fixture from scratch in a temporary
+  cache directory, loads it back, and checks that every array is identical,
+  that matching the base gives the same (position, score) with both, and
+  that a changed workbook gets another key; build and load times.
+table: load_rhc_table on the RHC workbook, first read (Excel parsed, Feather
+  copy written) and the next ones (copy); the table must equal read_excel.
+memory: memory of the preprocessed catalogue per representation, for the
+  RHC fixture and a 10x synthetic catalogue (see benchmark.py): the legacy
+  list of preprocess_item dicts holding the full iterrows() row, the same
+  dicts without the row, and the array-backed BatchMatcher (built from a
+  generator, and from a list to show the peak the generator avoids).
+  Memory kept and peak (tracemalloc), bytes per product and pickle cost.
+  BatchMatcher must keep less memory than the legacy list.
+
+Usage: python verify_catalogue.py [check ...]
+Report goes to verify_catalogue.txt.
+"""
+
+import gc
+import os
+import pickle
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmark import synthetic_rows
+from saneamento.batch import BatchMatcher, build_matcher_from_rows
+from saneamento.catalogue import catalogue_key, load_rhc_catalogue, load_rhc_table
+from saneamento.features import preprocess_item
+from saneamento.parallel import match_texts
+from verification import RHC_FILE, THRESHOLD, base_texts, rhc_rows, run_checks, timed
+
+MEMORY_SCALES = [1, 10]
+
+
+def check_disk(report):
+    with open(RHC_FILE, 'rb') as f:
+        data = f.read()
+    texts = base_texts()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        built, build_s = timed(lambda: load_rhc_catalogue(data, cache_dir=cache_dir))
+        loaded, load_s = timed(lambda: load_rhc_catalogue(data, cache_dir=cache_dir))
+        files = os.listdir(cache_dir)
+        size = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in files)
+
+    built_arrays, loaded_arrays = built.to_arrays(), loaded.to_arrays()
+    array_diffs = [name for name in built_arrays if not np.array_equal(built_arrays[name], loaded_arrays[name])]
+    built_matches = list(match_texts(built, texts, min_score=THRESHOLD))
+    loaded_matches = list(match_texts(loaded, texts, min_score=THRESHOLD))
+    match_diffs = sum(a != b for a, b in zip(built_matches, loaded_matches))
+
+    report.section("CATÁLOGO NO DISCO")
+    report.out(f"{RHC_FILE}: {len(built)} produtos, chave {built.catalogue_key} | arquivo {size / 1024:,.0f} KB")
+    report.out(f"Construção (leitura + normalização + índice): {build_s * 1000:,.0f} ms")
+    report.out(f"Carga do disco:                               {load_s * 1000:,.0f} ms")
+    report.check("1ª chamada constrói e grava um arquivo, 2ª vem do disco",
+                 not built.from_cache and loaded.from_cache and len(files) == 1)
+    report.check(f"arrays iguais após a carga ({', '.join(array_diffs) or 'nenhum diferente'})", not array_diffs)
+    report.check(f"matching da base igual com os dois catálogos ({match_diffs} diferenças)", match_diffs == 0)
+    report.check("planilha alterada gera outra chave", catalogue_key(data + b'\0') != catalogue_key(data))
+
+
+def check_table(report):
+    expected = pd.read_excel(RHC_FILE)
+    report.section(f"load_rhc_table('{RHC_FILE}') (cópia Feather pelo hash do conteúdo)")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for run in ("1ª leitura (Excel + cópia)", "2ª leitura (cópia)", "3ª leitura (cópia)"):
+            loaded, seconds = timed(lambda: load_rhc_table(RHC_FILE, cache_dir=cache_dir))
+            report.out(f"{run:<28} {seconds:8.3f}s")
+            report.check(f"{run}: igual ao read_excel", loaded.equals(expected))
+
+
+def legacy_items(df):
+    # Cópia do preprocess_rhc_base original (iterrows, linha inteira guardada no item)
+    items = []
+    for idx, row in df.iterrows():
+        item = preprocess_item(idx, row['PRODUTO'], row)
+        item['result_code'] = row[df.columns[0]]
+        item['result_prod'] = row['PRODUTO']
+        items.append(item)
+    return items
+
+
+def plain_items(df):
+    items = []
+    for code, product in zip(df[df.columns[0]].tolist(), df['PRODUTO'].tolist()):
+        item = preprocess_item(None, product, None)
+        item['result_code'] = code
+        item['result_prod'] = product
+        items.append(item)
+    return items
+
+
+def measure(build):
+    """(object, bytes kept after the build, peak bytes during the build)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, kept - before, peak - before
+
+
+def check_memory(report):
+    for scale in MEMORY_SCALES:
+        rows = synthetic_rows(rhc_rows(), scale)
+        df = pd.DataFrame({'CÓDIGO DO PRODUTO': [r.code for r in rows], 'PRODUTO': [r.product for r in rows]})
+        n = len(df)
+        report.section(f"MEMÓRIA DO CATÁLOGO x{scale}: {n:,} produtos")
+        report.out(f"{'representação':<18} {'mantido':>10} {'pico':>10} {'bytes/produto':>14} "
+                   f"{'pickle':>10} {'dumps':>7} {'loads':>7}")
+        kept_by_label = {}
+        for label, build in [
+            ("legado", lambda: legacy_items(df)),
+            ("dicts sem a linha", lambda: plain_items(df)),
+            ("BatchMatcher", lambda: build_matcher_from_rows(rows)),
+            ("BatchMatcher/lista", lambda: BatchMatcher(plain_items(df))),
+        ]:
+            obj, kept, peak = measure(build)
+            data, dumps = timed(lambda: pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+            _, loads = timed(lambda: pickle.loads(data))
+            kept_by_label[label] = kept
+            report.out(f"{label:<18} {kept / 2**20:8.1f}MB {peak / 2**20:8.1f}MB {kept / n:14,.0f} "
+                       f"{len(data) / 2**20:8.1f}MB {dumps:6.2f}s {loads:6.2f}s")
+            del obj, data
+        ratio = kept_by_label["legado"] / kept_by_label["BatchMatcher"]
+        report.check(f"x{scale}: BatchMatcher mantém menos memória que o legado ({ratio:.1f}x)", ratio > 1)
+
+
+if __name__ == "__main__":
+    run_checks('verify_catalogue', "Verifying RHC catalogue", [check_disk, check_table, check_memory])
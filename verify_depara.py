@@ -0,0 +1,110 @@
+"""
+Checks of the exact-key de-para join (saneamento.depara).
+
+join: the base (CÓDIGO, PRODUTO) joined against the RHC fixture, as it is,
+  repeated SCALE times (a consolidated base of several units), against the
+  RHC with every row twice, and the x10 base against it three times (a dirty
+  catalogue: repeated keys). Times the previous code of the de-para scripts
+  (copy of both DataFrames + _KEY column by normalize_text per cell + merge
+  + drop) against fold_keys + exact_depara, split into key normalization
+  and join. exact_depara keeps one row per base row and must equal the
+  previous code run on the RHC without repeated keys (first item kept);
+  depara_join's repeated-key counts are reported.
+
+Usage: python verify_depara.py [check ...]
+Report goes to verify_depara.txt.
+"""
+
+import tracemalloc
+import unicodedata
+
+import pandas as pd
+
+from saneamento.depara import depara_join, exact_depara, fold_keys
+from verification import BASE_FILE, RHC_FILE, run_checks, timed
+
+SCALE = 10
+
+
+def legacy_normalize_text(text):
+    """normalize_text as the de-para scripts had it (one NFKD per cell)."""
+    if pd.isna(text):
+        return ""
+    s = str(text)
+    s = unicodedata.normalize('NFKD', s)
+    s = ''.join(ch for ch in s if not unicodedata.combining(ch))
+    return s.strip().upper()
+
+
+def legacy_keys(df_hcm, df_rhc):
+    df_hcm = df_hcm.copy()
+    df_rhc = df_rhc.copy()
+    df_hcm['_KEY'] = df_hcm['PRODUTO'].fillna('').map(legacy_normalize_text)
+    df_rhc['_KEY'] = df_rhc['PRODUTO'].fillna('').map(legacy_normalize_text)
+    return df_hcm, df_rhc
+
+
+def legacy_join(df_hcm, df_rhc):
+    df_rhc_small = df_rhc[['_KEY', 'CÓDIGO', 'PRODUTO']].rename(columns={
+        'CÓDIGO': 'CÓDIGO RHC',
+        'PRODUTO': 'PRODUTO RHC'
+    })
+    df_result = df_hcm.merge(df_rhc_small, on='_KEY', how='left')
+    return df_result.drop(columns=['_KEY'])
+
+
+def best_of(func, repeat=3):
+    """(result, best seconds) of repeat calls."""
+    runs = [timed(func) for _ in range(repeat)]
+    return runs[-1][0], min(seconds for _, seconds in runs)
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def check_join(report):
+    df_hcm = pd.read_excel(BASE_FILE)
+    df_rhc = pd.read_excel(RHC_FILE).rename(columns={'CÓDIGO DO PRODUTO': 'CÓDIGO'})
+    scaled = pd.concat([df_hcm] * SCALE, ignore_index=True)
+    bases = [
+        (BASE_FILE, df_hcm, df_rhc),
+        (f"{BASE_FILE} x{SCALE}", scaled, df_rhc),
+        (f"{RHC_FILE} x2 (chaves repetidas)", df_hcm, pd.concat([df_rhc] * 2, ignore_index=True)),
+        (f"{BASE_FILE} x{SCALE}, {RHC_FILE} x3", scaled, pd.concat([df_rhc] * 3, ignore_index=True)),
+    ]
+    for label, left, right in bases:
+        report.section(f"{label}: {len(left):,} x {len(right):,} linhas")
+        (keyed_left, keyed_right), old_keys = best_of(lambda: legacy_keys(left, right))
+        merged, old_join = best_of(lambda: legacy_join(keyed_left, keyed_right))
+        # Referência: o código anterior sobre a RHC sem chaves repetidas (fica o primeiro item)
+        expected = legacy_join(keyed_left, keyed_right.drop_duplicates('_KEY'))
+        _, new_keys = best_of(lambda: (fold_keys(left['PRODUTO']), fold_keys(right['PRODUTO'])))
+        result, new_total = best_of(lambda: exact_depara(left, right))
+        old_peak = peak_mb(lambda: legacy_join(*legacy_keys(left, right)))
+        new_peak = peak_mb(lambda: exact_depara(left, right))
+        stats = depara_join(left, right).stats
+
+        report.out(f"{'execução':<20} {'chaves':>8} {'junção':>8} {'total':>8} {'pico':>9}")
+        report.out(f"{'anterior':<20} {old_keys:7.3f}s {old_join:7.3f}s {old_keys + old_join:7.3f}s "
+                   f"{old_peak:7.1f}MB")
+        report.out(f"{'exact_depara':<20} {new_keys:7.3f}s {new_total - new_keys:7.3f}s {new_total:7.3f}s "
+                   f"{new_peak:7.1f}MB")
+        report.out(f"linhas no resultado: {len(merged):,} antes, {len(result):,} agora | com CÓDIGO RHC: "
+                   f"{int(result['CÓDIGO RHC'].notna().sum()):,}")
+        report.out(f"chaves repetidas na RHC: {stats['duplicate_keys']:,} ({stats['duplicate_rows']:,} itens a mais) "
+                   f"| linhas da base afetadas: {stats['ambiguous_rows']:,}")
+        report.check(f"{label}: uma linha por linha da base, igual ao anterior sem repetidas",
+                     len(result) == len(left) and result.equals(expected))
+    report.out()
+    report.out("chaves: normalização do PRODUTO dos dois lados; junção: merge/hash join e colunas RHC;")
+    report.out("pico: memória alocada pelo pandas/Python no pior momento (tracemalloc); melhor de 3 execuções")
+
+
+if __name__ == "__main__":
+    run_checks('verify_depara', "Verifying exact-key de-para", [check_join])
@@ -0,0 +1,220 @@
+"""
+Checks of the text pre-processing (saneamento.normalization, saneamento.features).
+
+normalization: the single-pass normalizer and the legacy str.replace loop
+  (frozen copy below) over every PRODUTO of the two fixtures. Every text
+  whose output differs must be listed in normalization_golden.tsv with both
+  outputs, so behaviour changes are explicit and reviewed (--update
+  rewrites the golden file). Micro-benchmark in normalizations per second.
+concentrations: the structured extractor (one compiled regex, (value,
+  unit[, per_value, per_unit]) tuples with canonical units) against the
+  legacy one (frozen copy below: seven re.findall calls plus string
+  replaces): texts with a concentration, samples of the fixed cases
+  (decimal comma, GRAMA/GRAMAS, unit glued to a word, 1G == 1000MG), the
+  matching with either (matches gained, lost and changed) and a
+  micro-benchmark in texts per second.
+
+Usage: python verify_features.py [normalization] [concentrations] [--update]
+Report goes to verify_features.txt.
+"""
+
+import csv
+import re
+
+import pandas as pd
+
+from saneamento.batch import BatchMatcher
+from saneamento.blocking import item_block
+from saneamento.features import extract_concentrations, preprocess_texts
+from saneamento.matcher import Matcher
+from saneamento.normalization import PHARMACEUTICAL_SYNONYMS, normalize_pharmaceutical_text
+from verification import base_rows, rhc_rows, run_checks, timed
+
+GOLDEN_FILE = 'normalization_golden.tsv'
+SAMPLES = 8
+REPEAT = 5
+
+LEGACY_PATTERNS = [
+    r'\d+\.?\d*\s*MG', r'\d+\.?\d*\s*ML', r'\d+\.?\d*\s*G',
+    r'\d+\.?\d*\s*%', r'\d+\.?\d*\s*MG/\s*\d+\.?\d*\s*ML',
+    r'\d+\.?\d*\s*MCG', r'\d+\.?\d*\s*UI',
+]
+
+# Casos corrigidos, reconhecidos no texto original
+FIXED_CASES = [
+    ("vírgula decimal (2,5MG)", re.compile(r'\d,\d+\s*(MG|ML|G|MCG|UI|%)')),
+    ("GRAMA/GRAMAS/GR", re.compile(r'\d\s*(GRAMAS?|GRS?)\b')),
+    ("unidade colada a uma palavra (10 GOTAS)", re.compile(r'\d\s*(G|ML|MG)[A-Z]')),
+    ("milhar com ponto (100.000UI)", re.compile(r'\d\.\d{3}\s*UI')),
+    ("MCG, G ou L (conversão de unidade)", re.compile(r'\d\s*(MCG|G|L)\b')),
+]
+
+
+def legacy_normalize(text):
+    """Reference: the original per-entry str.replace loop."""
+    if pd.isna(text):
+        return ""
+    text = str(text).upper().strip()
+    for old, new in PHARMACEUTICAL_SYNONYMS.items():
+        text = text.replace(old, new)
+    return ' '.join(text.split())
+
+
+def legacy_concentrations(text):
+    """Reference: the original extract_concentration + normalize_concentrations."""
+    concentrations = []
+    for pattern in LEGACY_PATTERNS:
+        concentrations.extend(re.findall(pattern, text.upper()))
+    return frozenset(
+        conc.replace(' ', '').replace('GR', 'G').replace('GRAMA', 'G').replace('GRAMAS', 'G')
+        for conc in concentrations
+    )
+
+
+def read_golden():
+    golden = {}
+    with open(GOLDEN_FILE, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            golden[row['TEXTO']] = (row['LEGADO'], row['NOVO'])
+    return golden
+
+
+def write_golden(changes):
+    with open(GOLDEN_FILE, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['TEXTO', 'LEGADO', 'NOVO'])
+        for text in sorted(changes):
+            writer.writerow([text, *changes[text]])
+
+
+def rate(func, texts):
+    """Texts per second of func over texts (REPEAT passes)."""
+    _, seconds = timed(lambda: [func(text) for _ in range(REPEAT) for text in texts])
+    return len(texts) * REPEAT / seconds
+
+
+def check_normalization(report):
+    texts = [row.product for row in rhc_rows() + base_rows()]
+    changes = {}
+    for text in texts:
+        old, new = legacy_normalize(text), normalize_pharmaceutical_text(text)
+        if old != new:
+            changes['' if pd.isna(text) else str(text)] = (old, new)
+    if report.args is not None and report.args.update:
+        write_golden(changes)
+    golden = read_golden()
+    unexpected = {t: v for t, v in changes.items() if golden.get(t) != v}
+    checked = {'' if pd.isna(t) else str(t) for t in texts}
+    missing = sorted(t for t in golden if t in checked and t not in changes)
+    legacy_rate = rate(legacy_normalize, texts)
+    new_rate = rate(normalize_pharmaceutical_text, texts)
+
+    report.section("NORMALIZAÇÃO x LEGADO")
+    report.out(f"Textos verificados: {len(texts)} | saídas diferentes do legado: {len(changes)} "
+               f"(documentadas em {GOLDEN_FILE})")
+    report.out(f"Legado (str.replace por entrada): {legacy_rate:,.0f} normalizações/s")
+    report.out(f"Passada única compilada:          {new_rate:,.0f} normalizações/s ({new_rate / legacy_rate:.2f}x)")
+    report.out()
+    report.out("Amostra de mudanças intencionais:")
+    for text in sorted(changes)[:20]:
+        old, new = changes[text]
+        report.out(f"  {text}")
+        report.out(f"    legado: {old}")
+        report.out(f"    novo:   {new}")
+    for text, (old, new) in sorted(unexpected.items()):
+        report.out(f"  não documentada: {text}")
+        report.out(f"    esperado: {golden.get(text, (old, old))[1]}")
+        report.out(f"    obtido:   {new}")
+    for text in missing:
+        report.out(f"  documentada sem divergência: {text}")
+        report.out(f"    esperado: {golden[text][1]}")
+        report.out(f"    obtido:   {golden[text][0]} (igual ao legado)")
+    report.check("toda saída diferente do legado está no golden", not unexpected)
+    report.check("toda entrada do golden ainda diverge do legado", not missing)
+
+
+def build_items(rows, legacy):
+    items = preprocess_texts(row.product for row in rows)
+    for row, item in zip(rows, items):
+        if legacy:
+            item['concs'] = legacy_concentrations(item['original'] if item['original'] is not None else '')
+        item['block'] = item_block(item, row.especie)
+        item['result_code'] = row.code
+        item['result_prod'] = row.product
+    return items
+
+
+def run_matching(rhc, base, legacy):
+    matcher = Matcher().fit(BatchMatcher(build_items(rhc, legacy)))
+    results = []
+    for query in build_items(base, legacy):
+        pos, score = matcher.catalogue.best_match(query, **matcher.options)
+        results.append(pos if pos is not None and score >= matcher.threshold else None)
+    return matcher.catalogue, results
+
+
+def format_conc(concs):
+    return ', '.join(sorted(map(str, concs))) or '-'
+
+
+def check_concentrations(report):
+    rhc, base = rhc_rows(), base_rows()
+    texts = [str(row.product) for row in rhc + base if row.product is not None]
+    uppers = [text.upper() for text in texts]
+    legacy = [legacy_concentrations(text) for text in texts]
+    current, _ = extract_concentrations(uppers)
+    _, legacy_s = timed(lambda: [legacy_concentrations(text) for _ in range(REPEAT) for text in texts])
+    _, current_s = timed(lambda: [extract_concentrations([text.upper() for text in texts]) for _ in range(REPEAT)])
+
+    catalogue, legacy_results = run_matching(rhc, base, legacy=True)
+    _, current_results = run_matching(rhc, base, legacy=False)
+    pairs = list(zip(base, legacy_results, current_results))
+    gained = [(row, new) for row, old, new in pairs if old is None and new is not None]
+    lost = [(row, old) for row, old, new in pairs if old is not None and new is None]
+    changed = [(row, old, new) for row, old, new in pairs if None not in (old, new) and old != new]
+
+    report.section("CONCENTRAÇÕES")
+    report.out(f"Textos: {len(texts)} | com concentração: legado {sum(map(bool, legacy))}, "
+               f"estruturado {sum(map(bool, current))}")
+    report.out(f"Concentrações distintas: legado {len(set().union(*legacy))} | "
+               f"estruturado {len(set().union(*current))}")
+    report.out(f"Legado (7 findall + replaces por texto): {len(texts) * REPEAT / legacy_s:,.0f} textos/s")
+    report.out(f"Regex única em coluna:                   {len(texts) * REPEAT / current_s:,.0f} textos/s "
+               f"({legacy_s / current_s:.2f}x)")
+    report.out()
+    report.out("Casos corrigidos (amostra):")
+    for label, pattern in FIXED_CASES:
+        hits = [i for i, text in enumerate(uppers) if pattern.search(text)]
+        report.out(f"{label}: {len(hits)} textos")
+        for i in hits[:SAMPLES // 2]:
+            report.out(f"  {texts[i]}")
+            report.out(f"    legado:      {format_conc(legacy[i])}")
+            report.out(f"    estruturado: {format_conc(current[i])}")
+    report.out()
+    report.out(f"Matches: legado {sum(r is not None for r in legacy_results)} | "
+               f"estruturado {sum(r is not None for r in current_results)} | ganhos {len(gained)}, "
+               f"perdidos {len(lost)}, com outro item RHC {len(changed)}")
+    for title, entries in [("Ganhos", gained), ("Perdidos", lost)]:
+        report.out(f"{title} (amostra):")
+        for row, pos in entries[:SAMPLES]:
+            report.out(f"  HCM: {row.product}")
+            report.out(f"  RHC: {catalogue.products[pos]}")
+    report.out("Com outro item RHC (amostra):")
+    for row, old, new in changed[:SAMPLES]:
+        report.out(f"  HCM:    {row.product}")
+        report.out(f"  legado: {catalogue.products[old]}")
+        report.out(f"  agora:  {catalogue.products[new]}")
+    # Um match só pode se perder quando as concentrações estruturadas dos dois lados diferem
+    lost_concs = [extract_concentrations([str(row.product).upper(), str(catalogue.products[pos]).upper()])[0]
+                  for row, pos in lost]
+    report.check("matches perdidos só onde a concentração difere",
+                 all(base_concs != item_concs for base_concs, item_concs in lost_concs))
+
+
+def add_arguments(parser):
+    parser.add_argument('--update', action='store_true', help=f"rewrite {GOLDEN_FILE} before checking")
+
+
+if __name__ == "__main__":
+    run_checks('verify_features', "Verifying text pre-processing", [check_normalization, check_concentrations],
+               add_arguments)
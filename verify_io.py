@@ -0,0 +1,253 @@
+"""
+Checks of table input and output (saneamento.readers, writers, report).
+
+readers: every bundled workbook read with ProductSheet gives the same codes
+  and products as pd.read_excel; a synthetic workbook with 100k rows and 7
+  columns (like the hospital catalogues) read both ways: time, time to the
+  first row and peak Python memory (tracemalloc).
+writers: rows written with ResultWriter in each available format read back
+  equal to the same rows written with DataFrame.to_excel; 100k synthetic
+  result rows written both ways: time and peak Python memory.
+formats: the two fixtures and the base repeated 10 times, written with
+  write_table as .xlsx, .csv, .parquet and .feather, and as a cp1252 CSV
+  without extension (Excel in Portuguese; encoding and format sniffed), then
+  read back: read_table must return the same DataFrame as the .xlsx and
+  open_products the same ProductRow tuples as ProductSheet.
+report: report_file against pandas (counts, matches, similarity) on each
+  file of report_results.py that exists, and the base matched against the
+  catalogue with a ResultReport fed in-process, which must equal
+  report_file of the written result in every format.
+
+Usage: python verify_io.py [check ...]
+Report goes to verify_io.txt.
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from report_results import DEFAULT_FILES
+from saneamento.matcher import Matcher
+from saneamento.readers import ProductSheet, open_products, read_table
+from saneamento.report import ResultReport, parse_score, report_file
+from saneamento.writers import RESULT_COLUMNS, ResultWriter, available_formats, write_table
+from verification import BASE_FILE, RHC_FILE, base_rows, rhc_catalogue, run_checks, timed
+
+BUNDLED = [RHC_FILE, BASE_FILE, 'resultado_de_para.xlsx']
+SYNTHETIC_ROWS = 100_000
+WRITE_CHECK_ROWS = 5000
+SCALE = 10
+
+
+def measure(func):
+    """(result, seconds, peak Python bytes) of func()."""
+    tracemalloc.start()
+    try:
+        result, seconds = timed(func)
+        return result, seconds, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def write_synthetic_workbook(path, n_rows):
+    products = [row.product for row in base_rows()]
+    df = pd.DataFrame({
+        'CÓDIGO': range(1, n_rows + 1),
+        'PRODUTO': [products[i % len(products)] for i in range(n_rows)],
+        'ESPÉCIE': ['2 - MATERIAL MEDICO HOSPITALAR'] * n_rows,
+        'UNIDADE': ['UN'] * n_rows,
+        'FABRICANTE': ['FABRICANTE EXEMPLO LTDA'] * n_rows,
+        'GRUPO': ['GRUPO 1'] * n_rows,
+        'OBSERVACAO': ['-'] * n_rows,
+    })
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        df.to_excel(writer, index=False)
+
+
+def first_row_pandas(path):
+    """Seconds until the first row is available with pd.read_excel, and the row count."""
+    start = time.perf_counter()
+    df = pd.read_excel(path)
+    return time.perf_counter() - start, sum(1 for _ in zip(df['CÓDIGO'], df['PRODUTO']))
+
+
+def first_row_streaming(path):
+    """Seconds until ProductSheet yields the first row, and the row count."""
+    start = time.perf_counter()
+    first, n_rows = None, 0
+    for _ in ProductSheet(path):
+        if first is None:
+            first = time.perf_counter() - start
+        n_rows += 1
+    return first, n_rows
+
+
+def check_readers(report):
+    report.section("LEITURA EM STREAMING (ProductSheet x pd.read_excel)")
+    for filename in BUNDLED:
+        df = pd.read_excel(filename)
+        sheet = ProductSheet(filename)
+        rows = list(sheet)
+        code_col, product_col = df.columns[sheet.code_col], df.columns[sheet.product_col]
+        same = ([r.code for r in rows] == df[code_col].tolist()
+                and [r.product for r in rows] == df[product_col].tolist())
+        report.check(f"{filename}: {len(rows)} linhas, colunas {code_col!r}/{product_col!r}"
+                     + (f"/{df.columns[sheet.especie_col]!r}" if sheet.has_especie else "")
+                     + " iguais ao pandas", same)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sintetico.xlsx')
+        write_synthetic_workbook(path, SYNTHETIC_ROWS)
+        report.out(f"Planilha sintética: {SYNTHETIC_ROWS:,} linhas x 7 colunas "
+                   f"({os.path.getsize(path) / 2**20:.1f} MB)")
+        for label, func in [("pd.read_excel", first_row_pandas), ("ProductSheet", first_row_streaming)]:
+            (first, n_rows), elapsed, peak = measure(lambda: func(path))
+            report.out(f"  {label:<14} total {elapsed:6.2f}s | primeira linha em {first:6.2f}s | "
+                       f"{n_rows:,} linhas | pico de memória {peak / 2**20:7.1f} MB")
+
+
+def result_rows(n_rows):
+    """Result dicts like the ones the front-ends produce (every 3rd row unmatched)."""
+    base, catalogue = base_rows(), rhc_catalogue()
+    for i in range(n_rows):
+        row = base[i % len(base)]
+        matched = i % 3
+        pos = i % len(catalogue)
+        yield {'CÓDIGO BASE': row.code, 'PRODUTO BASE': row.product,
+               'CÓDIGO RHC': catalogue.codes[pos] if matched else None,
+               'PRODUTO RHC': catalogue.products[pos] if matched else None,
+               'SIMILARIDADE': f"{(i % 100) / 100:.2%}" if matched else None}
+
+
+def write_pandas(rows, path):
+    pd.DataFrame(list(rows)).to_excel(path, index=False)
+
+
+def write_streaming(rows, path, fmt):
+    with ResultWriter(path, fmt=fmt) as writer:
+        for row in rows:
+            writer.write_row(row)
+
+
+def read_back(path, fmt):
+    if fmt == 'csv':
+        return pd.read_csv(path, sep=';', encoding='utf-8-sig')
+    if fmt in ('parquet', 'feather'):
+        df = pd.read_parquet(path) if fmt == 'parquet' else pd.read_feather(path)
+        # Parquet/Feather gravam tudo como texto; os códigos voltam a ser números para comparar
+        for column in ('CÓDIGO BASE', 'CÓDIGO RHC'):
+            df[column] = pd.to_numeric(df[column])
+        return df
+    return pd.read_excel(path)
+
+
+def check_writers(report):
+    # Linhas pré-geradas: o custo de montá-las não entra na medição
+    rows = list(result_rows(SYNTHETIC_ROWS))
+    report.section("GRAVAÇÃO EM STREAMING (ResultWriter x DataFrame.to_excel)")
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_path = os.path.join(tmp, 'pandas.xlsx')
+        write_pandas(rows[:WRITE_CHECK_ROWS], reference_path)
+        reference = pd.read_excel(reference_path)
+        for fmt in available_formats():
+            path = os.path.join(tmp, f'streaming.{fmt}')
+            write_streaming(rows[:WRITE_CHECK_ROWS], path, fmt)
+            report.check(f"{fmt}: {WRITE_CHECK_ROWS:,} linhas lidas de volta iguais ao to_excel",
+                         read_back(path, fmt).equals(reference))
+
+        report.out(f"Resultado sintético: {SYNTHETIC_ROWS:,} linhas x {len(RESULT_COLUMNS)} colunas")
+        runs = [("DataFrame + to_excel", lambda: write_pandas(rows, os.path.join(tmp, 'pandas.xlsx')))]
+        runs += [(f"ResultWriter {fmt}",
+                  lambda fmt=fmt: write_streaming(rows, os.path.join(tmp, f'streaming.{fmt}'), fmt))
+                 for fmt in available_formats()]
+        for label, func in runs:
+            _, elapsed, peak = measure(func)
+            report.out(f"  {label:<22} {elapsed:6.2f}s | pico de memória {peak / 2**20:7.1f} MB")
+
+
+def check_formats(report):
+    df_base = pd.read_excel(BASE_FILE)
+    tables = [
+        (BASE_FILE, df_base),
+        (RHC_FILE, pd.read_excel(RHC_FILE)),
+        (f"{BASE_FILE} x{SCALE}", pd.concat([df_base] * SCALE, ignore_index=True)),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, df in tables:
+            report.section(f"FORMATOS: {label} ({len(df):,} linhas x {len(df.columns)} colunas)")
+            report.out(f"{'formato':<8} {'gravação':>9} {'leitura':>9} {'tamanho':>9}")
+            reference_df = reference_rows = None
+            for fmt in ['xlsx', 'csv', 'cp1252', 'parquet', 'feather']:
+                if fmt == 'cp1252':
+                    # Sem extensão: formato e codificação vêm do conteúdo
+                    path = os.path.join(tmp, "tabela_cp1252")
+                    _, write_s = timed(lambda: df.to_csv(path, sep=';', index=False, encoding='cp1252'))
+                else:
+                    path = os.path.join(tmp, f"tabela.{fmt}")
+                    _, write_s = timed(lambda: write_table(df, path))
+                read_df, read_s = timed(lambda: read_table(path))
+                rows = list(open_products(path))
+                if fmt == 'xlsx':
+                    reference_df, reference_rows = read_df, list(ProductSheet(path))
+                report.out(f"{fmt:<8} {write_s:8.3f}s {read_s:8.3f}s {os.path.getsize(path) / 2**10:7.0f}KB")
+                report.check(f"{label} {fmt}: read_table e open_products iguais ao .xlsx",
+                             read_df.equals(reference_df) and rows == reference_rows)
+
+
+def pandas_way(path):
+    """What the former verify/inspect scripts computed, on the whole DataFrame."""
+    df = pd.read_excel(path)
+    counts = df.replace('', None).count()
+    match_column = next((c for c in ('CÓDIGO RHC', 'CÓDIGO HCM') if c in df.columns), None)
+    matches = int(df[match_column].notna().sum()) if match_column else None
+    scores = df['SIMILARIDADE'].dropna().map(parse_score) if 'SIMILARIDADE' in df.columns else None
+    return df, counts, matches, scores
+
+
+def without_source(report_dict):
+    return {key: value for key, value in report_dict.items() if key != 'source'}
+
+
+def check_report(report):
+    report.section("RELATÓRIO EM UMA PASSADA: report_file x pandas")
+    for path in DEFAULT_FILES:
+        if not os.path.exists(path):
+            continue
+        (df, counts, matches, scores), pandas_s = timed(lambda: pandas_way(path))
+        summary, single_s = timed(lambda: report_file(path).to_dict())
+        same = summary['rows'] == len(df) and summary['non_null'] == {
+            str(name): int(n) for name, n in counts.items()} and summary['matches'] == matches
+        if scores is None:
+            same &= summary['score'] is None
+        else:
+            score = summary['score']
+            same &= (score['rows'] == len(scores)
+                     and sum(b['rows'] for b in score['histogram']) == len(scores)
+                     and abs(score['mean'] - scores.mean()) < 1e-9
+                     and score['min'] == scores.min() and score['max'] == scores.max())
+        report.out(f"{path}: {len(df):,} linhas | pandas {pandas_s:.2f}s | 1 passada {single_s:.2f}s")
+        report.check(f"{path}: contagens, matches e similaridade iguais ao pandas", same)
+
+    report.section("RELATÓRIO NA EXECUÇÃO x report_file DO ARQUIVO GRAVADO")
+    results = list(Matcher().fit(rhc_catalogue()).match(base_rows()))
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in available_formats():
+            path = os.path.join(tmp, f"resultado.{fmt}")
+            in_process = ResultReport(RESULT_COLUMNS, source=path)
+            with ResultWriter(path) as writer:
+                for result in results:
+                    row = result.as_row()
+                    writer.write_row(row)
+                    in_process.add(row)
+            from_file, reread_s = timed(lambda: report_file(path))
+            report.out(f"{fmt}: reler {reread_s:.2f}s | matches {in_process.matches:,} de {in_process.rows:,}")
+            report.check(f"{fmt}: relatório na execução igual ao report_file",
+                         without_source(in_process.to_dict()) == without_source(from_file.to_dict()))
+
+
+if __name__ == "__main__":
+    run_checks('verify_io', "Verifying table input and output",
+               [check_readers, check_writers, check_formats, check_report])
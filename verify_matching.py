@@ -0,0 +1,296 @@
+"""
+Checks of the matching engine (saneamento.batch, parallel, blocking, matcher).
+
+candidates: recall of the candidate-generation limits (DF ceiling, top-N by
+  IDF) against the exhaustive candidate set: mean candidate set size, share
+  of exhaustive best matches still among the candidates, and match decisions
+  kept, lost, changed or gained. The defaults (DEFAULT_MAX_DF,
+  DEFAULT_MAX_CANDIDATES) must keep every decision.
+similarity: each backend of saneamento.similarity in exact mode
+  (min_score=0) and threshold mode: time, candidate pairs, pairs pruned by
+  the upper bound and decisions differing from 'ratio'. The pruning must not
+  change any decision of a backend.
+blocking: the block inferred from the text of every HCM product of
+  resultado_de_para.xlsx (the fixture with an ESPÉCIE column) against the
+  block of its ESPÉCIE HCM, and those products matched without and with
+  blocking (pairs discarded, fallbacks, cross-category matches).
+memo: the base as it is and consolidated from 3 units (every product again
+  under another code, re-typed), matched with the query memo off and on
+  (serial and 2 processes); results must equal the run without memo.
+shortlist: the first shortlist entry is best_match()'s result whenever it
+  reaches the threshold, the bounded-heap shortlist equals the first k of
+  the full ranking, and the cost of one pass per k.
+tiers: the base as it is and with every catalogue product re-typed by
+  another unit, fuzzy-only against the exact-key tier first (serial, 2
+  processes, and twice with a ResultStore). A different RHC code is only
+  allowed where the fuzzy engine scored another item 100% too (the score is
+  capped at 1.0 and ties go to the lowest position): the exact tier then
+  picks the item with the same name.
+
+Usage: python verify_matching.py [check ...]
+Report goes to verify_matching.txt.
+"""
+
+import os
+import random
+import tempfile
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from saneamento.batch import DEFAULT_MAX_CANDIDATES, DEFAULT_MAX_DF
+from saneamento.blocking import BLOCKS, block_id, especie_block, infer_block, item_block
+from saneamento.features import preprocess_item, preprocess_texts
+from saneamento.matcher import DEFAULT_SHORTLIST_MIN_SCORE, Matcher
+from saneamento.parallel import match_texts
+from saneamento.readers import ProductRow
+from saneamento.similarity import SIMILARITY_BACKENDS, SIMILARITY_LABELS
+from saneamento.store import ResultStore
+from verification import THRESHOLD, base_rows, base_texts, rhc_catalogue, rhc_rows, run_checks, timed
+
+DEPARA_FILE = 'resultado_de_para.xlsx'
+SEED = 7
+UNITS = 3
+K_VALUES = [3, 5, 10]
+
+CANDIDATE_CONFIGS = [
+    (None, None),
+    (DEFAULT_MAX_DF, DEFAULT_MAX_CANDIDATES),
+    (DEFAULT_MAX_DF, None),
+    (0.05, None),
+    (None, DEFAULT_MAX_CANDIDATES),
+    (None, 100),
+    (None, 50),
+    (0.05, 50),
+]
+
+
+def decisions(results):
+    return [pos if pos is not None and score >= THRESHOLD else None for pos, score in results]
+
+
+def check_candidates(report):
+    matcher = rhc_catalogue()
+    texts = base_texts()
+    queries = [preprocess_item(None, text, None) for text in texts]
+    reference = decisions(match_texts(matcher, texts, min_score=THRESHOLD))
+    n_reference = sum(pos is not None for pos in reference)
+    doc_freq = matcher.doc_freq
+    tokens = sorted(matcher.vocab, key=matcher.vocab.get)
+    common = np.argsort(-doc_freq, kind='stable')[:10]
+
+    report.section("GERAÇÃO DE CANDIDATOS")
+    report.out(f"Consultas: {len(texts)} | Matches exaustivos >= {THRESHOLD}: {n_reference}")
+    report.out("Tokens mais frequentes (DF): " + ", ".join(f"{tokens[t]}={doc_freq[t]}" for t in common))
+    report.out(f"{'max_df':>7} {'max_cand':>8} {'cand/consulta':>13} {'recall melhor':>13} "
+               f"{'mantidos':>8} {'perdidos':>8} {'trocados':>8} {'novos':>6} {'tempo':>7}")
+    for max_df, max_candidates in CANDIDATE_CONFIGS:
+        candidates = [matcher.candidates(q, max_df=max_df, max_candidates=max_candidates) for q in queries]
+        hits = sum(bool(np.isin(ref, cands)) for cands, ref in zip(candidates, reference) if ref is not None)
+        got, elapsed = timed(lambda: decisions(match_texts(matcher, texts, min_score=THRESHOLD, max_df=max_df,
+                                                           max_candidates=max_candidates)))
+        kept = sum(r is not None and r == g for r, g in zip(reference, got))
+        lost = sum(r is not None and g is None for r, g in zip(reference, got))
+        changed = sum(r is not None and g is not None and r != g for r, g in zip(reference, got))
+        gained = sum(r is None and g is not None for r, g in zip(reference, got))
+        report.out(f"{str(max_df):>7} {str(max_candidates):>8} {np.mean([len(c) for c in candidates]):>13.1f} "
+                   f"{hits / max(n_reference, 1):>13.2%} {kept:>8} {lost:>8} {changed:>8} {gained:>6} "
+                   f"{elapsed:>6.2f}s")
+        if (max_df, max_candidates) == (DEFAULT_MAX_DF, DEFAULT_MAX_CANDIDATES):
+            default_same = got == reference
+    report.check("limites padrão mantêm todas as decisões da busca exaustiva", default_same)
+
+
+def check_similarity(report):
+    matcher = rhc_catalogue()
+    texts = base_texts()
+    report.section("BACKENDS DE SIMILARIDADE")
+    report.out(f"{'backend':<34} {'min_score':>9} {'tempo':>7} {'pares':>9} {'comparados':>10} {'podados':>8} "
+               f"{'matches':>8} {'!= ratio':>8}")
+    reference = None
+    for name in SIMILARITY_BACKENDS:
+        by_mode = {}
+        for min_score in (0, THRESHOLD):
+            stats = Counter()
+            results, elapsed = timed(lambda: list(match_texts(matcher, texts, min_score=min_score,
+                                                              similarity=name, stats=stats)))
+            matched = by_mode[min_score] = decisions(results)
+            if reference is None:
+                reference = matched
+            report.out(f"{SIMILARITY_LABELS[name]:<34} {min_score:>9} {elapsed:6.2f}s {stats['candidates']:>9,} "
+                       f"{stats['scored']:>10,} {stats['pruned'] / max(stats['candidates'], 1):>8.1%} "
+                       f"{sum(pos is not None for pos in matched):>8} "
+                       f"{sum(a != b for a, b in zip(reference, matched)):>8}")
+        report.check(f"{name}: poda pelo limite superior não muda decisões", by_mode[0] == by_mode[THRESHOLD])
+
+
+def check_blocking(report):
+    df = pd.read_excel(DEPARA_FILE).drop_duplicates('CÓDIGO HCM')
+    texts = df['PRODUTO HCM'].tolist()
+    especies = df['ESPÉCIE HCM'].tolist()
+    matcher = rhc_catalogue()
+
+    inference = Counter((especie_block(especie), infer_block(preprocess_item(None, text, None)))
+                        for text, especie in zip(texts, especies))
+    classified = sum(n for (_, inferred), n in inference.items() if inferred is not None)
+    wrong = sum(n for (true, inferred), n in inference.items()
+                if inferred is not None and true in ('MEDICAMENTO', 'MATERIAL') and true != inferred)
+
+    report.section(f"BLOCAGEM ({DEPARA_FILE}: {len(texts)} produtos HCM com ESPÉCIE)")
+    report.out("Blocos do catálogo RHC: " + ", ".join(
+        f"{block}={int((matcher.block_ids == block_id(block)).sum())}" for block in BLOCKS
+    ) + f", indefinido={int((matcher.block_ids < 0).sum())}")
+    report.out("Inferência pelo texto x ESPÉCIE HCM:")
+    for (true, inferred), n in sorted(inference.items(), key=lambda kv: -kv[1]):
+        report.out(f"  ESPÉCIE {str(true):<12} inferido {str(inferred):<12} {n:>6}")
+    report.out(f"Classificados: {classified} | medicamento x material trocados: {wrong}")
+
+    results = {}
+    for label, options in [("sem blocagem", {}), ("com blocagem", {'blocking': True})]:
+        stats = Counter()
+        matches, elapsed = timed(lambda: list(match_texts(matcher, texts, min_score=THRESHOLD, stats=stats,
+                                                          especies=especies, **options)))
+        results[label] = matches
+        cross = n_matches = 0
+        for (pos, score), especie in zip(matches, especies):
+            if pos is None or score < THRESHOLD:
+                continue
+            n_matches += 1
+            query_block, matched_block = block_id(especie_block(especie)), int(matcher.block_ids[pos])
+            cross += query_block >= 0 and matched_block >= 0 and query_block != matched_block
+        report.out(f"{label}: {elapsed:.2f}s | pares {stats['candidates']:,} | descartados por categoria "
+                   f"{stats['blocked']:,} | fallback global {stats['block_fallback']:,} | matches {n_matches} | "
+                   f"entre categorias {cross}")
+        if options:
+            report.check("com blocagem nenhum match entre categorias diferentes", cross == 0)
+    report.out(f"Resultados diferentes entre os dois modos: {sum(a != b for a, b in zip(*results.values()))}")
+
+
+def retyped(text, rng):
+    """The same product as another unit would type it (normalizes to the same key)."""
+    text = str(text)
+    op = rng.randrange(3)
+    if op == 0:
+        return text.lower()
+    if op == 1:
+        return f"  {'  '.join(text.split())} "
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+
+
+def consolidated_rows(rows, units, seed=SEED):
+    """rows plus units - 1 re-typed copies under other codes, like one registration per unit."""
+    rng = random.Random(seed)
+    out = list(rows)
+    for unit in range(1, units):
+        for row in rows:
+            code = row.code + unit * 10_000_000 if isinstance(row.code, int) else f"{row.code}-{unit}"
+            out.append(ProductRow(code, retyped(row.product, rng), row.especie))
+    return out
+
+
+def with_catalogue_names(rows, seed=SEED):
+    """rows plus every catalogue product re-typed, like a base registered by the catalogue names."""
+    rng = random.Random(seed)
+    catalogue_rows = [row for row in rhc_rows() if row.product is not None]
+    return list(rows) + [ProductRow(f"RHC-{i}", retyped(row.product, rng), row.especie)
+                         for i, row in enumerate(catalogue_rows)]
+
+
+def matched_run(rows, store_path=None, **options):
+    """(results, seconds, stats) of a Matcher run over rows, optionally with a ResultStore."""
+    matcher = Matcher(**options).fit(rhc_catalogue())
+    stats = Counter()
+    if store_path is None:
+        results, elapsed = timed(lambda: list(matcher.match(rows, stats=stats)))
+    else:
+        with ResultStore(store_path) as store:
+            results, elapsed = timed(lambda: list(matcher.match(rows, stats=stats, store=store)))
+    return results, elapsed, stats
+
+
+def check_memo(report):
+    report.section("MEMÓRIA DE CONSULTAS")
+    report.out(f"{'base':<26} {'execução':<22} {'tempo':>7} {'consultas':>10} {'repetidas':>10} {'poupado':>8} "
+               f"{'diferenças':>11}")
+    rows = base_rows()
+    for label, base in [("base", rows), (f"base x{UNITS} unidades", consolidated_rows(rows, UNITS))]:
+        reference = None
+        for run, options in [("sem memória", {'memo_size': 0}), ("com memória", {}),
+                             ("com memória, 2 proc.", {'workers': 2})]:
+            results, elapsed, stats = matched_run(base, **options)
+            reference = reference or results
+            differences = sum(a != b for a, b in zip(results, reference)) + abs(len(results) - len(reference))
+            report.out(f"{label:<26} {run:<22} {elapsed:6.2f}s {stats['queries']:>10,} {stats['memo_hits']:>10,} "
+                       f"{stats['memo_saved_s']:7.2f}s {differences:>11}")
+            if results is not reference:
+                report.check(f"{label}, {run}: mesmos resultados que sem memória", differences == 0)
+
+
+def check_shortlist(report):
+    matcher = Matcher().fit(rhc_catalogue())
+    catalogue, options = matcher.catalogue, matcher.options
+    shortlist_options = {**options, 'min_score': DEFAULT_SHORTLIST_MIN_SCORE}
+    rows = base_rows()
+    queries = preprocess_texts(row.product for row in rows)
+    for row, query in zip(rows, queries):
+        query['block'] = item_block(query, row.especie)
+
+    stats = Counter()
+    best, best_s = timed(lambda: [catalogue.best_match(query, stats=stats, **options) for query in queries])
+    full = [catalogue.best_matches(query, len(catalogue), **shortlist_options) for query in queries]
+    report.section(f"LISTA DE REVISÃO (score mínimo {DEFAULT_SHORTLIST_MIN_SCORE})")
+    report.out(f"{'modo':<12} {'tempo':>8} {'similaridades':>14} {'linhas':>8} {'1º != best_match':>17} "
+               f"{'!= ranking':>11}")
+    report.out(f"{'best_match':<12} {best_s:7.2f}s {stats['scored']:>14,} {len(queries):>8,}")
+    for k in K_VALUES:
+        stats = Counter()
+        shortlists, elapsed = timed(lambda: [catalogue.best_matches(query, k, stats=stats, **shortlist_options)
+                                             for query in queries])
+        first_differs = sum(
+            1 for (pos, score), shortlist in zip(best, shortlists)
+            if pos is not None and score >= matcher.threshold
+            and (not shortlist or (shortlist[0].position, shortlist[0].score) != (pos, score))
+        )
+        ranking_differs = sum(shortlist != ranking[:k] for shortlist, ranking in zip(shortlists, full))
+        report.out(f"{f'top-{k}':<12} {elapsed:7.2f}s {stats['scored']:>14,} {sum(map(len, shortlists)):>8,} "
+                   f"{first_differs:>17} {ranking_differs:>11}")
+        report.check(f"top-{k}: 1º candidato = best_match e lista = início do ranking completo",
+                     first_differs == ranking_differs == 0)
+    report.out(f"Produtos com mais de um candidato: {sum(len(ranking) > 1 for ranking in full)}")
+
+
+def check_tiers(report):
+    report.section("CHAVE EXATA + SIMILARIDADE")
+    report.out(f"{'base':<28} {'execução':<22} {'tempo':>7} {'exatas':>7} {'similaridade':>13} {'matches':>8} "
+               f"{'diferenças':>11} {'empates':>8}")
+    rows = base_rows()
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, base in [("base", rows), ("base + nomes do catálogo", with_catalogue_names(rows))]:
+            store_path = os.path.join(tmp, f"{len(base)}.sqlite")
+            reference = None
+            for run, path, options in [
+                ("só similaridade", None, {}),
+                ("chave exata", None, {'exact_first': True}),
+                ("idem, 2 proc.", None, {'exact_first': True, 'workers': 2}),
+                ("idem, banco (1ª vez)", store_path, {'exact_first': True}),
+                ("idem, banco (2ª vez)", store_path, {'exact_first': True}),
+            ]:
+                results, elapsed, stats = matched_run(base, path, **options)
+                reference = reference or results
+                differences = sum(a.rhc_code != b.rhc_code for a, b in zip(results, reference)) + \
+                    abs(len(results) - len(reference))
+                ties = sum(a.rhc_code != b.rhc_code and a.tier == 'exact' and b.score == 1.0
+                           for a, b in zip(results, reference))
+                report.out(f"{label:<28} {run:<22} {elapsed:6.2f}s {stats['exact_hits']:>7,} {stats['scored']:>13,} "
+                           f"{sum(result.matched for result in results):>8,} {differences:>11} {ties:>8}")
+                if results is not reference:
+                    report.check(f"{label}, {run}: só difere nos empates de 100%", differences == ties)
+    report.out("diferenças: CÓDIGO RHC diferente da execução só por similaridade; empates: a similaridade")
+    report.out("dava 100% a outro item e a chave exata escolheu o de mesmo nome")
+
+
+if __name__ == "__main__":
+    run_checks('verify_matching', "Verifying matching engine",
+               [check_candidates, check_similarity, check_blocking, check_memo, check_shortlist, check_tiers])
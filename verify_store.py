@@ -0,0 +1,116 @@
+"""
+Checks of the incremental re-matching (saneamento/store.py).
+
+incremental: the base repeated BASE_SCALE times with perturbed copies
+  (~10k rows, see benchmark.py) against the RHC fixture, through one fresh
+  result store: first run (everything scored), the same base and catalogue
+  again, the base with 50 edited rows, and the catalogue with 10 items
+  removed and 10 added. Each run is timed, its store counters reported, and
+  its results must equal a full re-match without the store.
+shared: two threads writing to the same store file at once (like two
+  Streamlit jobs with result reuse on) must both finish, and every result
+  must come back from the store on the next run.
+
+Usage: python verify_store.py [check ...]
+Report goes to verify_store.txt.
+"""
+
+import os
+import random
+import tempfile
+import threading
+from collections import Counter
+
+from benchmark import perturb, synthetic_rows
+from saneamento.batch import build_matcher_from_rows
+from saneamento.matcher import Matcher
+from saneamento.readers import ProductRow
+from saneamento.store import ResultStore
+from verification import base_rows, rhc_catalogue, rhc_rows, run_checks, timed
+
+BASE_SCALE = 3
+EDITED_ROWS = 50
+CATALOGUE_CHANGES = 10
+SEED = 7
+
+
+def matched_run(matcher, rows, store=None):
+    """(results, seconds, stats) of matcher over rows, optionally with a ResultStore."""
+    stats = Counter()
+    results, elapsed = timed(lambda: list(matcher.match(rows, stats=stats, store=store)))
+    return results, elapsed, stats
+
+
+def check_incremental(report):
+    rng = random.Random(SEED)
+    rhc = rhc_rows()
+    rows = synthetic_rows(base_rows(), BASE_SCALE)
+
+    edited_rows = list(rows)
+    for i in rng.sample(range(len(edited_rows)), EDITED_ROWS):
+        row = edited_rows[i]
+        edited_rows[i] = ProductRow(row.code, perturb(row.product, rng), row.especie)
+
+    changed_rhc = list(rhc)
+    for i in sorted(rng.sample(range(len(changed_rhc)), CATALOGUE_CHANGES), reverse=True):
+        del changed_rhc[i]
+    for i, row in enumerate(rng.sample(rhc, CATALOGUE_CHANGES)):
+        changed_rhc.append(ProductRow(f"NOVO-{i}", perturb(row.product, rng), row.especie))
+
+    catalogue = rhc_catalogue()
+    new_catalogue = build_matcher_from_rows(changed_rhc)
+    scenarios = [
+        ("1ª execução", catalogue, rows),
+        ("mesma base e catálogo", catalogue, rows),
+        (f"{EDITED_ROWS} linhas editadas", catalogue, edited_rows),
+        (f"catálogo -{CATALOGUE_CHANGES} +{CATALOGUE_CHANGES} itens", new_catalogue, edited_rows),
+    ]
+
+    report.section(f"RE-MATCHING INCREMENTAL ({len(rows):,} linhas, base x{BASE_SCALE})")
+    report.out(f"{'execução':<26} {'tempo':>7} {'completo':>9} {'guardados':>10} {'reaproveit.':>12} "
+               f"{'pontuados':>10} {'diferenças':>11}")
+    with tempfile.TemporaryDirectory() as tmp, ResultStore(os.path.join(tmp, 'resultados.sqlite')) as store:
+        for label, scenario_catalogue, scenario_rows in scenarios:
+            matcher = Matcher().fit(scenario_catalogue)
+            results, elapsed, stats = matched_run(matcher, scenario_rows, store)
+            full, full_elapsed, _ = matched_run(matcher, scenario_rows)
+            differences = sum(a != b for a, b in zip(results, full)) + abs(len(results) - len(full))
+            report.out(f"{label:<26} {elapsed:6.2f}s {full_elapsed:8.2f}s {stats['store_hits']:>10,} "
+                       f"{stats['store_reused']:>12,} {stats['store_scored']:>10,} {differences:>11}")
+            report.check(f"{label}: igual ao re-match completo", differences == 0)
+        report.out(f"Banco: {os.path.getsize(store.path) / 2**20:.1f} MB")
+    report.out("completo: re-match sem o banco; guardados: mesma versão do catálogo;")
+    report.out("reaproveit.: versão anterior do catálogo, sem token em comum com os itens alterados")
+
+
+def check_shared(report):
+    rows = base_rows()
+    matcher = Matcher().fit(rhc_catalogue())
+    half = len(rows) // 2
+    errors = []
+
+    def job(part):
+        try:
+            with ResultStore(path) as store:
+                matched_run(matcher, part, store)
+        except Exception as e:
+            errors.append(e)
+
+    report.section("BANCO COMPARTILHADO (2 threads gravando ao mesmo tempo)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'resultados.sqlite')
+        threads = [threading.Thread(target=job, args=(part,)) for part in (rows[:half], rows[half:])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with ResultStore(path) as store:
+            _, elapsed, stats = matched_run(matcher, rows, store)
+    report.out(f"Erros: {[str(e) for e in errors] or 'nenhum'} | nova execução: {elapsed:.2f}s, "
+               f"{stats['store_hits']:,} guardados, {stats['store_scored']:,} pontuados")
+    report.check("as duas gravações terminam sem erro", not errors)
+    report.check("todas as linhas voltam do banco na execução seguinte", stats['store_scored'] == 0)
+
+
+if __name__ == "__main__":
+    run_checks('verify_store', "Verifying result store", [check_incremental, check_shared])